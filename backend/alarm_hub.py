@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from fastapi import WebSocket, WebSocketDisconnect
+import asyncpg
+from alarm_index import describe
+from db_config import connection_kwargs
+from metrics import ws_open, ws_messages, ws_send_lag
+
+# Riasztás esemény csatorna. Egyetlen követő fut, amíg van feliratkozó: a memóriában tartott
+# aktív riasztás halmazt (plant → (register, bit) → kezdet) a logger_alarm_log id watermark
+# utáni soraiból frissíti. Az ingest NOTIFY alarm_events jelzésére azonnal olvas; külső író
+# esetén ALARM_POLL_INTERVAL másodpercenként. A BIGSERIAL id-t a beszúrás kapja, a commit később
+# jöhet, így egy kisebb id a nagyobb után is láthatóvá válhat: a watermark alatti utolsó
+# ALARM_RESCAN_IDS id-t minden körben újra átnézzük, a már feldolgozottakat kihagyva.
+# A kliens csatlakozáskor plantonként pillanatképet kap, utána csak raised / cleared eseményeket.
+ALARM_POLL_INTERVAL = float(os.getenv("ALARM_POLL_INTERVAL", "2.0"))
+NOTIFY_CHANNEL = "alarm_events"
+SUBSCRIBER_QUEUE_SIZE = 64
+ALARM_RESCAN_IDS = int(os.getenv("ALARM_RESCAN_IDS", "1000"))
+
+db_pool = None
+
+
+def set_db_pool(pool):
+    global db_pool
+    db_pool = pool
+
+
+def _alarm_item(plant_id: int, register: int, bit: int, since):
+    return {
+        "plant_id": plant_id,
+        "register": register,
+        "bit": bit,
+        "since": since.isoformat() if since else None,
+        **describe(register, bit),
+    }
+
+
+class _Subscriber:
+    def __init__(self, plant_ids):
+        self.plant_ids = set(plant_ids)
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.resync = False
+
+    def offer(self, message):
+        # Lassú kliens: a sor eldobva, a küldő friss pillanatképekkel kezd újra
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+        self.queue.put_nowait((time.perf_counter(), message))
+
+
+class AlarmHub:
+    def __init__(self):
+        self.active = {}
+        self.last_id = None
+        self.seen = set()
+        self.key_ids = {}
+        self.subscribers = set()
+        self.ready = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.listener = None
+
+    # --- Állapot ---------------------------------------------------------------------------
+
+    async def _load_state(self, conn):
+        # Előbb a watermark, utána a státusz: a kettő közé eső események újra lejátszva idempotensek
+        self.last_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM logger_alarm_log")
+        # A már látható ablakbeli sorok benne vannak a státuszban; csak a később commitolók jönnek
+        self.seen = set(await conn.fetchval("""
+            SELECT COALESCE(array_agg(id), '{}') FROM logger_alarm_log WHERE id > $1 AND id <= $2
+        """, self.last_id - ALARM_RESCAN_IDS, self.last_id))
+        self.key_ids = {}
+        rows = await conn.fetch("""
+            SELECT plant_id, register, bit, last_updated
+            FROM logger_alarm_status
+            WHERE is_active = TRUE
+        """)
+        self.active = {}
+        for row in rows:
+            self.active.setdefault(row["plant_id"], {})[(row["register"], row["bit"])] = row["last_updated"]
+
+    async def _load_events(self, conn):
+        low = self.last_id - ALARM_RESCAN_IDS
+        self.seen = {i for i in self.seen if i > low}
+        rows = await conn.fetch("""
+            SELECT id, plant_id, register, bit, event_type, timestamp
+            FROM logger_alarm_log
+            WHERE id > $1 AND id <> ALL($2::bigint[])
+            ORDER BY id
+            LIMIT 5000
+        """, low, list(self.seen))
+        events = []
+        for row in rows:
+            self.seen.add(row["id"])
+            self.last_id = max(self.last_id, row["id"])
+            key = (row["register"], row["bit"])
+            # Késve commitolt sor, amelynél ugyanarra a kulcsra már újabb eseményt feldolgoztunk
+            latest_id = self.key_ids.get((row["plant_id"], *key), 0)
+            if row["id"] < latest_id:
+                continue
+            self.key_ids[(row["plant_id"], *key)] = row["id"]
+            plant_alarms = self.active.setdefault(row["plant_id"], {})
+            if row["event_type"] == "ended":
+                if key not in plant_alarms:
+                    continue
+                since = plant_alarms.pop(key)
+                event_type = "cleared"
+            else:
+                if key in plant_alarms:
+                    continue
+                since = plant_alarms[key] = row["timestamp"]
+                event_type = "raised"
+            events.append({
+                "type": event_type,
+                "id": row["id"],
+                "timestamp": row["timestamp"].isoformat(),
+                **_alarm_item(row["plant_id"], row["register"], row["bit"], since),
+            })
+        return events, len(rows)
+
+    def snapshot(self, plant_id: int) -> dict:
+        alarms = [
+            _alarm_item(plant_id, register, bit, since)
+            for (register, bit), since in sorted(self.active.get(plant_id, {}).items())
+        ]
+        return {
+            "type": "snapshot",
+            "plant_id": plant_id,
+            "alarms": alarms,
+            "summary": dict(Counter(a["severity"] for a in alarms)),
+        }
+
+    # --- Követés ---------------------------------------------------------------------------
+
+    def _on_notify(self, *args):
+        self.wakeup.set()
+
+    async def _listen(self):
+        # Saját kapcsolat a LISTEN-hez; ha nem sikerül, marad az időzített olvasás
+        try:
+            self.listener = await asyncpg.connect(**connection_kwargs())
+            await self.listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        except Exception as e:
+            print("Riasztás LISTEN nem elérhető, időzített olvasás:", e)
+            self.listener = None
+
+    async def _close_listener(self):
+        if self.listener is not None:
+            try:
+                await self.listener.close()
+            except Exception:
+                pass
+            self.listener = None
+
+    async def run(self):
+        await self._listen()
+        try:
+            while self.subscribers:
+                try:
+                    async with db_pool.acquire() as conn:
+                        if not self.ready.is_set():
+                            await self._load_state(conn)
+                            self.ready.set()
+                        # Nagy lemaradásnál több kör, amíg utol nem érjük a naplót
+                        while True:
+                            events, fetched = await self._load_events(conn)
+                            for event in events:
+                                for subscriber in list(self.subscribers):
+                                    if event["plant_id"] in subscriber.plant_ids:
+                                        subscriber.offer(event)
+                            if fetched < 5000:
+                                break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print("Riasztás követő hiba:", e)
+
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), ALARM_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self._close_listener()
+
+    def _subscribe(self, subscriber: _Subscriber):
+        self.subscribers.add(subscriber)
+        if self.task is None or self.task.done():
+            # Újrainduláskor az állapot is újraépül, a közben kimaradt naplóból nem játszunk vissza
+            self.ready = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+
+    def _unsubscribe(self, subscriber: _Subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.subscribers.clear()
+
+    # --- Kliensek --------------------------------------------------------------------------
+
+    def _snapshots(self, subscriber: _Subscriber):
+        # A sorban álló események már benne vannak az aktív halmazban: eldobjuk, és egyszerre
+        # képezzük az összes pillanatképet, hogy ne keveredjenek a később érkezőkkel
+        subscriber.resync = False
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        return [self.snapshot(plant_id) for plant_id in sorted(subscriber.plant_ids)]
+
+    async def _messages(self, subscriber: _Subscriber):
+        # Feliratkozáskor és lemaradás után pillanatkép, egyébként a sorban álló események
+        await self.ready.wait()
+        for message in self._snapshots(subscriber):
+            yield message, None
+        while True:
+            enqueued_at, message = await subscriber.queue.get()
+            if subscriber.resync:
+                for message in self._snapshots(subscriber):
+                    yield message, None
+                continue
+            yield message, enqueued_at
+
+    async def _send_loop(self, websocket: WebSocket, subscriber: _Subscriber):
+        async for message, enqueued_at in self._messages(subscriber):
+            await websocket.send_json(message)
+            ws_messages.inc("alarms")
+            if enqueued_at is not None:
+                ws_send_lag.observe("alarms", value=time.perf_counter() - enqueued_at)
+
+    async def _receive_loop(self, websocket: WebSocket, subscriber: _Subscriber, visible: set):
+        # {"action": "subscribe" | "unsubscribe", "plant_ids": [...]}
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            try:
+                request = json.loads(message.get("text") or "{}")
+                plant_ids = {int(pid) for pid in request.get("plant_ids", [])}
+                action = request.get("action")
+            except (ValueError, TypeError, AttributeError):
+                await websocket.send_json({"type": "error", "detail": "Invalid message."})
+                continue
+
+            if action == "subscribe":
+                denied = plant_ids - visible
+                if denied:
+                    await websocket.send_json({"type": "error", "detail": "No access to one or more plants.",
+                                               "plant_ids": sorted(denied)})
+                new = plant_ids - denied - subscriber.plant_ids
+                subscriber.plant_ids |= new
+                await self.ready.wait()
+                for plant_id in sorted(new):
+                    subscriber.offer(self.snapshot(plant_id))
+            elif action == "unsubscribe":
+                subscriber.plant_ids -= plant_ids
+            else:
+                await websocket.send_json({"type": "error", "detail": "Unknown action."})
+
+    async def serve_websocket(self, websocket: WebSocket, visible: set, plant_ids):
+        # A hívó már hitelesített és elfogadta a kapcsolatot; visible: a felhasználó plantjai
+        subscriber = _Subscriber(set(plant_ids or visible) & visible)
+        self._subscribe(subscriber)
+        ws_open.inc("alarms")
+        tasks = {
+            asyncio.create_task(self._send_loop(websocket, subscriber)),
+            asyncio.create_task(self._receive_loop(websocket, subscriber, visible)),
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error and not isinstance(error, (WebSocketDisconnect, RuntimeError)):
+                    print("Riasztás websocket hiba:", error)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._unsubscribe(subscriber)
+            ws_open.dec("alarms")
+
+    async def sse_events(self, visible: set, plant_ids):
+        # Server-Sent Events változat ugyanazokkal az üzenetekkel; a feliratkozás a query paraméterből jön
+        subscriber = _Subscriber(set(plant_ids or visible) & visible)
+        self._subscribe(subscriber)
+        ws_open.inc("alarms_sse")
+        try:
+            async for message, enqueued_at in self._messages(subscriber):
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+                ws_messages.inc("alarms_sse")
+                if enqueued_at is not None:
+                    ws_send_lag.observe("alarms_sse", value=time.perf_counter() - enqueued_at)
+        finally:
+            self._unsubscribe(subscriber)
+            ws_open.dec("alarms_sse")
+
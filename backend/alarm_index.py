@@ -0,0 +1,66 @@
+from collections import defaultdict
+from smartlogger_alarms import alarm_definitions
+
+# Az alarm_definitions-ből egyszer, importáláskor előállított keresőstruktúrák.
+# A felületen az "Adaptable" súlyosság figyelmeztetésként jelenik meg.
+SEVERITIES = ("Major", "Minor", "Warning")
+
+
+def normalize_severity(severity: str) -> str:
+    return "Warning" if severity == "Adaptable" else severity
+
+
+SEVERITY_BY_KEY = {key: normalize_severity(alarm["severity"]) for key, alarm in alarm_definitions.items()}
+
+# Párhuzamos tömbök a Postgres unnest()-hez: (register, bit) → súlyosság
+LOOKUP_REGISTERS = [register for register, _ in SEVERITY_BY_KEY]
+LOOKUP_BITS = [bit for _, bit in SEVERITY_BY_KEY]
+LOOKUP_SEVERITIES = list(SEVERITY_BY_KEY.values())
+
+def keys_for(severities=None, alarm_ids=None):
+    # A szűrőknek megfelelő (register, bit) párok két párhuzamos tömbként
+    registers, bits = [], []
+    for (register, bit), alarm in alarm_definitions.items():
+        if severities and SEVERITY_BY_KEY[(register, bit)] not in severities:
+            continue
+        if alarm_ids and alarm["alarm_id"] not in alarm_ids:
+            continue
+        registers.append(register)
+        bits.append(bit)
+    return registers, bits
+
+
+def describe(register: int, bit: int) -> dict:
+    alarm = alarm_definitions.get((register, bit))
+    if not alarm:
+        return {"alarm_id": None, "alarm_name": "Ismeretlen", "severity": "Unknown"}
+    return {
+        "alarm_id": alarm["alarm_id"],
+        "alarm_name": alarm.get("alarm_name", "Ismeretlen riasztás"),
+        "severity": normalize_severity(alarm.get("severity", "Unknown")),
+    }
+
+
+SEVERITY_COUNTS_QUERY = """
+    WITH severity_lookup AS (
+        SELECT * FROM unnest($1::int[], $2::int[], $3::text[]) AS s(register, bit, severity)
+    )
+    SELECT las.plant_id, sl.severity, COUNT(*) AS alarm_count
+    FROM logger_alarm_status las
+    JOIN severity_lookup sl ON sl.register = las.register AND sl.bit = las.bit
+    WHERE las.is_active = TRUE
+      AND {plant_filter}
+    GROUP BY las.plant_id, sl.severity
+"""
+
+
+async def fetch_severity_counts(conn, plant_filter: str, *args):
+    # {plant_id: {severity: db}} – egyetlen lekérdezés tetszőleges számú plantra
+    rows = await conn.fetch(
+        SEVERITY_COUNTS_QUERY.format(plant_filter=plant_filter),
+        LOOKUP_REGISTERS, LOOKUP_BITS, LOOKUP_SEVERITIES, *args
+    )
+    summary = defaultdict(dict)
+    for row in rows:
+        summary[row["plant_id"]][row["severity"]] = row["alarm_count"]
+    return summary
@@ -2,8 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
-import asyncpg
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import asyncio
+import os
 
 # JWT konfiguráció
 SECRET_KEY = "nagyontitkoskulcs"
@@ -14,6 +17,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 10
 pwd_context = CryptContext(schemes=["bcrypt_sha256", "bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# A bcrypt ellenőrzés külön szálkészleten fut, hogy ne blokkolja az event loopot.
+# Ha a futó + várakozó ellenőrzések száma eléri a korlátot, azonnal 503-mal válaszolunk.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending_verifications = 0
+
+# Dekódolt JWT claim-ek LRU cache-e; egy bejegyzés legfeljebb a token lejáratáig él
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+_token_cache = OrderedDict()
+
 auth_router = APIRouter()
 
 db_pool = None
@@ -34,6 +48,21 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
     return pwd_context.verify(plain_password, hashed_password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    global _pending_verifications
+    if _pending_verifications >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again shortly",
+            headers={"Retry-After": "1"}
+        )
+    _pending_verifications += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+    finally:
+        _pending_verifications -= 1
+
 # Token készítése
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -46,22 +75,44 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     print("Érkezett login próbálkozás:", form_data.username)
 
+    # A kapcsolat csak a lekérdezés idejére kell; a bcrypt várakozás alatt már visszament a poolba
     async with db_pool.acquire() as conn:
         user = await conn.fetchrow("SELECT id, username, password_hash, role FROM users WHERE username = $1", form_data.username)
-        print("Lekérdezett user:", user)
+    print("Lekérdezett user:", user)
 
-        if not user or not verify_password(form_data.password, user["password_hash"]):
-            print("Sikertelen jelszóellenőrzés.")
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    if not user or not await verify_password_async(form_data.password, user["password_hash"]):
+        print("Sikertelen jelszóellenőrzés.")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
 
-        token_data = {"sub": str(user["id"]), "role": user["role"]}
-        access_token = create_access_token(data=token_data)
-        print("Sikeres login, token generálva.")
+    token_data = {"sub": str(user["id"]), "role": user["role"]}
+    access_token = create_access_token(data=token_data)
+    print("Sikeres login, token generálva.")
 
-        return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer"}
+
+def _cached_user(token: str):
+    cached = _token_cache.get(token)
+    if cached is None:
+        return None
+    expires_at, user = cached
+    if expires_at <= datetime.now(timezone.utc).timestamp():
+        _token_cache.pop(token, None)
+        return None
+    _token_cache.move_to_end(token)
+    return dict(user)
+
+def _cache_user(token: str, expires_at: float, user: dict):
+    _token_cache[token] = (expires_at, user)
+    _token_cache.move_to_end(token)
+    while len(_token_cache) > TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
 
 # Token dekódolása & user azonosítás
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user = _cached_user(token)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = int(payload.get("sub"))
@@ -69,6 +120,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         if user_id is None or role is None:
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        return {"id": user_id, "role": role}
+        user = {"id": user_id, "role": role}
+        if payload.get("exp") is not None:
+            _cache_user(token, float(payload["exp"]), user)
+        return dict(user)
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import httpx
+import websockets
+
+# Terhelésgenerátor: a frontend lekérdezési mintáját (PlantDetails.js, InverterPage.js, alarmok)
+# játssza vissza N virtuális felhasználóval, plusz M production websocket.
+#
+#   python -m benchmarks.load_driver --base-url http://localhost:8000 --users 50 --websockets 20 --duration 60
+#
+# A frontend 60 másodpercenként kérdez; --poll-interval ezt sűríti, hogy rövid futásból is
+# legyen elég minta. Az eredmény --output fájlba JSON-ként is menthető (regressziós alapvonal).
+
+POLLING_MIX = [
+    "/api/plant/{plant_id}/logger-data",
+    "/api/plant/{plant_id}/meter-data",
+    "/api/plant/{plant_id}/production-data?date={today}",
+    "/api/plant/{plant_id}/inverter-data",
+    "/api/plant/{plant_id}/inverter-performance",
+]
+PAGE_LOAD = [
+    "/api/plants",
+    "/api/plant/{plant_id}/power-adjustment",
+    "/api/plant/{plant_id}/daily-yield-range?start_date={week_ago}&end_date={today}",
+    "/api/plant/{plant_id}/alarms/summary",
+    "/api/plant/{plant_id}/alarms/active",
+    "/api/plant/{plant_id}/alarms/history",
+    "/api/plant/{plant_id}/weekly-avg",
+]
+
+_METRIC_LINE = re.compile(r'^(\w+)\{([^}]*)\}\s+([0-9.eE+-]+)$')
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.ws_messages = 0
+        self.ws_errors = 0
+        self.pool_samples = []
+
+    def record(self, endpoint: str, elapsed: float, ok: bool):
+        self.latencies[endpoint].append(elapsed)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def _login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+class Session:
+    # A közös bearer token; a backend tokenje 10 percig él, ezért futás közben megújítjuk
+    def __init__(self, token: str):
+        self.token = token
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def _refresh_token(client, session, args, deadline):
+    while True:
+        wait = min(args.token_refresh, deadline - time.monotonic())
+        if wait <= 0:
+            return
+        await asyncio.sleep(wait)
+        if time.monotonic() >= deadline:
+            return
+        try:
+            session.token = await _login(client, args.username, args.password)
+        except httpx.HTTPError as e:
+            print(f"Token frissítés sikertelen: {e}")
+
+
+async def _request(client, stats, template, plant_id, headers):
+    today = datetime.now(ZoneInfo("Europe/Budapest")).date()
+    url = template.format(
+        plant_id=plant_id,
+        today=today.isoformat(),
+        week_ago=(today - timedelta(days=7)).isoformat(),
+    )
+    started = time.perf_counter()
+    try:
+        response = await client.get(url, headers=headers)
+        ok = response.status_code in (200, 304)
+    except httpx.HTTPError:
+        ok = False
+    stats.record(template.split("?")[0], time.perf_counter() - started, ok)
+
+
+async def _virtual_user(client, stats, session, plant_ids, args, deadline):
+    rng = random.Random()
+    plant_id = rng.choice(plant_ids)
+    await asyncio.sleep(rng.uniform(0, args.poll_interval))
+
+    # Oldalbetöltés, majd periodikus frissítés, mint a böngészőben
+    await asyncio.gather(*(_request(client, stats, t, plant_id, session.headers) for t in PAGE_LOAD))
+    while time.monotonic() < deadline:
+        await asyncio.gather(*(_request(client, stats, t, plant_id, session.headers) for t in POLLING_MIX))
+        await asyncio.sleep(args.poll_interval)
+        if rng.random() < args.navigate_rate:
+            plant_id = rng.choice(plant_ids)
+            await asyncio.gather(*(_request(client, stats, t, plant_id, session.headers) for t in PAGE_LOAD))
+
+
+async def _websocket_client(stats, ws_url, plant_id, deadline):
+    try:
+        async with websockets.connect(f"{ws_url}/ws/plant/{plant_id}/production") as ws:
+            while time.monotonic() < deadline:
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=max(0.1, deadline - time.monotonic()))
+                    stats.ws_messages += 1
+                except asyncio.TimeoutError:
+                    break
+    except Exception:
+        stats.ws_errors += 1
+
+
+async def _sample_pool(client, stats, session, deadline, interval=1.0):
+    # A backend /metrics végpontjából a pool telítettsége
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/metrics", headers=session.headers)
+            size = idle = 0.0
+            for line in response.text.splitlines():
+                match = _METRIC_LINE.match(line)
+                if not match:
+                    continue
+                name, _, value = match.groups()
+                if name == "db_pool_size":
+                    size += float(value)
+                elif name == "db_pool_idle":
+                    idle += float(value)
+            if size:
+                stats.pool_samples.append((size - idle) / size)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def run(args):
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30.0) as client:
+        session = Session(await _login(client, args.username, args.password))
+        plants = (await client.get("/api/plants", headers=session.headers)).json()
+        plant_ids = [p["id"] for p in plants]
+        if not plant_ids:
+            raise SystemExit("No plants visible for the benchmark user; run benchmarks.synthetic_fleet first.")
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        ws_url = args.base_url.replace("http", "ws", 1)
+        tasks = [_virtual_user(client, stats, session, plant_ids, args, deadline) for _ in range(args.users)]
+        tasks += [_websocket_client(stats, ws_url, random.choice(plant_ids), deadline) for _ in range(args.websockets)]
+        tasks.append(_sample_pool(client, stats, session, deadline))
+        tasks.append(_refresh_token(client, session, args, deadline))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "password"},
+        "duration_s": round(elapsed, 2),
+        "endpoints": {},
+        "websocket": {
+            "connections": args.websockets,
+            "messages": stats.ws_messages,
+            "messages_per_s": round(stats.ws_messages / elapsed, 2),
+            "errors": stats.ws_errors,
+        },
+        "pool_utilization": {
+            "mean": round(statistics.mean(stats.pool_samples), 3) if stats.pool_samples else None,
+            "max": round(max(stats.pool_samples), 3) if stats.pool_samples else None,
+            "saturated_share": round(sum(1 for s in stats.pool_samples if s >= 1.0) / len(stats.pool_samples), 3)
+            if stats.pool_samples else None,
+        },
+    }
+
+    total = 0
+    print(f"{'endpoint':60s} {'n':>7s} {'rps':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'err':>5s}")
+    for endpoint, values in sorted(stats.latencies.items()):
+        total += len(values)
+        row = {
+            "count": len(values),
+            "rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(_percentile(values, 50) * 1000, 1),
+            "p95_ms": round(_percentile(values, 95) * 1000, 1),
+            "p99_ms": round(_percentile(values, 99) * 1000, 1),
+            "errors": stats.errors[endpoint],
+        }
+        report["endpoints"][endpoint] = row
+        print(f"{endpoint:60s} {row['count']:7d} {row['rps']:7.1f} {row['p50_ms']:8.1f} "
+              f"{row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['errors']:5d}")
+
+    report["throughput_rps"] = round(total / elapsed, 2)
+    print(f"\nösszesen {total} kérés, {report['throughput_rps']} req/s; "
+          f"websocket üzenetek: {stats.ws_messages} ({report['websocket']['messages_per_s']}/s); "
+          f"pool kihasználtság átlag/max: {report['pool_utilization']['mean']}/{report['pool_utilization']['max']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the dashboard polling mix against a running backend")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--users", type=int, default=50, help="concurrent dashboard tabs")
+    parser.add_argument("--websockets", type=int, default=20, help="production websocket connections")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="seconds between polls (frontend: 60)")
+    parser.add_argument("--navigate-rate", type=float, default=0.1, help="chance to open another plant per poll")
+    parser.add_argument("--token-refresh", type=float, default=300.0,
+                        help="seconds between logins (tokens expire after 10 minutes)")
+    parser.add_argument("--output", help="write the report as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from fastapi import HTTPException
+
+from auth import PASSWORD_HASH_QUEUE, PASSWORD_HASH_WORKERS, pwd_context, verify_password, verify_password_async
+
+# Event loop késleltetés mérése párhuzamos bejelentkezések alatt:
+# "inline" = a régi viselkedés (bcrypt közvetlenül a handlerben),
+# "offload" = verify_password_async (korlátozott szálkészlet). Az alapértelmezett darabszám
+# a várakozási korlát (PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE); afölött az offload mód
+# 503-mal elutasít, ezek "rejected"-ként számolódnak.
+#
+#   python -m benchmarks.login_event_loop --logins 36
+
+
+async def _measure_lag(stop: asyncio.Event, interval: float, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def _inline_login(password: str, hashed: str):
+    return verify_password(password, hashed)
+
+
+async def _offload_login(password: str, hashed: str):
+    try:
+        return await verify_password_async(password, hashed)
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        return None
+
+
+async def run(mode: str, logins: int, hashed: str, interval: float):
+    samples = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_measure_lag(stop, interval, samples))
+    await asyncio.sleep(interval * 2)
+
+    login = _inline_login if mode == "inline" else _offload_login
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login("benchmark-password", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    rejected = sum(1 for r in results if r is None)
+    assert all(r for r in results if r is not None)
+
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) > 1 else samples[0]
+    print(
+        f"{mode:8s} logins={logins} rejected={rejected} total={elapsed:.2f}s "
+        f"loop lag p50={statistics.median(samples):.1f}ms p95={p95:.1f}ms max={samples[-1]:.1f}ms "
+        f"ticks={len(samples)}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Event loop latency under concurrent logins")
+    parser.add_argument("--logins", type=int, default=PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+    parser.add_argument("--interval", type=float, default=0.005, help="lag sampling interval (s)")
+    args = parser.parse_args()
+
+    hashed = pwd_context.hash("benchmark-password")
+    await run("inline", args.logins, hashed, args.interval)
+    await run("offload", args.logins, hashed, args.interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,23 @@
 import asyncio
-from datetime import datetime
-from main import db_pool
+from datetime import date, datetime, timedelta
 import asyncpg
 import os
 
 db_pool = None
 
+# Egyszerre ennyi inverter feldolgozása fut (mindegyik saját kapcsolaton)
+ROLLUP_WORKERS = int(os.getenv("ROLLUP_WORKERS", "4"))
+AVG_WINDOW = timedelta(days=7)
+# A részösszegeket az átlagablaknál kicsit tovább tartjuk meg
+PARTIALS_RETENTION = timedelta(days=8)
+# A watermark előtti utolsó órák minden futáskor újraszámolódnak, hogy a késve érkező sorok is bekerüljenek
+LATE_DATA_WINDOW = timedelta(hours=int(os.getenv("ROLLUP_LATE_HOURS", "3")))
+
+def set_db_pool(pool):
+    # Az ütemező a saját, hosszú életű poolját adja át
+    global db_pool
+    db_pool = pool
+
 async def init_db():
     global db_pool
     if db_pool is None:
@@ -16,62 +28,196 @@ async def init_db():
             host="localhost",
             port="5434",
             min_size=1,
-            max_size=10
+            max_size=max(10, ROLLUP_WORKERS + 1)
         )
 
-async def calculate_weekly_hourly_avg():
-    await init_db()
-    async with db_pool.acquire() as conn:
-        inverters = await conn.fetch("""
-            SELECT id, max_string_count FROM inverters;
-        """)
+async def ensure_schema(conn):
+    # Óránkénti részösszegek stringenként: ebből számoljuk a 7 napos átlagot
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS string_hourly_partials (
+            inverter_id   INTEGER NOT NULL,
+            plant_id      INTEGER NOT NULL,
+            string_number INTEGER NOT NULL,
+            bucket_hour   TIMESTAMP NOT NULL,
+            power_sum     DOUBLE PRECISION NOT NULL,
+            sample_count  INTEGER NOT NULL,
+            PRIMARY KEY (inverter_id, string_number, bucket_hour)
+        );
 
-        for inverter in inverters:
-            inverter_id = inverter["id"]
-            max_string_count = inverter["max_string_count"]
+        CREATE TABLE IF NOT EXISTS string_rollup_watermarks (
+            inverter_id INTEGER PRIMARY KEY,
+            last_hour   TIMESTAMP NOT NULL
+        );
+    """)
 
-            voltage_fields = ", ".join([f"string_{i}_v" for i in range(1, max_string_count + 1)])
-            current_fields = ", ".join([f"string_{i}_a" for i in range(1, max_string_count + 1)])
+async def check_schema(conn):
+    # Az upsert egyedi kulcsa a migrate.py-ban készül (egyszeri duplikátum törléssel); a futás nem hozza létre
+    if await conn.fetchval("SELECT to_regclass('string_weekly_hourly_avg_uniq')") is None:
+        raise RuntimeError("string_weekly_hourly_avg_uniq index is missing; run python migrate.py first")
 
-            query = f"""
-    INSERT INTO string_weekly_hourly_avg (
-        plant_id,
+async def migrate(conn):
+    # Egyszeri: a korábbi futások ugyanarra a napra többször is beszúrtak; az upserthez egyedi kulcs kell
+    await ensure_schema(conn)
+    if await conn.fetchval("SELECT to_regclass('string_weekly_hourly_avg_uniq')") is not None:
+        return False
+    async with conn.transaction():
+        deleted = await conn.execute("""
+            DELETE FROM string_weekly_hourly_avg a
+            USING string_weekly_hourly_avg b
+            WHERE a.inverter_id = b.inverter_id
+              AND a.string_number = b.string_number
+              AND a.calculation_hour = b.calculation_hour
+              AND a.calculation_date = b.calculation_date
+              AND a.ctid < b.ctid
+        """)
+        await conn.execute("""
+            CREATE UNIQUE INDEX string_weekly_hourly_avg_uniq
+            ON string_weekly_hourly_avg (inverter_id, string_number, calculation_hour, calculation_date)
+        """)
+    print(f"[{datetime.now()}] string_weekly_hourly_avg: {deleted.split()[-1]} duplikátum törölve, egyedi index létrehozva.")
+    return True
+
+def partials_query(max_string_count: int) -> str:
+    voltage_fields = ", ".join([f"d.string_{i}_v" for i in range(1, max_string_count + 1)])
+    current_fields = ", ".join([f"d.string_{i}_a" for i in range(1, max_string_count + 1)])
+
+    return f"""
+    INSERT INTO string_hourly_partials (
         inverter_id,
+        plant_id,
         string_number,
-        hourly_avg_power,
-        calculation_hour,
-        calculation_date
+        bucket_hour,
+        power_sum,
+        sample_count
     )
-    SELECT 
-        plant_id,
+    SELECT
         inverter_id,
+        $2::INTEGER,
         string_number,
-        AVG(
-            CASE
-                WHEN voltage = 6553.5 OR current = 655.35 THEN NULL
-                ELSE (voltage * current) / 1000
-            END
-        ) AS hourly_avg_power,
-        calculation_hour,
-        CURRENT_DATE AS calculation_date
+        bucket_hour,
+        COALESCE(SUM(power), 0),
+        COUNT(power)
     FROM (
-        SELECT 
-            i.plant_id,
+        SELECT
             d.inverter_id,
-            generate_series(1, {max_string_count}) AS string_number,
-            unnest(ARRAY[{voltage_fields}]) AS voltage,
-            unnest(ARRAY[{current_fields}]) AS current,
-            DATE_TRUNC('hour', d.timestamp)::TIME AS calculation_hour
+            s.string_number,
+            DATE_TRUNC('hour', d.timestamp) AS bucket_hour,
+            CASE
+                WHEN s.voltage = 6553.5 OR s.current = 655.35 THEN NULL
+                ELSE (s.voltage * s.current) / 1000
+            END AS power
         FROM inverter_data d
-        JOIN inverters i ON d.inverter_id = i.id
-        WHERE d.inverter_id = {inverter_id} AND d.timestamp >= NOW() - INTERVAL '7 days'
+        CROSS JOIN LATERAL unnest(
+            ARRAY[{voltage_fields}],
+            ARRAY[{current_fields}]
+        ) WITH ORDINALITY AS s(voltage, current, string_number)
+        WHERE d.inverter_id = $1 AND d.timestamp >= $3 AND d.timestamp < $4
     ) AS unnested_data
-    GROUP BY plant_id, inverter_id, string_number, calculation_hour;
+    GROUP BY inverter_id, string_number, bucket_hour
+    ON CONFLICT (inverter_id, string_number, bucket_hour) DO UPDATE
+    SET power_sum = EXCLUDED.power_sum,
+        sample_count = EXCLUDED.sample_count;
 """
 
+async def aggregate_partials(conn, inverter, start: datetime, end: datetime) -> int:
+    # A [start, end) lezárt órákat (újra)számolja a nyers inverter_data-ból
+    status = await conn.execute(
+        partials_query(inverter["max_string_count"]),
+        inverter["id"], inverter["plant_id"], start, end
+    )
+    return int(status.split()[-1])
+
+async def refresh_weekly_avg(conn, inverter, until: datetime, calculation_date: date = None) -> int:
+    # A [until - 7 nap, until) ablak átlaga; calculation_date alapból a mai nap (backfillnél a feldolgozott nap)
+    status = await conn.execute("""
+        INSERT INTO string_weekly_hourly_avg (
+            plant_id,
+            inverter_id,
+            string_number,
+            hourly_avg_power,
+            calculation_hour,
+            calculation_date
+        )
+        SELECT
+            plant_id,
+            inverter_id,
+            string_number,
+            SUM(power_sum) / NULLIF(SUM(sample_count), 0),
+            bucket_hour::TIME,
+            COALESCE($4::DATE, CURRENT_DATE)
+        FROM string_hourly_partials
+        WHERE inverter_id = $1 AND bucket_hour >= $2 AND bucket_hour < $3
+        GROUP BY plant_id, inverter_id, string_number, bucket_hour::TIME
+        ON CONFLICT (inverter_id, string_number, calculation_hour, calculation_date) DO UPDATE
+        SET hourly_avg_power = EXCLUDED.hourly_avg_power,
+            plant_id = EXCLUDED.plant_id;
+    """, inverter["id"], until - AVG_WINDOW, until, calculation_date)
+    return int(status.split()[-1])
+
+async def _process_inverter(inverter, until: datetime, semaphore: asyncio.Semaphore) -> int:
+    async with semaphore:
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                last_hour = await conn.fetchval(
+                    "SELECT last_hour FROM string_rollup_watermarks WHERE inverter_id = $1",
+                    inverter["id"]
+                )
+                # A korábbi (helyi idős) futások jövőbe tolt watermarkja is visszaáll
+                if last_hour:
+                    start = max(min(last_hour, until) - LATE_DATA_WINDOW, until - AVG_WINDOW)
+                else:
+                    start = until - AVG_WINDOW
+                if start < until:
+                    await aggregate_partials(conn, inverter, start, until)
+
+                rows = await refresh_weekly_avg(conn, inverter, until)
+
+                await conn.execute("""
+                    INSERT INTO string_rollup_watermarks (inverter_id, last_hour)
+                    VALUES ($1, $2)
+                    ON CONFLICT (inverter_id) DO UPDATE SET last_hour = EXCLUDED.last_hour
+                """, inverter["id"], until)
+                await conn.execute("""
+                    DELETE FROM string_hourly_partials
+                    WHERE inverter_id = $1 AND bucket_hour < $2
+                """, inverter["id"], until - PARTIALS_RETENTION)
+
+    print(f"[{datetime.now()}] Hourly averages calculated for inverter {inverter['id']} (from {start}).")
+    return rows
+
+async def calculate_weekly_hourly_avg(workers: int = ROLLUP_WORKERS):
+    await init_db()
+    async with db_pool.acquire() as conn:
+        await ensure_schema(conn)
+        await check_schema(conn)
+        inverters = await conn.fetch("""
+            SELECT id, plant_id, max_string_count
+            FROM inverters
+            WHERE max_string_count > 0;
+        """)
+        # Csak lezárt órákat összesítünk; az adatbázis órájához igazodunk. Az inverter_data
+        # időbélyegei naiv UTC-k, a session időzónájától függetlenül UTC-ben vágunk
+        until = await conn.fetchval("SELECT DATE_TRUNC('hour', NOW() AT TIME ZONE 'UTC')")
 
-            await conn.execute(query)
-            print(f"[{datetime.now()}] Hourly averages calculated for inverter {inverter_id}.")
+    semaphore = asyncio.Semaphore(workers)
+    results = await asyncio.gather(
+        *(_process_inverter(inverter, until, semaphore) for inverter in inverters),
+        return_exceptions=True
+    )
+
+    rows = 0
+    failed = []
+    for inverter, result in zip(inverters, results):
+        if isinstance(result, Exception):
+            failed.append(inverter["id"])
+            print(f"[{datetime.now()}] Hourly average calculation failed for inverter {inverter['id']}: {result}")
+        else:
+            rows += result
+
+    # Az API memóriában tartott string profil kockái (string_profile.py) ettől újraépülnek
+    async with db_pool.acquire() as conn:
+        await conn.execute("SELECT pg_notify('string_profile', '')")
+    return {"inverters": len(inverters), "failed": failed, "rows": rows}
 
 async def main():
     await calculate_weekly_hourly_avg()
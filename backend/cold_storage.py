@@ -0,0 +1,536 @@
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import asyncpg
+
+from db_config import connection_kwargs
+from partition_telemetry import _add_months, _month_start, is_partitioned, partition_name
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # a hideg tár opcionális
+    pa = None
+    pc = None
+    pq = None
+
+# A nyers telemetria lezárt hónapjainak hideg tára: plantonként és hónaponként egy zstd-vel
+# tömörített Parquet fájl (<COLD_STORAGE_DIR>/<tábla>/plant=<id>/<ÉÉÉÉ-HH>.parquet), a
+# cold_archive_manifest táblában nyilvántartva.
+#
+#   python cold_storage.py archive [--table inverter_data ...] [--hot-months 1]
+#   python cold_storage.py status
+#
+# Az archiválás két lépésben történik. Először a fájl és a manifest sor készül el, a Postgres
+# sorok maradnak; az olvasók (production-data, napi hozam, export) ettől kezdve a fájlból
+# olvassák a hónapot. A következő futás – legalább COLD_PURGE_GRACE után, amikor minden
+# folyamat manifest cache-e frissült – ellenőrzi, hogy a forrás sorszáma egyezik-e a fájléval,
+# és csak ekkor törli a sorokat (partícionált táblánál a teljes havi partíciót dobja el).
+# Eltérés esetén (késve beérkezett sorok) a hónap újra archiválódik.
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR")
+# Az aktuális hónapon kívül ennyi lezárt hónap marad a Postgresben
+COLD_HOT_MONTHS = int(os.getenv("COLD_HOT_MONTHS", "1"))
+COLD_PURGE_GRACE = timedelta(minutes=int(os.getenv("COLD_PURGE_GRACE_MINUTES", "60")))
+COLD_ROW_GROUP_ROWS = int(os.getenv("COLD_ROW_GROUP_ROWS", "50000"))
+MANIFEST_TTL = 60
+
+ARCHIVE_TABLES = {
+    "inverter_data": "inverter_id",
+    "logger_data": "plant_id",
+    "meter_data": "plant_id",
+}
+
+_manifest = {}
+_manifest_loaded_at = None
+_manifest_lock = asyncio.Lock()
+
+
+class ColdStorageUnavailable(Exception):
+    pass
+
+
+async def ensure_schema(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS cold_archive_manifest (
+            table_name  TEXT NOT NULL,
+            plant_id    INTEGER NOT NULL,
+            month       DATE NOT NULL,
+            path        TEXT,               -- COLD_STORAGE_DIR-hez relatív; NULL: nem volt adat
+            rows        BIGINT NOT NULL,
+            bytes       BIGINT NOT NULL DEFAULT 0,
+            first_ts    TIMESTAMP,
+            last_ts     TIMESTAMP,
+            archived_at TIMESTAMP NOT NULL,
+            purged_at   TIMESTAMP,          -- a forrás sorok törlésének ideje
+            PRIMARY KEY (table_name, plant_id, month)
+        );
+    """)
+
+
+# Postgres típusnév → arrow típus; ismeretlen típus szövegként megy
+_ARROW_TYPES = {
+    "int2": "int16", "int4": "int32", "int8": "int64",
+    "float4": "float32", "float8": "float64", "numeric": "float64",
+    "bool": "bool_", "text": "string", "varchar": "string",
+    "date": "date32",
+}
+
+
+def arrow_schema(columns, type_names):
+    fields = []
+    for name, type_name in zip(columns, type_names):
+        if type_name == "timestamp":
+            arrow_type = pa.timestamp("us")
+        elif type_name == "timestamptz":
+            arrow_type = pa.timestamp("us", tz="UTC")
+        else:
+            arrow_type = getattr(pa, _ARROW_TYPES.get(type_name, "string"))()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def _column_values(rows, i: int) -> list:
+    # NUMERIC → Decimal, amit a float64 Arrow oszlop nem fogad; oszloponként egyszer nézzük a típust
+    values = [row[i] for row in rows]
+    if isinstance(next((v for v in values if v is not None), None), Decimal):
+        return [float(v) if v is not None else None for v in values]
+    return values
+
+
+def records_to_table(rows, schema):
+    arrays = [pa.array(_column_values(rows, i), type=field.type) for i, field in enumerate(schema)]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def table_rows(table):
+    # Arrow tábla → sor tuple-ök (az export kódolói asyncpg Record-szerű sorokat várnak)
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+def _root() -> str:
+    if not COLD_STORAGE_DIR:
+        raise ColdStorageUnavailable("Cold storage is not configured (COLD_STORAGE_DIR).")
+    if pa is None:
+        raise ColdStorageUnavailable("Cold storage is not available (pyarrow is not installed).")
+    return COLD_STORAGE_DIR
+
+
+def _month_bounds(month: date):
+    return (datetime.combine(month, datetime.min.time()),
+            datetime.combine(_add_months(month, 1), datetime.min.time()))
+
+
+def _plant_filter(table: str) -> str:
+    # $1 = plant_id; az inverter_data inverterenként van kulcsolva
+    if ARCHIVE_TABLES[table] == "inverter_id":
+        return "inverter_id IN (SELECT id FROM inverters WHERE plant_id = $1)"
+    return "plant_id = $1"
+
+
+# --- Olvasás ---------------------------------------------------------------------------------
+
+async def _load_manifest(conn):
+    global _manifest, _manifest_loaded_at
+    manifest = {}
+    if await conn.fetchval("SELECT to_regclass('cold_archive_manifest')"):
+        for row in await conn.fetch("SELECT table_name, plant_id, month, path FROM cold_archive_manifest"):
+            manifest.setdefault((row["table_name"], row["plant_id"]), {})[row["month"]] = row["path"]
+    _manifest = manifest
+    _manifest_loaded_at = asyncio.get_running_loop().time()
+
+
+async def archived_months(conn, table: str, plant_id: int) -> dict:
+    # {hónap: relatív útvonal vagy None}; a teljes manifest MANIFEST_TTL másodpercig cache-elve
+    now = asyncio.get_running_loop().time()
+    if _manifest_loaded_at is None or now - _manifest_loaded_at > MANIFEST_TTL:
+        async with _manifest_lock:
+            if _manifest_loaded_at is None or asyncio.get_running_loop().time() - _manifest_loaded_at > MANIFEST_TTL:
+                await _load_manifest(conn)
+    return _manifest.get((table, plant_id), {})
+
+
+def split_range(months: dict, start: datetime, end: datetime, merge: bool = True):
+    # [start, end) → [(szakasz eleje, vége, hideg-e)]; a szomszédos azonos szakaszok összevonva
+    segments = []
+    month = _month_start(start)
+    while True:
+        month_start, month_end = _month_bounds(month)
+        segment_start, segment_end = max(start, month_start), min(end, month_end)
+        if segment_start >= segment_end:
+            break
+        cold = month in months
+        if merge and segments and segments[-1][2] == cold:
+            segments[-1] = (segments[-1][0], segment_end, cold)
+        else:
+            segments.append((segment_start, segment_end, cold))
+        month = _add_months(month, 1)
+    return segments
+
+
+async def cold_segments(conn, table: str, plant_id: int, start: datetime, end: datetime):
+    # Archivált hónap nélkül egyetlen meleg szakasz; a hiba még a lekérdezések előtt kiderül
+    months = await archived_months(conn, table, plant_id)
+    if not months:
+        return [(start, end, False)]
+    segments = split_range(months, start, end)
+    if any(cold for _, _, cold in segments):
+        _root()
+    return segments
+
+
+def _read_files(paths, columns, start, end, key, key_values):
+    filters = [("timestamp", ">=", start), ("timestamp", "<", end)]
+    if key_values is not None:
+        filters.append((key, "in", list(key_values)))
+    tables = []
+    for path in paths:
+        available = set(pq.read_schema(path).names)
+        table = pq.read_table(path, columns=[c for c in columns if c in available],
+                              filters=filters, memory_map=True)
+        # Az archiválás óta hozzáadott oszlopok üresen
+        for name in columns:
+            if name not in available:
+                table = table.append_column(name, pa.nulls(table.num_rows))
+        tables.append(table.select(columns))
+    if not tables:
+        return None
+    table = pa.concat_tables(tables, promote_options="permissive")
+    sort_keys = ([(key, "ascending")] if key_values is not None and len(key_values) > 1 else []) + [("timestamp", "ascending")]
+    return table.sort_by(sort_keys)
+
+
+async def read_cold(conn, table: str, plant_id: int, start: datetime, end: datetime, columns, key_values=None):
+    # A hideg tár sorai [start, end)-ből timestamp szerint rendezve, arrow táblaként (None: nincs adat)
+    root = _root()
+    months = await archived_months(conn, table, plant_id)
+    paths = [
+        os.path.join(root, path)
+        for month, path in sorted(months.items())
+        if path and _month_bounds(month)[1] > start and _month_bounds(month)[0] < end
+    ]
+    if not paths:
+        return None
+    return await asyncio.to_thread(
+        _read_files, paths, list(columns), start, end, ARCHIVE_TABLES[table], key_values
+    )
+
+
+async def iter_cold(conn, table: str, plant_id: int, start: datetime, end: datetime, columns, key_values=None):
+    # Mint a read_cold, de hónaponként: a memóriában egyszerre legfeljebb egy hónap van
+    for month_start, month_end, _ in split_range({}, start, end, merge=False):
+        data = await read_cold(conn, table, plant_id, month_start, month_end, columns, key_values)
+        if data is not None and data.num_rows:
+            yield data
+
+
+def bucket_power(table, bucket_seconds: int):
+    # Ugyanaz az epoch-hoz igazított vödrözés, mint a production-data SQL-je
+    buckets = pc.floor_temporal(table["timestamp"], multiple=bucket_seconds, unit="second")
+    grouped = (
+        pa.table({"timestamp": buckets, "active_power": table["active_power"]})
+        .group_by("timestamp")
+        .aggregate([("active_power", "mean"), ("active_power", "min"), ("active_power", "max"), ("active_power", "count")])
+        .sort_by("timestamp")
+    )
+    return [
+        {"timestamp": r["timestamp"], "active_power": r["active_power_mean"], "min": r["active_power_min"],
+         "max": r["active_power_max"], "samples": r["active_power_count"]}
+        for r in grouped.to_pylist()
+    ]
+
+
+def daily_max(table, column: str, tz: str):
+    # Helyi napok szerinti maximum (napi hozamhoz): {nap: érték}
+    local = pc.local_timestamp(table["timestamp"].cast(pa.timestamp("us", tz=tz)))
+    grouped = (
+        pa.table({"day": local.cast(pa.date32()), "value": table[column]})
+        .group_by("day")
+        .aggregate([("value", "max")])
+    )
+    return {r["day"]: r["value_max"] for r in grouped.to_pylist() if r["value_max"] is not None}
+
+
+# --- Archiválás ------------------------------------------------------------------------------
+
+async def archive_month(conn, table: str, plant_id: int, month: date) -> dict:
+    root = _root()
+    start, end = _month_bounds(month)
+    relative = os.path.join(table, f"plant={plant_id}", f"{month:%Y-%m}.parquet")
+    path = os.path.join(root, relative)
+    temporary = path + ".tmp"
+
+    rows = 0
+    first_ts = last_ts = None
+    writer = None
+    try:
+        # Egy pillanatképből olvasunk: a manifest sorszáma pontosan a fájl tartalma
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            statement = await conn.prepare(f"""
+                SELECT * FROM {table}
+                WHERE {_plant_filter(table)} AND timestamp >= $2 AND timestamp < $3
+                ORDER BY {ARCHIVE_TABLES[table]}, timestamp
+            """)
+            attributes = statement.get_attributes()
+            schema = arrow_schema([a.name for a in attributes], [a.type.name for a in attributes])
+            cursor = await statement.cursor(plant_id, start, end)
+            while True:
+                batch = await cursor.fetch(COLD_ROW_GROUP_ROWS)
+                if not batch:
+                    break
+                if writer is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writer = pq.ParquetWriter(temporary, schema, compression="zstd")
+                await asyncio.to_thread(writer.write_table, records_to_table(batch, schema))
+                rows += len(batch)
+                batch_first = min(r["timestamp"] for r in batch)
+                batch_last = max(r["timestamp"] for r in batch)
+                first_ts = batch_first if first_ts is None else min(first_ts, batch_first)
+                last_ts = batch_last if last_ts is None else max(last_ts, batch_last)
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(temporary, path)
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(temporary)
+
+    size = os.path.getsize(path) if rows else 0
+    await conn.execute("""
+        INSERT INTO cold_archive_manifest
+            (table_name, plant_id, month, path, rows, bytes, first_ts, last_ts, archived_at, purged_at)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, NOW()::TIMESTAMP, NULL)
+        ON CONFLICT (table_name, plant_id, month) DO UPDATE
+        SET path = EXCLUDED.path, rows = EXCLUDED.rows, bytes = EXCLUDED.bytes,
+            first_ts = EXCLUDED.first_ts, last_ts = EXCLUDED.last_ts,
+            archived_at = EXCLUDED.archived_at, purged_at = NULL
+    """, table, plant_id, month, relative if rows else None, rows, size, first_ts, last_ts)
+    print(f"[{datetime.now()}] {table} plant {plant_id} {month:%Y-%m}: {rows} sor archiválva ({size} bájt).")
+    return {"rows": rows, "bytes": size}
+
+
+async def _plant_counts(conn, table: str, relation: str, start: datetime, end: datetime) -> dict:
+    if ARCHIVE_TABLES[table] == "inverter_id":
+        rows = await conn.fetch(f"""
+            SELECT i.plant_id, COUNT(*) AS n
+            FROM {relation} d JOIN inverters i ON i.id = d.inverter_id
+            WHERE d.timestamp >= $1 AND d.timestamp < $2
+            GROUP BY i.plant_id
+        """, start, end)
+    else:
+        rows = await conn.fetch(f"""
+            SELECT plant_id, COUNT(*) AS n FROM {relation}
+            WHERE timestamp >= $1 AND timestamp < $2
+            GROUP BY plant_id
+        """, start, end)
+    return {r["plant_id"]: r["n"] for r in rows}
+
+
+async def unarchived_plants(conn, table: str, month: date):
+    # A havi partíció azon plantjai, amelyek sorai nincsenek egyező sorszámmal a hideg tárban;
+    # üres lista esetén a partíció adatvesztés nélkül eldobható. None: a tábla nem archiválható
+    if table not in ARCHIVE_TABLES:
+        return None
+    start, end = _month_bounds(month)
+    counts = await _plant_counts(conn, table, partition_name(table, month), start, end)
+    if not counts:
+        return []
+    archived = {}
+    if await conn.fetchval("SELECT to_regclass('cold_archive_manifest')"):
+        archived = {
+            r["plant_id"]: r["rows"] for r in await conn.fetch("""
+                SELECT plant_id, rows FROM cold_archive_manifest WHERE table_name = $1 AND month = $2
+            """, table, month)
+        }
+    return sorted(plant_id for plant_id, n in counts.items() if archived.get(plant_id) != n)
+
+
+async def purge_table(conn, table: str, grace: timedelta = COLD_PURGE_GRACE) -> int:
+    # A türelmi időn túli, még nem törölt hónapok forrás sorainak eltávolítása
+    pending = await conn.fetch("""
+        SELECT plant_id, month, rows FROM cold_archive_manifest
+        WHERE table_name = $1 AND purged_at IS NULL AND archived_at < NOW()::TIMESTAMP - $2::INTERVAL
+        ORDER BY month, plant_id
+    """, table, grace)
+    by_month = {}
+    for row in pending:
+        by_month.setdefault(row["month"], {})[row["plant_id"]] = row["rows"]
+
+    partitioned = await is_partitioned(conn, table)
+    purged = 0
+    for month, entries in by_month.items():
+        start, end = _month_bounds(month)
+        stale = []
+        partition = partition_name(table, month)
+        if partitioned and not await conn.fetchval("SELECT to_regclass($1)", partition):
+            # A partíciót már eldobták (pl. partition_maintain retention): nincs mit törölni
+            await conn.execute("""
+                UPDATE cold_archive_manifest SET purged_at = NOW()::TIMESTAMP
+                WHERE table_name = $1 AND month = $2 AND purged_at IS NULL
+            """, table, month)
+        elif partitioned:
+            # Az egész partíció eldobható, ha minden benne lévő plant archiválva van egyező sorszámmal
+            async with conn.transaction():
+                await conn.execute(f"LOCK TABLE {partition} IN SHARE MODE")
+                counts = await _plant_counts(conn, table, partition, start, end)
+                archived = {
+                    r["plant_id"]: r["rows"] for r in await conn.fetch("""
+                        SELECT plant_id, rows FROM cold_archive_manifest WHERE table_name = $1 AND month = $2
+                    """, table, month)
+                }
+                # Manifest sor nélküli plant még nincs archiválva: azt az archive_table viszi ki
+                # (a hozam lezárás ellenőrzésével), addig a partíció marad
+                unarchived = [plant_id for plant_id in counts if plant_id not in archived]
+                stale = [plant_id for plant_id, n in counts.items() if plant_id in archived and n > archived[plant_id]]
+                missing = [plant_id for plant_id, n in counts.items() if plant_id in archived and n < archived[plant_id]]
+                if missing:
+                    print(f"{table} {month:%Y-%m}: kevesebb sor a partícióban, mint az archívumban "
+                          f"(plant {missing}); nem dobjuk el.")
+                elif unarchived:
+                    print(f"{table} {month:%Y-%m}: még nem archivált plantok a partícióban "
+                          f"(plant {unarchived}); nem dobjuk el.")
+                elif not stale:
+                    await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+                    await conn.execute(f"DROP TABLE {partition}")
+                    await conn.execute("""
+                        UPDATE cold_archive_manifest SET purged_at = NOW()::TIMESTAMP
+                        WHERE table_name = $1 AND month = $2
+                    """, table, month)
+                    purged += sum(counts.values())
+                    print(f"[{datetime.now()}] {table}: {partition} partíció eldobva.")
+        else:
+            for plant_id, archived_rows in entries.items():
+                async with conn.transaction(isolation="repeatable_read"):
+                    count = await conn.fetchval(f"""
+                        SELECT COUNT(*) FROM {table}
+                        WHERE {_plant_filter(table)} AND timestamp >= $2 AND timestamp < $3
+                    """, plant_id, start, end)
+                    if count > archived_rows:
+                        stale.append(plant_id)
+                        continue
+                    if count < archived_rows:
+                        print(f"{table} plant {plant_id} {month:%Y-%m}: {count} sor a táblában, "
+                              f"{archived_rows} az archívumban; nem töröljük.")
+                        continue
+                    await conn.execute(f"""
+                        DELETE FROM {table}
+                        WHERE {_plant_filter(table)} AND timestamp >= $2 AND timestamp < $3
+                    """, plant_id, start, end)
+                    await conn.execute("""
+                        UPDATE cold_archive_manifest SET purged_at = NOW()::TIMESTAMP
+                        WHERE table_name = $1 AND plant_id = $2 AND month = $3
+                    """, table, plant_id, month)
+                    purged += count
+
+        # Azóta érkezett sorok: újra archiválás, a törlés a következő futásra marad
+        for plant_id in stale:
+            await archive_month(conn, table, plant_id, month)
+    return purged
+
+
+async def _first_timestamp(conn, table: str, plant_id: int):
+    # Kulcsonként indexelt MIN, nem a teljes tábla bejárása
+    if ARCHIVE_TABLES[table] == "inverter_id":
+        return await conn.fetchval("""
+            SELECT MIN(first_ts) FROM inverters i
+            CROSS JOIN LATERAL (SELECT MIN(timestamp) AS first_ts FROM inverter_data WHERE inverter_id = i.id) d
+            WHERE i.plant_id = $1
+        """, plant_id)
+    return await conn.fetchval(f"SELECT MIN(timestamp) FROM {table} WHERE plant_id = $1", plant_id)
+
+
+async def archive_table(conn, table: str, hot_months: int = COLD_HOT_MONTHS) -> dict:
+    cutoff = _add_months(_month_start(date.today()), -hot_months)
+    archived = {
+        (r["plant_id"], r["month"])
+        for r in await conn.fetch("SELECT plant_id, month FROM cold_archive_manifest WHERE table_name = $1", table)
+    }
+    # A napi hozam a logger_data-ból záródik: hónap csak a lezárása után kerülhet ki
+    finalized = {}
+    if table == "logger_data" and await conn.fetchval("SELECT to_regclass('plant_yield_watermarks')"):
+        finalized = {
+            r["plant_id"]: r["finalized_through"]
+            for r in await conn.fetch("SELECT plant_id, finalized_through FROM plant_yield_watermarks")
+        }
+
+    result = {"files": 0, "rows": 0, "bytes": 0}
+    for plant in await conn.fetch("SELECT id FROM plants ORDER BY id"):
+        plant_id = plant["id"]
+        first_ts = await _first_timestamp(conn, table, plant_id)
+        if first_ts is None:
+            continue
+        month = _month_start(first_ts)
+        while month < cutoff:
+            last_day = _add_months(month, 1) - timedelta(days=1)
+            if (plant_id, month) not in archived:
+                if table == "logger_data" and (finalized.get(plant_id) or date.min) < last_day:
+                    print(f"{table} plant {plant_id} {month:%Y-%m}: a napi hozam még nincs lezárva, kihagyva.")
+                    break
+                archived_month = await archive_month(conn, table, plant_id, month)
+                result["files"] += 1 if archived_month["rows"] else 0
+                result["rows"] += archived_month["rows"]
+                result["bytes"] += archived_month["bytes"]
+            month = _add_months(month, 1)
+    return result
+
+
+async def run_archive(conn, tables=None, hot_months: int = COLD_HOT_MONTHS) -> dict:
+    _root()
+    await ensure_schema(conn)
+    totals = {"files": 0, "rows": 0, "bytes": 0, "purged": 0}
+    for table in tables or list(ARCHIVE_TABLES):
+        # Előbb a korábban archivált hónapok törlése, utána az új hónapok kiírása
+        totals["purged"] += await purge_table(conn, table)
+        for name, value in (await archive_table(conn, table, hot_months)).items():
+            totals[name] += value
+    print(f"[{datetime.now()}] Hideg tár: {totals['files']} fájl, {totals['rows']} sor archiválva, "
+          f"{totals['purged']} sor törölve a Postgresből.")
+    return totals
+
+
+async def status(conn):
+    rows = await conn.fetch("""
+        SELECT table_name, COUNT(*) AS months, SUM(rows) AS rows, SUM(bytes) AS bytes,
+               MIN(month) AS first_month, MAX(month) AS last_month,
+               COUNT(*) FILTER (WHERE purged_at IS NULL) AS pending_purge
+        FROM cold_archive_manifest
+        GROUP BY table_name
+        ORDER BY table_name
+    """)
+    for r in rows:
+        print(f"{r['table_name']:<14} {r['months']:>5} plant-hónap {r['rows'] or 0:>12} sor "
+              f"{(r['bytes'] or 0) / 1e6:>10.1f} MB  {r['first_month']} – {r['last_month']}  "
+              f"törlésre vár: {r['pending_purge']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Archive closed months of raw telemetry to Parquet cold storage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    archive_parser = sub.add_parser("archive")
+    archive_parser.add_argument("--table", action="append", choices=list(ARCHIVE_TABLES))
+    archive_parser.add_argument("--hot-months", type=int, default=COLD_HOT_MONTHS)
+    sub.add_parser("status")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(**connection_kwargs())
+    try:
+        await ensure_schema(conn)
+        if args.command == "status":
+            await status(conn)
+            return
+        try:
+            await run_archive(conn, args.table, args.hot_months)
+        except ColdStorageUnavailable as e:
+            print(e)
+            sys.exit(1)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
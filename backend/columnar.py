@@ -0,0 +1,93 @@
+import json
+import math
+import sys
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from fastapi import HTTPException, Response
+
+try:
+    import orjson
+except ImportError:  # opcionális gyors JSON backend
+    orjson = None
+
+# Oszlopos válaszformátum az idősoros végpontokhoz:
+#   ?format=columnar → {"oszlop": [érték, ...], ...} JSON, párhuzamos tömbökkel
+#   ?format=binary   → oszloponként little-endian float64 tömbök egymás után;
+#                      a sorrend és a hosszak az X-Columns fejlécben ("név:hossz,...")
+# Időbélyegek epoch ms-ként (a naiv értékek UTC-nek számítanak), dátum az UTC éjfél
+# epoch ms-e, napon belüli idő éjfél óta eltelt ms.
+FORMATS = ("json", "columnar", "binary")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MS = timedelta(milliseconds=1)
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use one of: {', '.join(FORMATS)}.")
+
+
+def _epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MS
+
+
+def _convert_column(values: list) -> list:
+    # Oszloponként egyszer nézzük meg a típust, nem soronként
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, datetime):
+        return [_epoch_ms(v) if v is not None else None for v in values]
+    if isinstance(sample, date):
+        return [(v - date(1970, 1, 1)).days * 86400000 if v is not None else None for v in values]
+    if isinstance(sample, time):
+        return [
+            ((v.hour * 60 + v.minute) * 60 + v.second) * 1000 + v.microsecond // 1000 if v is not None else None
+            for v in values
+        ]
+    if isinstance(sample, Decimal):
+        return [float(v) if v is not None else None for v in values]
+    return values
+
+
+def records_to_columns(rows, columns) -> dict:
+    # asyncpg Record-okból (vagy dict-ekből) közvetlenül oszloptömbök, soronkénti dict nélkül
+    return {name: _convert_column([r[name] for r in rows]) for name in columns}
+
+
+def _flatten(payload: dict, prefix: str = ""):
+    for name, value in payload.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{name}.")
+        else:
+            yield f"{prefix}{name}", value
+
+
+def _pack(values: list) -> bytes:
+    packed = array("d", (
+        float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else math.nan
+        for v in values
+    ))
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), default=str).encode()
+
+
+def columnar_response(payload: dict, fmt: str) -> Response:
+    if fmt == "binary":
+        columns = list(_flatten(payload))
+        body = b"".join(_pack(values) for _, values in columns)
+        header = ",".join(f"{name}:{len(values)}" for name, values in columns)
+        return Response(
+            content=body,
+            media_type="application/octet-stream",
+            headers={"X-Columns": header},
+        )
+    return Response(content=dumps(payload), media_type="application/json")
@@ -0,0 +1,38 @@
+import hashlib
+from fastapi import Request, Response
+
+# Olcsó validátor (pl. a plant legutolsó forrás-időbélyege) alapján feltételes GET:
+# egyező If-None-Match esetén 304, a lekérdezés és szerializálás kimarad.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    # Gyenge összehasonlítás: a W/ előtag nem számít
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or any((c[2:] if c.startswith("W/") else c) == bare for c in candidates)
+
+
+def conditional(request: Request, response: Response, etag: str):
+    # 304-es választ ad vissza, ha a kliens példánya friss; különben beállítja a fejléceket és None
+    if _matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return None
+
+
+def tag(result, etag: str):
+    # Közvetlenül visszaadott Response-ra (pl. oszlopos formátum) a fejlécet itt tesszük rá
+    if isinstance(result, Response):
+        result.headers["ETag"] = etag
+        result.headers["Cache-Control"] = CACHE_CONTROL
+    return result
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import asyncpg
+from metrics import InstrumentedPool
+
+# Adatbázis kapcsolat beállításai környezeti változókból (a régi beégetett értékek az alapértelmezések)
+def connection_kwargs():
+    return {
+        "database": os.getenv("DB_NAME", "aramut"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", "mj46-pr23"),
+        "host": os.getenv("DB_HOST", "100.115.164.70"),
+        "port": os.getenv("DB_PORT", "5432"),
+    }
+
+
+_table_columns = {}
+
+
+async def table_columns(conn, table: str) -> list:
+    # Oszlopok a séma szerinti sorrendben; folyamat élettartamára cache-elve
+    columns = _table_columns.get(table)
+    if columns is None:
+        rows = await conn.fetch("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = $1
+            ORDER BY ordinal_position
+        """, table)
+        columns = _table_columns[table] = [r["column_name"] for r in rows]
+    return columns
+
+
+# Terhelés szerint szétválasztott poolok, hogy egy lassú riport ne foglalja el az élő nézetek elől
+# a kapcsolatokat:
+#   live       – bejelentkezés, legfrissebb értékek, websocketek, dashboard
+#   analytic   – idősorok, hozam tartományok, riasztás napló, export ellenőrzés, string-health
+#   export     – a tömeges export streamjei; egy stream a teljes letöltés alatt fogja a kapcsolatát,
+#                ezért saját, kicsi poolja van, hogy lassú kliensek ne éheztessék az analytic poolt
+#   background – ingest és ütemezett feladatok
+# Minden érték felülírható: DB_POOL_<NÉV>_<KULCS>, pl. DB_POOL_LIVE_MAX_SIZE=20.
+#   min_size / max_size       – kapcsolatok száma; min_size induláskor felépül
+#   statement_timeout_ms      – szerveroldali lekérdezés limit (0 = nincs)
+#   acquire_timeout           – ennyi másodperc várakozás után 503
+#   max_waiters               – ennyi várakozó fölött azonnal 503
+#   statement_cache_size      – kapcsolatonkénti prepared statement cache
+POOL_DEFAULTS = {
+    "live": {
+        "min_size": 2, "max_size": 10, "statement_timeout_ms": 5000,
+        "acquire_timeout": 2.0, "max_waiters": 100, "statement_cache_size": 256,
+    },
+    "analytic": {
+        "min_size": 1, "max_size": 4, "statement_timeout_ms": 60000,
+        "acquire_timeout": 10.0, "max_waiters": 20, "statement_cache_size": 128,
+    },
+    "export": {
+        "min_size": 0, "max_size": 2, "statement_timeout_ms": 60000,
+        "acquire_timeout": 30.0, "max_waiters": 4, "statement_cache_size": 16,
+    },
+    "background": {
+        "min_size": 1, "max_size": 6, "statement_timeout_ms": 0,
+        "acquire_timeout": 30.0, "max_waiters": 100, "statement_cache_size": 64,
+    },
+}
+
+
+def pool_settings(name: str) -> dict:
+    settings = dict(POOL_DEFAULTS[name])
+    for key, default in settings.items():
+        value = os.getenv(f"DB_POOL_{name.upper()}_{key.upper()}")
+        if value is None:
+            continue
+        if value == "" or value.lower() == "none":
+            settings[key] = None
+        else:
+            settings[key] = float(value) if key == "acquire_timeout" else int(value)
+    return settings
+
+
+async def create_pool(name: str, **overrides) -> InstrumentedPool:
+    settings = {**pool_settings(name), **overrides}
+    pool = await asyncpg.create_pool(
+        **connection_kwargs(),
+        min_size=settings["min_size"],
+        max_size=settings["max_size"],
+        statement_cache_size=settings["statement_cache_size"],
+        server_settings={
+            "application_name": f"webapp-{name}",
+            "statement_timeout": str(settings["statement_timeout_ms"] or 0),
+        },
+    )
+    instrumented = InstrumentedPool(
+        pool, name, max_waiters=settings["max_waiters"], acquire_timeout=settings["acquire_timeout"]
+    )
+    await warm_up(instrumented, settings["min_size"])
+    return instrumented
+
+
+async def warm_up(pool, count: int):
+    # min_size kapcsolat egyszerre kivéve és megpingelve, hogy az első kérések ne a
+    # kapcsolatépítést és a session beállítást fizessék
+    async def ping():
+        async with pool.acquire() as conn:
+            await conn.fetchval("SELECT 1")
+    await asyncio.gather(*(ping() for _ in range(count)))
+
+
+async def create_pools(names=tuple(POOL_DEFAULTS)) -> dict:
+    pools = await asyncio.gather(*(create_pool(name) for name in names))
+    return dict(zip(names, pools))
@@ -0,0 +1,79 @@
+import math
+
+# Előre definiált idővödrök a production-data végponthoz (másodpercben)
+RESOLUTIONS = {
+    "1m": 60,
+    "5m": 5 * 60,
+    "15m": 15 * 60,
+    "30m": 30 * 60,
+    "1h": 60 * 60,
+}
+
+
+def power_series_query(table: str, bucketed: bool) -> str:
+    # A production-data nyers ($1 plant, [$2, $3) tartomány) vagy $4 másodperces vödrös lekérdezése
+    if not bucketed:
+        return f"""
+            SELECT timestamp, active_power
+            FROM {table}
+            WHERE plant_id = $1
+              AND timestamp >= $2 AND timestamp < $3
+            ORDER BY timestamp
+        """
+    return f"""
+        SELECT
+            to_timestamp(floor(extract(epoch FROM timestamp) / $4) * $4) AT TIME ZONE 'UTC' AS timestamp,
+            AVG(active_power) AS active_power,
+            MIN(active_power) AS min,
+            MAX(active_power) AS max,
+            COUNT(active_power) AS samples
+        FROM {table}
+        WHERE plant_id = $1
+          AND timestamp >= $2 AND timestamp < $3
+        GROUP BY 1
+        ORDER BY 1
+    """
+
+
+def bucket_seconds_for(span_seconds: float, max_points: int) -> int:
+    # A legkisebb egész másodperces vödör, amellyel a tartomány belefér max_points pontba
+    return max(1, math.ceil(span_seconds / max_points))
+
+
+def lttb(points, threshold: int, x_key: str = "timestamp", y_key: str = "active_power"):
+    # Largest-Triangle-Three-Buckets: a görbe alakját megtartó ritkítás
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+
+    xs = [p[x_key].timestamp() for p in points]
+    ys = [float(p[y_key]) if p[y_key] is not None else 0.0 for p in points]
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        avg_start = int(math.floor((i + 1) * every)) + 1
+        avg_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_len = max(avg_end - avg_start, 1)
+        avg_x = sum(xs[avg_start:avg_end]) / avg_len
+        avg_y = sum(ys[avg_start:avg_end]) / avg_len
+
+        range_start = int(math.floor(i * every)) + 1
+        range_end = int(math.floor((i + 1) * every)) + 1
+
+        ax, ay = xs[a], ys[a]
+        max_area = -1.0
+        next_a = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+
+        sampled.append(points[next_a])
+        a = next_a
+
+    sampled.append(points[-1])
+    return sampled
@@ -0,0 +1,302 @@
+import csv
+import io
+import os
+import re
+from datetime import datetime, timezone
+from decimal import Decimal
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from auth import get_current_user
+from columnar import dumps
+from cold_storage import arrow_schema, cold_segments, iter_cold, records_to_table, table_rows
+from db_config import table_columns
+from metrics import PoolBusy
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # a parquet export opcionális
+    pa = None
+    pq = None
+
+# Tömeges telemetria export szerveroldali kurzorral. A sorok EXPORT_CHUNK_ROWS méretű
+# darabokban jönnek az adatbázisból és darabonként mennek ki, így a memóriahasználat a
+# tartomány hosszától független. A következő darabot csak akkor kérjük le, ha az előzőt a
+# kliens átvette (a send() a szerver írási pufferéig blokkol). Ha a kliens lekapcsolódik,
+# a generátor megszakad, a tranzakció visszagörög, a kurzor bezárul, a kapcsolat visszamegy a poolba.
+# A hideg tárba archivált hónapok (cold_storage.py) hónaponként a Parquet fájlokból jönnek.
+# Az ellenőrzések a db_pool-on (analytic), a streamek a saját kicsi stream_pool-jukon futnak
+# (db_config "export"): egy lassú letöltés csak egy export kapcsolatot foglal, az idősorokét nem.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+SERIES = {
+    "logger": ("logger_data", "plant_id"),
+    "meter": ("meter_data", "plant_id"),
+    "production": ("alteo_data", "plant_id"),
+    "inverter": ("inverter_data", "inverter_id"),
+}
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_STRING_COLUMN = re.compile(r"^string_(\d+)_([va])$")
+
+export_router = APIRouter()
+db_pool = None
+stream_pool = None
+
+def set_db_pool(pool, export_pool=None):
+    global db_pool, stream_pool
+    db_pool = pool
+    stream_pool = export_pool or pool
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+async def _check_access(conn, current_user: dict, plant_id: int):
+    if current_user["role"] == "admin":
+        return
+    allowed = await conn.fetchval(
+        "SELECT 1 FROM user_plant_access WHERE user_id = $1 AND plant_id = $2",
+        current_user["id"], plant_id
+    )
+    if not allowed:
+        raise HTTPException(status_code=403, detail="No access to this plant.")
+
+
+def _select_columns(available, key, columns, strings, quantities):
+    plain = [c for c in available if not _STRING_COLUMN.match(c) and c not in ("id", key, "timestamp")]
+    if columns:
+        unknown = [c for c in columns if c not in plain]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}.")
+        plain = [c for c in plain if c in columns]
+
+    string_columns = []
+    if strings is not None or quantities is not None:
+        quantities = quantities or ["v", "a"]
+        if not set(quantities) <= {"v", "a"}:
+            raise HTTPException(status_code=400, detail="Invalid quantity. Use v or a.")
+        for column in available:
+            match = _STRING_COLUMN.match(column)
+            if match and (strings is None or int(match.group(1)) in strings) and match.group(2) in quantities:
+                string_columns.append(column)
+        if not string_columns:
+            raise HTTPException(status_code=400, detail="No matching string columns.")
+    elif columns is None:
+        string_columns = [c for c in available if _STRING_COLUMN.match(c)]
+
+    return [key, "timestamp"] + plain + string_columns
+
+
+def _float_decimals(rows):
+    # NUMERIC oszlopok Decimal értékei float-ra (az orjson nem szerializálja; a parquet ágon a
+    # records_to_table teszi ugyanezt); oszloponként egyszer nézzük meg a típust, mint a columnar.py-ban
+    if not rows:
+        return rows
+    decimal_columns = {
+        i for i in range(len(rows[0]))
+        if isinstance(next((row[i] for row in rows if row[i] is not None), None), Decimal)
+    }
+    if not decimal_columns:
+        return rows
+    return [
+        tuple(float(v) if i in decimal_columns and v is not None else v for i, v in enumerate(row))
+        for row in rows
+    ]
+
+
+class _CsvEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self) -> bytes:
+        self.writer.writerow(self.columns)
+        return self._drain()
+
+    def encode(self, rows) -> bytes:
+        self.writer.writerows(
+            [v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows
+        )
+        return self._drain()
+
+    def close(self) -> bytes:
+        return b""
+
+    def _drain(self) -> bytes:
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, rows) -> bytes:
+        return b"".join(dumps(dict(zip(self.columns, row))) + b"\n" for row in _float_decimals(rows))
+
+    def close(self) -> bytes:
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    # Csak hozzáfűzhető kimenet; a tell() a teljes kiírt hosszt adja, mert a parquet
+    # lábléc abszolút offseteket tartalmaz, miközben a puffert darabonként ürítjük
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class _ParquetEncoder:
+    # A parquet fájl hozzáfűzéssel íródik (a lábléc a végén), így darabonként egy row group
+    # megy ki, nem kell az egész fájlt pufferelni
+    def __init__(self, columns, types):
+        self.schema = arrow_schema(columns, types)
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(pa.PythonFile(self.sink, mode="w"), self.schema, compression="zstd")
+
+    def header(self) -> bytes:
+        return self._drain()
+
+    def encode(self, rows) -> bytes:
+        self.writer.write_table(records_to_table(rows, self.schema))
+        return self._drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        return self.sink.drain()
+
+
+async def _stream_export(format, table, key, key_values, columns, segments, plant_id, label):
+    query = f"""
+        SELECT {", ".join(columns)}
+        FROM {table}
+        WHERE {key} = $1 AND timestamp >= $2 AND timestamp < $3
+        ORDER BY timestamp
+    """
+    rows_sent = 0
+    completed = False
+    try:
+        async with stream_pool.acquire() as conn:
+            # Kulcsonként (erőmű vagy inverter) külön kurzor: a (kulcs, timestamp) index
+            # rendezett sorrendben adja a sorokat, nincs nagy rendezés a szerveren
+            async with conn.transaction(readonly=True):
+                statement = await conn.prepare(query)
+                if format == "csv":
+                    encoder = _CsvEncoder(columns)
+                elif format == "ndjson":
+                    encoder = _NdjsonEncoder(columns)
+                else:
+                    encoder = _ParquetEncoder(columns, [a.type.name for a in statement.get_attributes()])
+
+                yield encoder.header()
+                for key_value in key_values:
+                    # Az archivált hónapok a hideg tárból, a többi a kurzorból, időrendben
+                    for segment_start, segment_end, cold in segments:
+                        if cold:
+                            async for data in iter_cold(conn, table, plant_id, segment_start, segment_end, columns,
+                                                        key_values=[key_value] if key == "inverter_id" else None):
+                                for offset in range(0, data.num_rows, EXPORT_CHUNK_ROWS):
+                                    rows = table_rows(data.slice(offset, EXPORT_CHUNK_ROWS))
+                                    rows_sent += len(rows)
+                                    yield encoder.encode(rows)
+                            continue
+                        cursor = await statement.cursor(key_value, segment_start, segment_end)
+                        while True:
+                            rows = await cursor.fetch(EXPORT_CHUNK_ROWS)
+                            if not rows:
+                                break
+                            rows_sent += len(rows)
+                            yield encoder.encode(rows)
+                yield encoder.close()
+        completed = True
+    finally:
+        if not completed:
+            print(f"Export megszakadt ({label}, {rows_sent} sor után)")
+
+
+@export_router.get("/api/plant/{plant_id}/export")
+async def export_telemetry(
+    plant_id: int,
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    series: str = Query("logger"),
+    format: str = Query("csv"),
+    inverter_id: list[int] = Query(None),
+    columns: list[str] = Query(None),
+    strings: list[int] = Query(None),
+    quantities: list[str] = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    if series not in SERIES:
+        raise HTTPException(status_code=400, detail=f"Invalid series. Use one of: {', '.join(SERIES)}.")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}.")
+    if format == "parquet" and pa is None:
+        raise HTTPException(status_code=400, detail="Parquet export is not available (pyarrow is not installed).")
+    start, end = _naive_utc(start), _naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start.")
+    if series != "inverter" and (strings is not None or quantities is not None or inverter_id):
+        raise HTTPException(status_code=400, detail="strings, quantities and inverter_id apply to the inverter series only.")
+
+    table, key = SERIES[series]
+    # Ellenőrzés a stream indulása előtt, hogy a hibák rendes HTTP választ kapjanak
+    async with db_pool.acquire() as conn:
+        await _check_access(conn, current_user, plant_id)
+        selected = _select_columns(await table_columns(conn, table), key, columns, strings, quantities)
+
+        if series == "inverter":
+            rows = await conn.fetch("SELECT id FROM inverters WHERE plant_id = $1 ORDER BY id", plant_id)
+            key_values = [r["id"] for r in rows]
+            if inverter_id:
+                if not set(inverter_id) <= set(key_values):
+                    raise HTTPException(status_code=404, detail="Inverter not found for this plant.")
+                key_values = [i for i in key_values if i in inverter_id]
+        else:
+            key_values = [plant_id]
+        segments = await cold_segments(conn, table, plant_id, start, end)
+
+    # A stream a fejlécek elküldése után kér kapcsolatot; tele várakozási sornál inkább most 503
+    if stream_pool.max_waiters is not None and stream_pool.waiting >= stream_pool.max_waiters:
+        raise PoolBusy(stream_pool.name, "queue full")
+
+    filename = f"{series}_{plant_id}_{start:%Y%m%d}_{end:%Y%m%d}.{format}"
+    return StreamingResponse(
+        _stream_export(format, table, key, key_values, selected, segments, plant_id, filename),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
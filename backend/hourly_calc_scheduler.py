@@ -1,24 +1,12 @@
-import schedule
-import time
 import asyncio
-from calculate_inverters_hourly_avg import calculate_weekly_hourly_avg, init_db
+import sys
+from scheduler import main
 
-async def run_task():
-    print("⚡ Initializing database connection...")
-    await init_db()
-    print("⚡ Running scheduled hourly average calculation...")
-    await calculate_weekly_hourly_avg()
-    print("✅ Calculation complete.")
-
-schedule.every().day.at("02:00").do(lambda: asyncio.run(run_task()))
+# Régi belépési pont; az ütemezés a scheduler.py-ban van.
+#   python hourly_calc_scheduler.py           → python scheduler.py
+#   python hourly_calc_scheduler.py run_now   → python scheduler.py run string_rollup
 
 if __name__ == "__main__":
-    import sys
     if len(sys.argv) > 1 and sys.argv[1] == "run_now":
-        print("🔄 Manually triggered calculation...")
-        asyncio.run(run_task())
-    else:
-        print("⏳ Waiting for the scheduled time...")
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
+        sys.argv = [sys.argv[0], "run", "string_rollup"]
+    asyncio.run(main())
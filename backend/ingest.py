@@ -0,0 +1,238 @@
+import asyncio
+import hmac
+import os
+from collections import defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel, Field
+from db_config import table_columns
+from metrics import alarm_transitions, ingest_rows
+
+# SmartLogger adatgyűjtők írási útvonala. Egy kérés sok logger sok mintáját viszi;
+# a telemetria COPY-val megy be táblánként, a riasztás regiszterekből csak a tényleges
+# felfutás/lecsengés kerül a logger_alarm_status / logger_alarm_log táblákba.
+# Hitelesítés: X-Ingest-Token fejléc az INGEST_TOKEN környezeti változóval; ha nincs beállítva,
+# a végpont ki van kapcsolva.
+INGEST_TOKEN = os.getenv("INGEST_TOKEN")
+MAX_BATCH_SAMPLES = int(os.getenv("INGEST_MAX_BATCH", "10000"))
+
+ingest_router = APIRouter()
+db_pool = None
+
+def set_db_pool(pool):
+    global db_pool
+    db_pool = pool
+
+
+class PlantSample(BaseModel):
+    plant_id: int
+    timestamp: datetime
+    values: dict[str, Optional[float]] = {}
+
+
+class LoggerSample(PlantSample):
+    # Nyers Modbus riasztás regiszterek (50000, 50001, ...) → 16 bites érték
+    alarm_registers: dict[int, int] = {}
+
+
+class InverterSample(BaseModel):
+    inverter_id: int
+    timestamp: datetime
+    values: dict[str, Optional[float]] = {}
+
+
+class IngestBatch(BaseModel):
+    logger: list[LoggerSample] = Field(default_factory=list)
+    meter: list[PlantSample] = Field(default_factory=list)
+    production: list[PlantSample] = Field(default_factory=list)
+    inverter: list[InverterSample] = Field(default_factory=list)
+
+
+TARGETS = {
+    "logger": ("logger_data", "plant_id"),
+    "meter": ("meter_data", "plant_id"),
+    "production": ("alteo_data", "plant_id"),
+    "inverter": ("inverter_data", "inverter_id"),
+}
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _check_token(token: Optional[str]):
+    if not INGEST_TOKEN:
+        raise HTTPException(status_code=503, detail="Ingestion is disabled.")
+    if not token or not hmac.compare_digest(token, INGEST_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid ingest token")
+
+
+class AlarmState:
+    # Erőművenként regiszter → utoljára látott 16 bites szó. Egy szó XOR-ja az előzővel
+    # egyszerre mind a 16 bitet összeveti; csak a nem nulla különbségű szavakat bontjuk bitekre.
+    # Egy plant szavait egyszerre csak egy köteg használja: a hold() a hívó tranzakciójának végéig
+    # fogja a plant zárját, így a következő köteg már a commitolt (vagy visszaállított) állapotot látja.
+    def __init__(self):
+        self.words = {}
+        self.locks = defaultdict(asyncio.Lock)
+
+    @asynccontextmanager
+    async def hold(self, plant_ids):
+        # Rendezett sorrendben zárunk, hogy két köteg ne várjon egymásra körbe
+        plant_ids = sorted(set(plant_ids))
+        async with AsyncExitStack() as stack:
+            for plant_id in plant_ids:
+                await stack.enter_async_context(self.locks[plant_id])
+            try:
+                yield
+            except BaseException:
+                # Visszagörgetés után a memóriabeli szavak a commitolt státuszból töltődnek újra
+                for plant_id in plant_ids:
+                    self.forget(plant_id)
+                raise
+
+    async def _load(self, conn, plant_ids):
+        missing = [pid for pid in plant_ids if pid not in self.words]
+        if not missing:
+            return
+        rows = await conn.fetch("""
+            SELECT plant_id, register, bit
+            FROM logger_alarm_status
+            WHERE plant_id = ANY($1::int[]) AND is_active = TRUE
+        """, missing)
+        for pid in missing:
+            self.words[pid] = {}
+        for row in rows:
+            words = self.words[row["plant_id"]]
+            words[row["register"]] = words.get(row["register"], 0) | (1 << row["bit"])
+
+    @staticmethod
+    def diff(words: dict, samples):
+        # A minták időrendben; a words-öt helyben frissíti, a változásokat listában adja
+        transitions = []
+        for sample in samples:
+            timestamp = _naive_utc(sample.timestamp)
+            for register, value in sample.alarm_registers.items():
+                previous = words.get(register, 0)
+                changed = previous ^ value
+                while changed:
+                    low = changed & -changed
+                    transitions.append((register, low.bit_length() - 1, bool(value & low), timestamp))
+                    changed ^= low
+                words[register] = value
+        return transitions
+
+    async def apply(self, conn, samples_by_plant: dict) -> int:
+        # A hívó a hold()-dal fogja az érintett plantokat
+        await self._load(conn, list(samples_by_plant))
+        new_words = {}
+        transitions = []
+        for plant_id, samples in samples_by_plant.items():
+            words = dict(self.words[plant_id])
+            for register, bit, active, timestamp in self.diff(words, samples):
+                transitions.append((plant_id, register, bit, active, timestamp))
+            new_words[plant_id] = words
+
+        if transitions:
+            await _write_transitions(conn, transitions)
+        # Az állapot csak sikeres írás után lép tovább; ha a hívó tranzakciója a végén mégis
+        # visszagörög, a hold() dobja el az érintett plantokat
+        self.words.update(new_words)
+        return len(transitions)
+
+    def forget(self, plant_id: int = None):
+        if plant_id is None:
+            self.words.clear()
+        else:
+            self.words.pop(plant_id, None)
+
+
+alarm_state = AlarmState()
+
+
+async def _write_transitions(conn, transitions):
+    # Egy kulcs egy kötegen belül többször is változhat: a státuszba a legutolsó kerül,
+    # a naplóba mind
+    latest = {}
+    for plant_id, register, bit, active, timestamp in transitions:
+        latest[(plant_id, register, bit)] = (active, timestamp)
+
+    async with conn.transaction():
+        await conn.copy_records_to_table(
+            "logger_alarm_log",
+            records=[
+                (plant_id, register, bit, "started" if active else "ended", timestamp)
+                for plant_id, register, bit, active, timestamp in transitions
+            ],
+            columns=["plant_id", "register", "bit", "event_type", "timestamp"],
+        )
+        keys = list(latest)
+        await conn.execute("""
+            INSERT INTO logger_alarm_status (plant_id, register, bit, is_active, last_updated)
+            SELECT * FROM unnest($1::int[], $2::int[], $3::int[], $4::bool[], $5::timestamp[])
+            ON CONFLICT (plant_id, register, bit) DO UPDATE
+            SET is_active = EXCLUDED.is_active, last_updated = EXCLUDED.last_updated
+        """,
+            [k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys],
+            [latest[k][0] for k in keys], [latest[k][1] for k in keys])
+        # Az alarm_hub követője commitkor ébred, nem várja ki a következő olvasási kört
+        await conn.execute("SELECT pg_notify('alarm_events', '')")
+
+    for _, _, _, active, _ in transitions:
+        alarm_transitions.inc("raised" if active else "cleared")
+
+
+async def _copy_samples(conn, kind: str, samples) -> int:
+    table, key = TARGETS[kind]
+    allowed = set(await table_columns(conn, table)) - {"id", key, "timestamp"}
+
+    # Azonos oszlopkészletű minták egy COPY-ba
+    groups = defaultdict(list)
+    for sample in samples:
+        unknown = set(sample.values) - allowed
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown {table} columns: {', '.join(sorted(unknown))}.")
+        columns = tuple(sorted(sample.values))
+        groups[columns].append(
+            (getattr(sample, key), _naive_utc(sample.timestamp), *(sample.values[c] for c in columns))
+        )
+
+    for columns, records in groups.items():
+        await conn.copy_records_to_table(table, records=records, columns=[key, "timestamp", *columns])
+    ingest_rows.inc(table, amount=len(samples))
+    return len(samples)
+
+
+@ingest_router.post("/api/ingest/smartlogger")
+async def ingest_smartlogger(batch: IngestBatch, x_ingest_token: Optional[str] = Header(None)):
+    _check_token(x_ingest_token)
+    total = sum(len(getattr(batch, kind)) for kind in TARGETS)
+    if total > MAX_BATCH_SAMPLES:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SAMPLES} samples).")
+    for sample in batch.logger:
+        for register, value in sample.alarm_registers.items():
+            if not 0 <= value <= 0xFFFF:
+                raise HTTPException(status_code=400, detail=f"Register {register} value out of range.")
+
+    samples_by_plant = defaultdict(list)
+    for sample in sorted(batch.logger, key=lambda s: _naive_utc(s.timestamp)):
+        if sample.alarm_registers:
+            samples_by_plant[sample.plant_id].append(sample)
+
+    rows = {}
+    async with db_pool.acquire() as conn:
+        # Telemetria és riasztás átmenetek egy tranzakcióban: vagy mind bekerül, vagy egyik sem.
+        # A plantok riasztás állapota a commitig (vagy visszagörgetésig) zárolva marad
+        async with alarm_state.hold(samples_by_plant):
+            async with conn.transaction():
+                for kind in TARGETS:
+                    samples = getattr(batch, kind)
+                    if samples:
+                        rows[TARGETS[kind][0]] = await _copy_samples(conn, kind, samples)
+                transitions = await alarm_state.apply(conn, samples_by_plant) if samples_by_plant else 0
+
+    return {"rows": rows, "alarm_transitions": transitions}
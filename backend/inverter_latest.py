@@ -0,0 +1,111 @@
+# Inverterenként a legutolsó inverter_data sor, karbantartott táblában.
+# Az inverter_data-ra tett utasításszintű trigger (transition table) minden INSERT/COPY után
+# upserteli, íróktól függetlenül (ingest végpont, külső gyűjtő). A string értékek
+# max_string_count hosszú tömbökben vannak, a nem használt string_N oszlopok nem kerülnek be.
+# A létrehozás a migrate.py "inverter_latest" lépése; induláskor (és partícionálás után) az
+# ensure_schema csak a katalógust nézi, és csak a hiányzó részt pótolja.
+
+# A forrás sorokból (alias: n, inverters: i) képzett oszlopok; a trigger és a backfill is ezt használja
+_PROJECTION = """
+    n.inverter_id,
+    n.timestamp,
+    n.active_power,
+    ARRAY(
+        SELECT (to_jsonb(n) ->> format('string_%s_v', g))::DOUBLE PRECISION
+        FROM generate_series(1, i.max_string_count) g ORDER BY g
+    ),
+    ARRAY(
+        SELECT (to_jsonb(n) ->> format('string_%s_a', g))::DOUBLE PRECISION
+        FROM generate_series(1, i.max_string_count) g ORDER BY g
+    )
+"""
+
+_UPSERT = """
+    ON CONFLICT (inverter_id) DO UPDATE
+    SET timestamp = EXCLUDED.timestamp,
+        active_power = EXCLUDED.active_power,
+        string_v = EXCLUDED.string_v,
+        string_a = EXCLUDED.string_a
+    WHERE inverter_latest.timestamp <= EXCLUDED.timestamp
+"""
+
+
+async def _trigger_exists(conn) -> bool:
+    return await conn.fetchval("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_trigger
+            WHERE tgrelid = to_regclass('inverter_data') AND tgname = 'inverter_latest_refresh'
+        )
+    """)
+
+
+async def ensure_schema(conn) -> bool:
+    # Ha a tábla és a trigger megvan, csak olvas; a trigger az inverter_data-t záró DDL, a backfill
+    # pedig minden inverter utolsó sorát olvassa, ezért csak hiányuk esetén futnak
+    if await conn.fetchval("SELECT to_regclass('inverter_latest')") and await _trigger_exists(conn):
+        return False
+    async with conn.transaction():
+        # Több worker indulhat egyszerre; a létrehozás ne fusson párhuzamosan
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('inverter_latest'))")
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS inverter_latest (
+                inverter_id  INTEGER PRIMARY KEY,
+                timestamp    TIMESTAMP NOT NULL,
+                active_power DOUBLE PRECISION,
+                string_v     DOUBLE PRECISION[] NOT NULL,
+                string_a     DOUBLE PRECISION[] NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS inverter_latest_timestamp ON inverter_latest (timestamp);
+        """)
+        if await _trigger_exists(conn):
+            return False
+
+        await conn.execute(f"""
+            CREATE OR REPLACE FUNCTION inverter_latest_upsert() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                INSERT INTO inverter_latest (inverter_id, timestamp, active_power, string_v, string_a)
+                SELECT {_PROJECTION}
+                FROM (
+                    SELECT DISTINCT ON (inverter_id) *
+                    FROM new_rows
+                    ORDER BY inverter_id, timestamp DESC
+                ) n
+                JOIN inverters i ON i.id = n.inverter_id
+                {_UPSERT};
+                RETURN NULL;
+            END
+            $$;
+
+            CREATE TRIGGER inverter_latest_refresh
+                AFTER INSERT ON inverter_data
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION inverter_latest_upsert();
+        """)
+
+        # Csak üres táblát töltünk fel (inverterenként egy indexelt LIMIT 1); ha már van tartalma
+        # (pl. partícionálás után új a trigger), az új inverterek első sorát a trigger hozza
+        if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM inverter_latest)"):
+            return True
+        await conn.execute(f"""
+            INSERT INTO inverter_latest (inverter_id, timestamp, active_power, string_v, string_a)
+            SELECT {_PROJECTION}
+            FROM inverters i
+            CROSS JOIN LATERAL (
+                SELECT * FROM inverter_data
+                WHERE inverter_id = i.id
+                ORDER BY timestamp DESC
+                LIMIT 1
+            ) n
+            {_UPSERT}
+        """)
+    return True
+
+
+def string_columns(row) -> dict:
+    # A frontend string_N_v / string_N_a kulcsokat vár
+    columns = {}
+    for index, (voltage, current) in enumerate(zip(row["string_v"], row["string_a"]), start=1):
+        columns[f"string_{index}_v"] = voltage
+        columns[f"string_{index}_a"] = current
+    return columns
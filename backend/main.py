@@ -1,21 +1,53 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, APIRouter, Depends, Query, Request
+from fastapi import FastAPI, HTTPException, WebSocket, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from smartlogger_alarms import alarm_definitions
-from collections import Counter
-import asyncpg
+from fastapi.middleware.gzip import GZipMiddleware
+from alarm_index import fetch_severity_counts, keys_for as alarm_keys_for, describe as describe_alarm
+from collections import Counter, defaultdict
 import asyncio
+import base64
+import hmac
+import json
+import os
 from datetime import datetime, timedelta, timezone, time
+from decimal import Decimal
 from auth import auth_router, set_db_pool, get_current_user
-from weather import weather_router, set_db_pool as set_weather_pool
+from weather import weather_router, set_db_pool as set_weather_pool, start_client as start_weather_client, close_client as close_weather_client
+from production_hub import ProductionHub, set_db_pool as set_production_hub_pool
+from alarm_hub import AlarmHub, set_db_pool as set_alarm_hub_pool
+from export import export_router, set_db_pool as set_export_pool
+from ingest import ingest_router, set_db_pool as set_ingest_pool
+from snapshot_cache import snapshot_store
+from string_profile import profile_store
+from downsampling import RESOLUTIONS, bucket_seconds_for, lttb, power_series_query
+from db_config import create_pools
+from cold_storage import ColdStorageUnavailable, bucket_power, cold_segments, read_cold, table_rows, ensure_schema as ensure_cold_schema
+from metrics import MetricsMiddleware, PoolBusy, metrics_response
+from conditional import conditional, make_etag, tag
+from columnar import check_format, columnar_response, records_to_columns
+from yield_rollup import yield_series, ensure_schema as ensure_yield_schema
+from inverter_latest import ensure_schema as ensure_inverter_latest_schema
+from string_health import ensure_schema as ensure_string_health_schema
+from scheduler import SCHEDULER_ENABLED, Scheduler
 from zoneinfo import ZoneInfo
 from pydantic import BaseModel
 
 
 app = FastAPI()
-router = APIRouter()
 
 app.include_router(auth_router)
 app.include_router(weather_router)
+app.include_router(export_router)
+app.include_router(ingest_router)
+
+app.add_middleware(MetricsMiddleware)
+
+# Nagy válaszok tömörítése; brotli, ha a csomag elérhető, különben gzip
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1024)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,70 +55,149 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Columns", "ETag", "Content-Disposition"],
 )
 
+# db_pool: élő nézetek (live), analytic_pool: nehéz idősor/riport lekérdezések,
+# export_pool: export streamek, background_pool: ingest és ütemező – lásd db_config.POOL_DEFAULTS
 db_pool = None
+analytic_pool = None
+export_pool = None
+background_pool = None
+
+@app.exception_handler(PoolBusy)
+async def pool_busy_handler(request: Request, exc: PoolBusy):
+    # Telített pool: gyors 503, nem sorban állás
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ColdStorageUnavailable)
+async def cold_storage_unavailable_handler(request: Request, exc: ColdStorageUnavailable):
+    # Archivált hónapot érintő kérés, de a hideg tár nem olvasható ebben a folyamatban
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+# Dashboard végpontok: egy kérésen belül legfeljebb ennyi lekérdezés fut párhuzamosan (ennyi
+# pool kapcsolatot foglal), és egy szekció legfeljebb ennyi másodpercig várhat. Az idősor és hozam
+# szekciók az analytic poolon futnak, a live poolon csak a rövid plant / riasztás lekérdezések
+DASHBOARD_CONCURRENCY = int(os.getenv("DASHBOARD_CONCURRENCY", "4"))
+DASHBOARD_SECTION_TIMEOUT = float(os.getenv("DASHBOARD_SECTION_TIMEOUT", "10"))
+DASHBOARD_SECTIONS = ("plant", "logger", "meter", "production", "daily_yield", "alarms")
 
 @app.on_event("startup")
 async def startup():
-    global db_pool
-    db_pool = await asyncpg.create_pool(
-        database="aramut",
-        user="postgres",
-        password="mj46-pr23",
-        host="100.115.164.70",
-        port="5432",
-        min_size=1,
-        max_size=10
+    global db_pool, analytic_pool, export_pool, background_pool
+    pools = await create_pools()
+    db_pool, analytic_pool, export_pool, background_pool = (
+        pools["live"], pools["analytic"], pools["export"], pools["background"]
     )
     set_db_pool(db_pool)
     set_weather_pool(db_pool)
+    await start_weather_client()
+    set_production_hub_pool(db_pool)
+    set_alarm_hub_pool(db_pool)
+    set_export_pool(analytic_pool, export_pool)
+    set_ingest_pool(background_pool)
+    snapshot_store.set_db_pool(db_pool)
+    profile_store.set_db_pool(analytic_pool)
+    await profile_store.start()
+
+    async with background_pool.acquire() as conn:
+        await ensure_yield_schema(conn)
+        await ensure_inverter_latest_schema(conn)
+        await ensure_string_health_schema(conn)
+        await ensure_cold_schema(conn)
+
+    if SCHEDULER_ENABLED:
+        scheduler.pool = background_pool
+        await scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await db_pool.close()
+    await scheduler.stop()
+    await production_hub.close()
+    await alarm_hub.close()
+    await profile_store.close()
+    await close_weather_client()
+    for pool in (db_pool, analytic_pool, export_pool, background_pool):
+        await pool.close()
 
-active_connections = set()
+# Plantonkénti közös lekérdező a production websocketekhez
+production_hub = ProductionHub()
+# Riasztás események követése, feliratkozott plantonként szűrve
+alarm_hub = AlarmHub()
+# Háttérfeladatok az app poolján (csak SCHEDULER_ENABLED=1 esetén indul)
+scheduler = Scheduler(None)
 
-@router.get("/api/plant/{plant_id}/hourly-avg")
-async def get_string_hourly_avg(plant_id: int):
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT inverter_id, string_number, hourly_avg_power, calculation_hour, calculation_date
-            FROM string_weekly_hourly_avg
-            WHERE plant_id = $1
-            ORDER BY calculation_date DESC, calculation_hour DESC
-            LIMIT 168  -- 7 nap * 24 óra = 168 rekord
-        """, plant_id)
+async def _string_profile(plant_id: int, inverter_id):
+    profile = await profile_store.get(plant_id)
+    if inverter_id is not None and inverter_id not in profile.index:
+        raise HTTPException(status_code=404, detail="Inverter not found.")
+    return profile
 
-    return [dict(row) for row in rows]
+@app.get("/api/plant/{plant_id}/hourly-avg")
+async def get_string_hourly_avg(
+    plant_id: int,
+    request: Request,
+    response: Response,
+    inverter_id: int = Query(None),
+    format: str = Query("json"),
+    current_user: dict = Depends(get_current_user),
+):
+    # A teljes (inverter × string × 24 óra) profil memóriából, opcionálisan egy inverterre szeletelve
+    check_format(format)
+    profile = await _string_profile(plant_id, inverter_id)
+    etag = make_etag("hourly-avg", plant_id, profile.version, inverter_id, format)
+    cached = conditional(request, response, etag)
+    if cached:
+        return cached
+
+    if format != "json":
+        columns = ["inverter_id", "string_number", "calculation_hour", "hourly_avg_power"]
+        return tag(columnar_response(records_to_columns(profile.rows(inverter_id), columns), format), etag)
+    return tag(Response(content=profile.payload(inverter_id), media_type="application/json"), etag)
 
 @app.websocket("/ws/plant/{plant_id}/production")
 async def websocket_production_data(websocket: WebSocket, plant_id: int):
     await websocket.accept()
-    active_connections.add(websocket)
+    # Első üzenet: utolsó 30 pont (snapshot), utána csak az új pontok (delta)
+    await production_hub.serve(websocket, plant_id)
 
+def _stream_plant_ids(plant_ids: str):
+    if not plant_ids:
+        return set()
     try:
-        while True:
-            async with db_pool.acquire() as conn:
-                rows = await conn.fetch("""
-                    SELECT timestamp, prod_power
-                    FROM alteo_data
-                    WHERE plant_id = $1
-                    ORDER BY timestamp DESC
-                    LIMIT 30
-                """, plant_id)
-
-                production_data = [
-                    {"timestamp": row["timestamp"].isoformat(), "prod_power": row["prod_power"]}
-                    for row in rows
-                ]
+        return {int(pid) for pid in plant_ids.split(",") if pid.strip()}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid plant_ids.")
 
-            await websocket.send_json(production_data)
-            await asyncio.sleep(1)
+@app.websocket("/ws/alarms")
+async def websocket_alarms(websocket: WebSocket, token: str = Query(...), plant_ids: str = Query(None)):
+    # A böngésző websocket nem küld Authorization fejlécet, a token query paraméterben jön.
+    # Plant lista nélkül minden látható plantra feliratkozik; később
+    # {"action": "subscribe" | "unsubscribe", "plant_ids": [...]} üzenettel módosítható
+    try:
+        current_user = await get_current_user(token)
+        requested = _stream_plant_ids(plant_ids)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    async with db_pool.acquire() as conn:
+        visible = await _visible_plant_ids(conn, current_user)
+    await websocket.accept()
+    await alarm_hub.serve_websocket(websocket, visible, requested)
 
-    except WebSocketDisconnect:
-        active_connections.remove(websocket)
+@app.get("/api/alarms/stream")
+async def stream_alarms(plant_ids: str = Query(None), current_user: dict = Depends(get_current_user)):
+    # Server-Sent Events: ugyanazok az üzenetek, mint a /ws/alarms csatornán
+    requested = _stream_plant_ids(plant_ids)
+    async with db_pool.acquire() as conn:
+        visible = await _visible_plant_ids(conn, current_user)
+    if not requested <= visible:
+        raise HTTPException(status_code=403, detail="No access to one or more plants.")
+    return StreamingResponse(
+        alarm_hub.sse_events(visible, requested),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 
@@ -97,36 +208,29 @@ async def get_plants(current_user: dict = Depends(get_current_user)):
     async with db_pool.acquire() as conn:
         if role == "admin":
             query = """
-                SELECT
-                    p.id,
-                    p.name,
-                    MAX(pd.timestamp) AS last_updated
+                SELECT p.id, p.name
                 FROM plants p
-                LEFT JOIN logger_data pd ON pd.plant_id = p.id
-                GROUP BY p.id, p.name
                 ORDER BY p.name;
             """
             rows = await conn.fetch(query)
         else:
             query = """
-                SELECT
-                    p.id,
-                    p.name,
-                    MAX(pd.timestamp) AS last_updated
+                SELECT p.id, p.name
                 FROM plants p
                 JOIN user_plant_access upa ON upa.plant_id = p.id
-                LEFT JOIN logger_data pd ON pd.plant_id = p.id
                 WHERE upa.user_id = $1
-                GROUP BY p.id, p.name
                 ORDER BY p.name;
             """
             rows = await conn.fetch(query, user_id)
 
+    # Az utolsó frissítés a snapshot store-ból jön, nem a teljes logger_data MAX()-ból
+    last_seen = await snapshot_store.plant_last_seen()
+
     return [
         {
             "id": row["id"],
             "name": row["name"],
-            "last_updated": row["last_updated"].isoformat() if row["last_updated"] else None
+            "last_updated": last_seen[row["id"]].isoformat() if last_seen.get(row["id"]) else None
         }
         for row in rows
     ]
@@ -142,171 +246,365 @@ async def get_active_alarms(plant_id: int, current_user: dict = Depends(get_curr
             WHERE plant_id = $1 AND is_active = TRUE
         """, plant_id)
 
-    result = []
-    for row in rows:
-        key = (row["register"], row["bit"])
-        alarm = alarm_definitions.get(key)
-        result.append({
+    return [
+        {
             "register": row["register"],
             "bit": row["bit"],
             "last_updated": row["last_updated"],
-            "alarm_id": alarm.get("alarm_id") if alarm else None,
-            "alarm_name": alarm.get("alarm_name", "Ismeretlen riasztás") if alarm else "Ismeretlen",
-            "severity": alarm.get("severity", "Unknown") if alarm else "Unknown"
-        })
-    return result
+            **describe_alarm(row["register"], row["bit"]),
+        }
+        for row in rows
+    ]
 
 
 @app.get("/api/plant/{plant_id}/alarms/summary")
 async def get_alarm_summary(plant_id: int, current_user: dict = Depends(get_current_user)):
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT register, bit
-            FROM logger_alarm_status
-            WHERE plant_id = $1 AND is_active = TRUE
-        """, plant_id)
+        summary = await fetch_severity_counts(conn, "las.plant_id = $4", plant_id)
 
-    severity_counter = Counter()
-    for row in rows:
-        key = (row["register"], row["bit"])
-        alarm = alarm_definitions.get(key)
-        if alarm:
-            severity = alarm["severity"]
-            if severity == "Adaptable":
-                severity = "Warning"
-            severity_counter[severity] += 1
-    return severity_counter
+    return Counter(summary.get(plant_id, {}))
 
 
-@app.get("/api/plant/{plant_id}/alarms/history")
-async def get_alarm_history(plant_id: int, current_user: dict = Depends(get_current_user)):
+@app.get("/api/alarms/summary")
+async def get_fleet_alarm_summary(current_user: dict = Depends(get_current_user)):
+    # Az összes látható plant súlyosság szerinti riasztásszáma egy lekérdezésben
     async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT register, bit, event_type, timestamp
-            FROM logger_alarm_log
-            WHERE plant_id = $1
-            ORDER BY timestamp DESC
-            LIMIT 100
-        """, plant_id)
+        if current_user["role"] == "admin":
+            summary = await fetch_severity_counts(conn, "TRUE")
+        else:
+            summary = await fetch_severity_counts(
+                conn,
+                "las.plant_id IN (SELECT plant_id FROM user_plant_access WHERE user_id = $4)",
+                current_user["id"]
+            )
 
-    result = []
+    return {str(plant_id): counts for plant_id, counts in summary.items()}
+
+
+def _encode_alarm_cursor(timestamp: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{log_id}".encode()).decode()
+
+
+def _decode_alarm_cursor(cursor: str):
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # A telemetria táblák naiv UTC időbélyeget tárolnak
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _alarm_history_item(row):
+    return {
+        "id": row["id"],
+        "register": row["register"],
+        "bit": row["bit"],
+        "timestamp": row["timestamp"].isoformat(),
+        "event_type": row["event_type"],
+        **describe_alarm(row["register"], row["bit"]),
+    }
+
+
+@app.get("/api/plant/{plant_id}/alarms/history")
+async def get_alarm_history(
+    plant_id: int,
+    response: Response,
+    limit: int = Query(None, ge=1, le=1000),
+    cursor: str = Query(None),
+    start: datetime = Query(None),
+    end: datetime = Query(None),
+    severity: list[str] = Query(None),
+    alarm_id: list[int] = Query(None),
+    format: str = Query("json"),
+    current_user: dict = Depends(get_current_user)
+):
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Use json or ndjson.")
+
+    # Keyset lapozás (timestamp, id) szerint csökkenően – nincs OFFSET
+    conditions = ["plant_id = $1"]
+    args = [plant_id]
+    if cursor:
+        cursor_ts, cursor_id = _decode_alarm_cursor(cursor)
+        args += [cursor_ts, cursor_id]
+        conditions.append(f"(timestamp, id) < (${len(args) - 1}, ${len(args)})")
+    if start:
+        args.append(_naive_utc(start))
+        conditions.append(f"timestamp >= ${len(args)}")
+    if end:
+        args.append(_naive_utc(end))
+        conditions.append(f"timestamp < ${len(args)}")
+    if severity or alarm_id:
+        registers, bits = alarm_keys_for(severities=severity, alarm_ids=alarm_id)
+        if not registers:
+            return []
+        args += [registers, bits]
+        conditions.append(
+            f"(register, bit) IN (SELECT * FROM unnest(${len(args) - 1}::int[], ${len(args)}::int[]))"
+        )
+
+    query = f"""
+        SELECT id, register, bit, event_type, timestamp
+        FROM logger_alarm_log
+        WHERE {" AND ".join(conditions)}
+        ORDER BY timestamp DESC, id DESC
+    """
+
+    if format == "ndjson":
+        if limit:
+            query += f" LIMIT {limit}"
+
+        async def stream():
+            async with analytic_pool.acquire() as conn:
+                async with conn.transaction():
+                    async for row in conn.cursor(query, *args, prefetch=500):
+                        yield json.dumps(_alarm_history_item(row)) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    limit = limit or 100
+    async with analytic_pool.acquire() as conn:
+        rows = await conn.fetch(query + f" LIMIT {limit}", *args)
+
+    # A következő oldal kurzora fejlécben megy, a válasz törzse lista marad
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_alarm_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+
+    return [_alarm_history_item(row) for row in rows]
+
+
+def _merge_buckets(rows):
+    # Hónaphatáron (meleg és hideg szakasz) ugyanaz a vödör két részből állhat. A meleg sorok
+    # NUMERIC oszlopa Decimal, a hideg (Parquet) float: összeadás előtt float-ra hozzuk
+    merged = []
     for row in rows:
-        key = (row["register"], row["bit"])
-        alarm = alarm_definitions.get(key)
-        result.append({
-            "register": row["register"],
-            "bit": row["bit"],
-            "timestamp": row["timestamp"],
-            "event_type": row["event_type"],
-            "alarm_name": alarm.get("alarm_name", "Ismeretlen"),
-            "severity": alarm.get("severity", "Unknown")
-        })
+        row = {name: float(v) if isinstance(v, Decimal) else v for name, v in dict(row).items()}
+        previous = merged[-1] if merged else None
+        if previous is None or previous["timestamp"] != row["timestamp"]:
+            merged.append(row)
+            continue
+        samples = (previous["samples"] or 0) + (row["samples"] or 0)
+        if samples:
+            previous["active_power"] = (
+                (previous["active_power"] or 0) * (previous["samples"] or 0)
+                + (row["active_power"] or 0) * (row["samples"] or 0)
+            ) / samples
+        for name, pick in (("min", min), ("max", max)):
+            values = [v for v in (previous[name], row[name]) if v is not None]
+            previous[name] = pick(values) if values else None
+        previous["samples"] = samples
+    return merged
+
+
+async def _fetch_power_series(table: str, plant_id: int, start: datetime, end: datetime, bucket_seconds: int = None):
+    # Saját kapcsolaton fut, hogy a fogyasztási és termelési sor párhuzamosan jöjjön.
+    # A hideg tárba archivált hónapok a Parquet fájlokból jönnek (cold_storage.py)
+    async with analytic_pool.acquire() as conn:
+        segments = await cold_segments(conn, table, plant_id, start, end + timedelta(microseconds=1))
+        result = []
+        for segment_start, segment_end, cold in segments:
+            if cold:
+                data = await read_cold(conn, table, plant_id, segment_start, segment_end, ["timestamp", "active_power"])
+                if data is None:
+                    continue
+                if bucket_seconds is None:
+                    result.extend({"timestamp": t, "active_power": p} for t, p in table_rows(data))
+                else:
+                    result.extend(bucket_power(data, bucket_seconds))
+                continue
+
+            if bucket_seconds is None:
+                rows = await conn.fetch(power_series_query(table, False), plant_id, segment_start, segment_end)
+            else:
+                rows = await conn.fetch(
+                    power_series_query(table, True), plant_id, segment_start, segment_end, bucket_seconds
+                )
+            if len(segments) == 1:
+                return rows
+            result.extend(rows)
+
+    if bucket_seconds is not None and len(segments) > 1:
+        return _merge_buckets(result)
     return result
 
 
+def _power_points(rows, bucketed: bool):
+    if not bucketed:
+        return [{"timestamp": r["timestamp"], "active_power": r["active_power"]} for r in rows]
+    return [
+        {"timestamp": r["timestamp"], "active_power": r["active_power"], "min": r["min"], "max": r["max"]}
+        for r in rows
+    ]
+
+
 @app.get("/api/plant/{plant_id}/production-data")
-async def get_production_data(plant_id: int, date: str, current_user: dict = Depends(get_current_user)):
+async def get_production_data(
+    plant_id: int,
+    date: str,
+    request: Request,
+    response: Response,
+    end_date: str = Query(None),
+    resolution: str = Query(None),
+    max_points: int = Query(None, ge=3, le=20000),
+    reducer: str = Query(None),
+    format: str = Query("json"),
+    current_user: dict = Depends(get_current_user)
+):
     local_tz = ZoneInfo("Europe/Budapest")
-    local_date = datetime.strptime(date, "%Y-%m-%d").date()
+    try:
+        local_date = datetime.strptime(date, "%Y-%m-%d").date()
+        local_end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else local_date
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    if local_end_date < local_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before date.")
+    if resolution is not None and resolution != "raw" and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid resolution. Use raw or one of: {', '.join(RESOLUTIONS)}.")
+    if reducer is not None and reducer != "lttb":
+        raise HTTPException(status_code=400, detail="Invalid reducer. Use lttb.")
+    check_format(format)
+
+    # A nap görbéje csak akkor változik, ha a plant logger/meter adata frissült
+    watermarks = await snapshot_store.plant_watermarks(plant_id)
+    etag = make_etag("production-data", plant_id, str(request.query_params), watermarks["logger"], watermarks["meter"])
+    cached = conditional(request, response, etag)
+    if cached:
+        return cached
 
     # Budapest nap eleje/vége → UTC → naiv (Postgres TIMESTAMP WITHOUT TIME ZONE-hoz)
     local_start = datetime.combine(local_date, time.min).replace(tzinfo=local_tz).astimezone(timezone.utc).replace(tzinfo=None)
-    local_end   = datetime.combine(local_date, time.max).replace(tzinfo=local_tz).astimezone(timezone.utc).replace(tzinfo=None)
+    local_end   = datetime.combine(local_end_date, time.max).replace(tzinfo=local_tz).astimezone(timezone.utc).replace(tzinfo=None)
 
-    async with db_pool.acquire() as conn:
-        meter_rows = await conn.fetch("""
-            SELECT timestamp, active_power
-            FROM meter_data
-            WHERE plant_id = $1
-              AND timestamp BETWEEN $2 AND $3
-            ORDER BY timestamp
-        """, plant_id, local_start, local_end)
-
-        logger_rows = await conn.fetch("""
-            SELECT timestamp, active_power
-            FROM logger_data
-            WHERE plant_id = $1
-              AND timestamp BETWEEN $2 AND $3
-            ORDER BY timestamp
-        """, plant_id, local_start, local_end)
+    # Vödörméret: explicit felbontás, vagy max_points alapján SQL-ben aggregálva (LTTB-nél nyers sorból ritkítunk)
+    bucket_seconds = None
+    if resolution in RESOLUTIONS:
+        bucket_seconds = RESOLUTIONS[resolution]
+    elif resolution is None and max_points and reducer is None:
+        bucket_seconds = bucket_seconds_for((local_end - local_start).total_seconds(), max_points)
+
+    meter_rows, logger_rows = await asyncio.gather(
+        _fetch_power_series("meter_data", plant_id, local_start, local_end, bucket_seconds),
+        _fetch_power_series("logger_data", plant_id, local_start, local_end, bucket_seconds),
+    )
+
+    if reducer == "lttb":
+        meter_rows = lttb(_power_points(meter_rows, bucket_seconds is not None), max_points or 1000)
+        logger_rows = lttb(_power_points(logger_rows, bucket_seconds is not None), max_points or 1000)
+
+    if format != "json":
+        columns = ["timestamp", "active_power"] + (["min", "max"] if bucket_seconds is not None else [])
+        return tag(columnar_response({
+            "consumption": records_to_columns(meter_rows, columns),
+            "production": records_to_columns(logger_rows, columns),
+        }, format), etag)
+
+    consumption = _power_points(meter_rows, bucket_seconds is not None)
+    production = _power_points(logger_rows, bucket_seconds is not None)
+
+    for point in consumption + production:
+        point["timestamp"] = point["timestamp"].isoformat()
 
     return {
-        "consumption": [{"timestamp": r["timestamp"].isoformat(), "active_power": r["active_power"]} for r in meter_rows],
-        "production":  [{"timestamp": r["timestamp"].isoformat(), "active_power": r["active_power"]} for r in logger_rows],
+        "consumption": consumption,
+        "production":  production,
     }
 
 
 
 @app.get("/api/plant/{plant_id}/inverter-data")
-async def get_inverter_data(plant_id: int, current_user: dict = Depends(get_current_user)):
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT i.id AS inverter_id, i.name AS inverter_name, i.max_string_count, d.*
-            FROM inverters i
-            LEFT JOIN inverter_data d ON i.id = d.inverter_id
-            WHERE i.plant_id = $1
-            AND d.timestamp = (
-                SELECT MAX(timestamp) FROM inverter_data WHERE inverter_id = i.id
-            )
-            ORDER BY i.id ASC;
-        """, plant_id)
+async def get_inverter_data(
+    plant_id: int,
+    request: Request,
+    response: Response,
+    format: str = Query("json"),
+    current_user: dict = Depends(get_current_user)
+):
+    check_format(format)
+    watermarks = await snapshot_store.plant_watermarks(plant_id)
+    etag = make_etag("inverter-data", plant_id, format, watermarks["inverter"])
+    cached = conditional(request, response, etag)
+    if cached:
+        return cached
 
-    return [dict(row) for row in rows]
+    result = []
+    for meta, data in await snapshot_store.latest_inverters(plant_id):
+        result.append({
+            "inverter_id": meta["id"],
+            "inverter_name": meta["name"],
+            "max_string_count": meta["max_string_count"],
+            **data,
+        })
+
+    if format != "json":
+        columns = list(dict.fromkeys(key for row in result for key in row))
+        return tag(columnar_response(records_to_columns([defaultdict(lambda: None, row) for row in result], columns), format), etag)
+    return result
 
 @app.get("/api/plant/{plant_id}/logger-data")
-async def get_logger_data(plant_id: int, current_user: dict = Depends(get_current_user)):
-    async with db_pool.acquire() as conn:
-        query = """
-        SELECT * FROM logger_data
-        WHERE plant_id = $1
-        ORDER BY timestamp DESC
-        LIMIT 1
-        """
-        row = await conn.fetchrow(query, plant_id)
-        return dict(row) if row else {"error": "No data found"}
+async def get_logger_data(plant_id: int, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    watermarks = await snapshot_store.plant_watermarks(plant_id)
+    cached = conditional(request, response, make_etag("logger-data", plant_id, watermarks["logger"]))
+    if cached:
+        return cached
+
+    row = await snapshot_store.latest_logger(plant_id)
+    return row if row else {"error": "No data found"}
 
 @app.get("/api/plant/{plant_id}/meter-data")
-async def get_meter_data(plant_id: int, current_user: dict = Depends(get_current_user)):
-    async with db_pool.acquire() as conn:
-        query = """
-        SELECT * FROM meter_data 
-        WHERE plant_id = $1 
-        ORDER BY timestamp DESC 
-        LIMIT 1
-        """
-        row = await conn.fetchrow(query, plant_id)
-        return dict(row) if row else {"error": "No data found"}
+async def get_meter_data(plant_id: int, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    watermarks = await snapshot_store.plant_watermarks(plant_id)
+    cached = conditional(request, response, make_etag("meter-data", plant_id, watermarks["meter"]))
+    if cached:
+        return cached
+
+    row = await snapshot_store.latest_meter(plant_id)
+    return row if row else {"error": "No data found"}
     
 @app.get("/api/plant/{plant_id}/weekly-avg")
-async def get_weekly_avg(plant_id: int, current_user: dict = Depends(get_current_user)):
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT string_number, hourly_avg_power 
-            FROM string_weekly_hourly_avg
-            WHERE plant_id = $1
-            ORDER BY calculation_date DESC
-        """, plant_id)
-        
-        return [dict(row) for row in rows]
-    
+async def get_weekly_avg(
+    plant_id: int,
+    request: Request,
+    response: Response,
+    inverter_id: int = Query(None),
+    format: str = Query("json"),
+    current_user: dict = Depends(get_current_user),
+):
+    # Stringenként és óránként a legutolsó heti átlag – állandó méret, nem nő a történettel
+    check_format(format)
+    profile = await _string_profile(plant_id, inverter_id)
+    etag = make_etag("weekly-avg", plant_id, profile.version, inverter_id, format)
+    cached = conditional(request, response, etag)
+    if cached:
+        return cached
+
+    rows = profile.rows(inverter_id)
+    if format != "json":
+        columns = ["inverter_id", "string_number", "calculation_hour", "hourly_avg_power"]
+        return tag(columnar_response(records_to_columns(rows, columns), format), etag)
+    return rows
+
 @app.get("/api/plant/{plant_id}/inverter-performance")
-async def get_inverter_performance(plant_id: int, current_user: dict = Depends(get_current_user)):
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT i.id AS inverter_id,
-                   i.name AS inverter_name,
-                   i.max_power,
-                   d.active_power
-            FROM inverters i
-            JOIN LATERAL (
-                SELECT active_power
-                FROM inverter_data d
-                WHERE d.inverter_id = i.id
-                ORDER BY d.timestamp DESC
-                LIMIT 1
-            ) d ON true
-            WHERE i.plant_id = $1;
-        """, plant_id)
+async def get_inverter_performance(plant_id: int, request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    watermarks = await snapshot_store.plant_watermarks(plant_id)
+    cached = conditional(request, response, make_etag("inverter-performance", plant_id, watermarks["inverter"]))
+    if cached:
+        return cached
+
+    rows = [
+        {
+            "inverter_id": meta["id"],
+            "inverter_name": meta["name"],
+            "max_power": meta["max_power"],
+            "active_power": data.get("active_power"),
+        }
+        for meta, data in await snapshot_store.latest_inverters(plant_id)
+    ]
 
     performance = []
     for row in rows:
@@ -323,6 +621,27 @@ async def get_inverter_performance(plant_id: int, current_user: dict = Depends(g
     })
     return performance
 
+# A /metrics scrape-hez METRICS_TOKEN bearer token, vagy bármely bejelentkezett felhasználó tokenje
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+async def require_metrics_access(authorization: str = Header(None)):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    if METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return
+    await get_current_user(token)
+
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+async def get_metrics():
+    return metrics_response()
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    return {**snapshot_store.stats(), "string_profile": profile_store.stats()}
+
 @app.get("/api/plant/{plant_id}/power-adjustment")
 async def get_plant_power_adjustment_settings(plant_id: int, current_user: dict = Depends(get_current_user)):
     async with db_pool.acquire() as conn:
@@ -349,6 +668,16 @@ async def update_price_threshold(plant_id: int, update: PriceUpdate, current_use
     return {"status": "ok", "new_price": update.price_threshold}
 
 
+def _parse_date_range(start_date: str, end_date: str):
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date.")
+    return start, end
+
 @app.get("/api/plant/{plant_id}/daily-yield-range")
 async def get_daily_yield_range(
     plant_id: int,
@@ -356,34 +685,66 @@ async def get_daily_yield_range(
     end_date: str = Query(...),
     current_user: dict = Depends(get_current_user)
 ):
-    try:
-        start = datetime.strptime(start_date, "%Y-%m-%d")
-        end = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    start, end = _parse_date_range(start_date, end_date)
 
-    async with db_pool.acquire() as conn:
-        rows = await conn.fetch("""
-            SELECT
-                date_trunc('day', timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Budapest') AS day,
-                MAX(today_yield) as max_yield
-            FROM logger_data
-            WHERE plant_id = $1 AND timestamp BETWEEN $2 AND $3
-            GROUP BY day
-            ORDER BY day
-        """, plant_id, start, end)
+    async with analytic_pool.acquire() as conn:
+        series = await yield_series(conn, [plant_id], start, end)
 
     return [
-        {
-            "date": row["day"].date().isoformat(),
-            "yield": float(row["max_yield"]) if row["max_yield"] is not None else 0
-        }
-        for row in rows
+        {"date": day.isoformat(), "yield": value}
+        for day, value in series[plant_id]
     ]
 
+async def _visible_plant_ids(conn, current_user: dict) -> set:
+    if current_user["role"] == "admin":
+        rows = await conn.fetch("SELECT id FROM plants")
+    else:
+        rows = await conn.fetch(
+            "SELECT plant_id AS id FROM user_plant_access WHERE user_id = $1", current_user["id"]
+        )
+    return {r["id"] for r in rows}
+
+@app.get("/api/daily-yield-range")
+async def get_fleet_yield_range(
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    plant_ids: list[int] = Query(None),
+    granularity: str = Query("day"),
+    current_user: dict = Depends(get_current_user)
+):
+    start, end = _parse_date_range(start_date, end_date)
+    if granularity not in ("day", "month"):
+        raise HTTPException(status_code=400, detail="Invalid granularity. Use day or month.")
+
+    async with analytic_pool.acquire() as conn:
+        visible = await _visible_plant_ids(conn, current_user)
+
+        if plant_ids:
+            if not set(plant_ids) <= visible:
+                raise HTTPException(status_code=403, detail="No access to one or more plants.")
+            selected = sorted(set(plant_ids))
+        else:
+            selected = sorted(visible)
+
+        series = await yield_series(conn, selected, start, end, granularity)
+
+    totals = Counter()
+    for values in series.values():
+        for period, value in values:
+            totals[period] += value
+
+    return {
+        "granularity": granularity,
+        "plants": {
+            str(pid): [{"date": period.isoformat(), "yield": value} for period, value in values]
+            for pid, values in series.items()
+        },
+        "total": [{"date": period.isoformat(), "yield": totals[period]} for period in sorted(totals)],
+    }
+
 @app.get("/api/string-health/latest")
 async def get_latest_string_health(current_user: dict = Depends(get_current_user)):
-    async with db_pool.acquire() as conn:
+    async with analytic_pool.acquire() as conn:
         rows = await conn.fetch("""
             WITH latest AS (
                 SELECT MAX(check_hour) AS ts
@@ -419,4 +780,255 @@ async def get_latest_string_health(current_user: dict = Depends(get_current_user
             "check_hour": r["check_hour"].isoformat() if isinstance(r["check_hour"], datetime) else r["check_hour"],
         }
         for r in rows
-    ]
\ No newline at end of file
+    ]
+
+@app.get("/api/string-health/findings")
+async def get_string_health_findings(
+    plant_id: int = Query(None),
+    severity: list[str] = Query(None),
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    # A legutóbbi string_health futás rangsorolt találatai (lásd string_health.py)
+    conditions = ["f.run_id = r.id"]
+    args = []
+    if plant_id is not None:
+        args.append(plant_id)
+        conditions.append(f"f.plant_id = ${len(args)}")
+    if severity:
+        args.append(severity)
+        conditions.append(f"f.severity = ANY(${len(args)}::text[])")
+    if current_user["role"] != "admin":
+        args.append(current_user["id"])
+        conditions.append(
+            f"f.plant_id IN (SELECT plant_id FROM user_plant_access WHERE user_id = ${len(args)})"
+        )
+
+    async with analytic_pool.acquire() as conn:
+        run = await conn.fetchrow("SELECT * FROM string_health_runs ORDER BY run_at DESC LIMIT 1")
+        if run is None:
+            return {"run_at": None, "findings": []}
+        rows = await conn.fetch(f"""
+            SELECT f.*, p.name AS plant_name, i.name AS inverter_name, i.slave_id
+            FROM string_health_findings f
+            JOIN string_health_runs r ON r.id = ${len(args) + 1}
+            JOIN inverters i ON i.id = f.inverter_id
+            JOIN plants p ON p.id = f.plant_id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY f.rank
+            LIMIT {limit}
+        """, *args, run["id"])
+
+    return {
+        "run_at": run["run_at"],
+        "inverters": run["inverters"],
+        "strings": run["strings"],
+        "total_findings": run["findings"],
+        "findings": [
+            {
+                "rank": r["rank"],
+                "plant_id": r["plant_id"],
+                "plant_name": r["plant_name"],
+                "inverter_id": r["inverter_id"],
+                "inverter_name": r["inverter_name"],
+                "slave_id": r["slave_id"],
+                "string_index": r["string_index"],
+                "severity": r["severity"],
+                "kind": r["kind"],
+                "score": round(r["score"], 3),
+                "v": r["v"],
+                "a": r["a"],
+                "power": r["power"],
+                "baseline": r["baseline"],
+                "peer_median": r["peer_median"],
+                "baseline_dev": r["baseline_dev"],
+                "peer_dev": r["peer_dev"],
+                "reading_at": r["reading_at"],
+            }
+            for r in rows
+        ],
+    }
+
+
+async def _dashboard_section(errors: list, section: str, coro, plant_id: int = None):
+    # Egy szekció hibája vagy időtúllépése nem viszi el a teljes választ
+    try:
+        return await asyncio.wait_for(coro, DASHBOARD_SECTION_TIMEOUT)
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        error = "timeout"
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    print(f"Dashboard szekció hiba ({section}, plant {plant_id}):", error)
+    errors.append({"section": section, "plant_id": plant_id, "error": error})
+    return None
+
+
+async def _dashboard_plants(plant_ids, limit):
+    async with limit:
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT id, name, price_control_enabled, price_threshold, min_power_limit
+                FROM plants
+                WHERE id = ANY($1::int[])
+            """, plant_ids)
+    last_seen = await snapshot_store.plant_last_seen()
+    return {
+        r["id"]: {
+            "id": r["id"],
+            "name": r["name"],
+            "last_seen": last_seen.get(r["id"]),
+            "power_adjustment": {
+                "price_control_enabled": r["price_control_enabled"],
+                "price_threshold": r["price_threshold"],
+                "min_power_limit": r["min_power_limit"],
+            },
+        }
+        for r in rows
+    }
+
+
+async def _dashboard_production(plant_id: int, local_date, bucket_seconds, limit):
+    local_tz = ZoneInfo("Europe/Budapest")
+    start = datetime.combine(local_date, time.min).replace(tzinfo=local_tz).astimezone(timezone.utc).replace(tzinfo=None)
+    end = datetime.combine(local_date, time.max).replace(tzinfo=local_tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+    async def series(table):
+        async with limit:
+            rows = await _fetch_power_series(table, plant_id, start, end, bucket_seconds)
+        points = _power_points(rows, bucket_seconds is not None)
+        for point in points:
+            point["timestamp"] = point["timestamp"].isoformat()
+        return points
+
+    consumption, production = await asyncio.gather(series("meter_data"), series("logger_data"))
+    return {"consumption": consumption, "production": production}
+
+
+async def _dashboard_yield(plant_ids, start, end, limit):
+    async with limit:
+        async with analytic_pool.acquire() as conn:
+            series = await yield_series(conn, plant_ids, start, end)
+    return {
+        pid: [{"date": day.isoformat(), "yield": value} for day, value in values]
+        for pid, values in series.items()
+    }
+
+
+async def _dashboard_alarms(plant_ids, limit):
+    async with limit:
+        async with db_pool.acquire() as conn:
+            summary = await fetch_severity_counts(conn, "las.plant_id = ANY($4::int[])", plant_ids)
+    return {pid: dict(Counter(summary.get(pid, {}))) for pid in plant_ids}
+
+
+async def _build_dashboards(plant_ids, sections, production_date, resolution, yield_start, yield_end):
+    # Minden szekció egyszerre indul; a közös szemafor kérésenként korlátozza a foglalt kapcsolatokat.
+    # A többplantos szekciók (plant, daily_yield, alarms) egy lekérdezéssel mennek minden plantra.
+    limit = asyncio.Semaphore(DASHBOARD_CONCURRENCY)
+    errors = []
+    bucket_seconds = RESOLUTIONS.get(resolution)
+
+    shared = {}
+    if "plant" in sections:
+        shared["plant"] = _dashboard_section(errors, "plant", _dashboard_plants(plant_ids, limit))
+    if "daily_yield" in sections:
+        shared["daily_yield"] = _dashboard_section(
+            errors, "daily_yield", _dashboard_yield(plant_ids, yield_start, yield_end, limit))
+    if "alarms" in sections:
+        shared["alarms"] = _dashboard_section(errors, "alarms", _dashboard_alarms(plant_ids, limit))
+
+    per_plant = []
+    for pid in plant_ids:
+        if "logger" in sections:
+            per_plant.append((pid, "logger", _dashboard_section(errors, "logger", snapshot_store.latest_logger(pid), pid)))
+        if "meter" in sections:
+            per_plant.append((pid, "meter", _dashboard_section(errors, "meter", snapshot_store.latest_meter(pid), pid)))
+        if "production" in sections:
+            per_plant.append((pid, "production", _dashboard_section(
+                errors, "production", _dashboard_production(pid, production_date, bucket_seconds, limit), pid)))
+
+    results = await asyncio.gather(*shared.values(), *(coro for _, _, coro in per_plant))
+    shared_results = dict(zip(shared, results[:len(shared)]))
+
+    dashboards = {pid: {} for pid in plant_ids}
+    for pid in plant_ids:
+        for section, result in shared_results.items():
+            dashboards[pid][section] = result.get(pid) if result is not None else None
+    for (pid, section, _), result in zip(per_plant, results[len(shared):]):
+        dashboards[pid][section] = result
+    return dashboards, errors
+
+
+def _dashboard_params(sections, date, resolution, start_date, end_date):
+    sections = sections or list(DASHBOARD_SECTIONS)
+    unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid section. Use any of: {', '.join(DASHBOARD_SECTIONS)}.")
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid resolution. Use one of: {', '.join(RESOLUTIONS)}.")
+
+    today = datetime.now(ZoneInfo("Europe/Budapest")).date()
+    try:
+        production_date = datetime.strptime(date, "%Y-%m-%d").date() if date else today
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    if start_date or end_date:
+        yield_start, yield_end = _parse_date_range(
+            start_date or (today - timedelta(days=6)).isoformat(), end_date or today.isoformat())
+    else:
+        yield_start, yield_end = today - timedelta(days=6), today
+    return set(sections), production_date, yield_start, yield_end
+
+
+@app.get("/api/plant/{plant_id}/dashboard")
+async def get_plant_dashboard(
+    plant_id: int,
+    sections: list[str] = Query(None),
+    date: str = Query(None),
+    resolution: str = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    # A PlantDetails oldal összes induló lekérdezése egy kérésben
+    selected, production_date, yield_start, yield_end = _dashboard_params(
+        sections, date, resolution, start_date, end_date)
+    async with db_pool.acquire() as conn:
+        if plant_id not in await _visible_plant_ids(conn, current_user):
+            raise HTTPException(status_code=404, detail="Plant not found.")
+
+    dashboards, errors = await _build_dashboards(
+        [plant_id], selected, production_date, resolution, yield_start, yield_end)
+    return {"plant_id": plant_id, **dashboards[plant_id], "errors": errors}
+
+
+@app.get("/api/dashboard")
+async def get_fleet_dashboard(
+    plant_ids: list[int] = Query(None),
+    sections: list[str] = Query(None),
+    date: str = Query(None),
+    resolution: str = Query(None),
+    start_date: str = Query(None),
+    end_date: str = Query(None),
+    current_user: dict = Depends(get_current_user)
+):
+    selected, production_date, yield_start, yield_end = _dashboard_params(
+        sections, date, resolution, start_date, end_date)
+    async with db_pool.acquire() as conn:
+        visible = await _visible_plant_ids(conn, current_user)
+    if plant_ids:
+        if not set(plant_ids) <= visible:
+            raise HTTPException(status_code=403, detail="No access to one or more plants.")
+        chosen = sorted(set(plant_ids))
+    else:
+        chosen = sorted(visible)
+
+    dashboards, errors = await _build_dashboards(
+        chosen, selected, production_date, resolution, yield_start, yield_end)
+    return {
+        "plants": {str(pid): dashboard for pid, dashboard in dashboards.items()},
+        "errors": errors,
+    }
+
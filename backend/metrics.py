@@ -0,0 +1,318 @@
+import asyncio
+import bisect
+import contextvars
+import hashlib
+import os
+import re
+import time
+from collections import defaultdict
+from fastapi import Response
+
+# Prometheus szöveges formátumú metrikák: HTTP útvonalak, DB pool és lekérdezések, websocketek.
+# Lassú lekérdezés naplózás: SLOW_QUERY_MS (0 = kikapcsolva). Az SQL szöveg csak ide kerül,
+# a metrikákban a lekérdezést kizárólag az ujjlenyomata azonosítja.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Az aktuális HTTP/websocket kérés ASGI scope-ja; a routing ugyanebbe a dict-be írja a route-ot
+_current_scope = contextvars.ContextVar("current_scope", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = defaultdict(float)
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self.values[label_values] += amount
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *label_values, value: float):
+        self.values[label_values] = value
+
+    def dec(self, *label_values, amount: float = 1.0):
+        self.values[label_values] -= amount
+
+
+_INF = 'le="+Inf"'
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.counts = {}
+        self.sums = defaultdict(float)
+
+    def observe(self, *label_values, value: float):
+        counts = self.counts.get(label_values)
+        if counts is None:
+            counts = self.counts[label_values] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[label_values] += value
+
+    def samples(self):
+        for label_values, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            cumulative += counts[-1]
+            yield f"{self.name}_bucket{_format_labels(self.labels, label_values, _INF)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {self.sums[label_values]}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("route", "method")))
+
+pool_rejected = registry.register(Counter(
+    "db_pool_rejected_total", "Acquires rejected by admission control", ("pool", "reason")))
+pool_waiting = registry.register(Gauge("db_pool_waiting", "Tasks waiting for a pool connection", ("pool",)))
+pool_acquire_wait = registry.register(Histogram(
+    "db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection", ("pool",)))
+pool_size = registry.register(Gauge("db_pool_size", "Open connections in the pool", ("pool",)))
+pool_idle = registry.register(Gauge("db_pool_idle", "Idle connections in the pool", ("pool",)))
+pool_in_use = registry.register(Gauge(
+    "db_pool_connections_in_use", "Connections currently held, by route", ("pool", "route")))
+query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Query duration by statement fingerprint", ("pool", "query")))
+query_rows = registry.register(Counter(
+    "db_query_rows_total", "Rows returned or affected by statement fingerprint", ("pool", "query")))
+
+ws_open = registry.register(Gauge("websocket_open", "Open websocket connections", ("channel",)))
+ws_messages = registry.register(Counter(
+    "websocket_messages_sent_total", "Websocket messages sent", ("channel",)))
+ws_send_lag = registry.register(Histogram(
+    "websocket_send_lag_seconds", "Time from enqueue to send per websocket message", ("channel",)))
+
+ingest_rows = registry.register(Counter(
+    "ingest_rows_total", "Telemetry rows written by the ingestion endpoint", ("table",)))
+alarm_transitions = registry.register(Counter(
+    "alarm_transitions_total", "Alarm bit transitions detected on ingest", ("event",)))
+
+
+def current_route() -> str:
+    scope = _current_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        token = _current_scope.set(scope)
+        if scope["type"] == "websocket":
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                _current_scope.reset(token)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = current_route()
+            http_latency.observe(route, scope["method"], value=time.perf_counter() - started)
+            http_requests.inc(route, scope["method"], str(status["code"]))
+            _current_scope.reset(token)
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_fingerprints = {}
+
+
+def fingerprint(query: str) -> str:
+    cached = _fingerprints.get(query)
+    if cached:
+        return cached
+    normalized = _WHITESPACE.sub(" ", _LITERALS.sub("?", query)).strip()
+    digest = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+    _fingerprints[query] = digest
+    return digest
+
+
+def _row_count(method: str, result) -> int:
+    if method == "fetch":
+        return len(result)
+    if method == "fetchrow":
+        return 1 if result is not None else 0
+    if method in ("execute", "copy_records_to_table") and isinstance(result, str):
+        last = result.split()[-1] if result else ""
+        return int(last) if last.isdigit() else 0
+    return 0
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, pool_name: str):
+        self._conn = conn
+        self._pool_name = pool_name
+
+    async def _timed(self, method: str, query: str, *args, **kwargs):
+        started = time.perf_counter()
+        result = await getattr(self._conn, method)(query, *args, **kwargs)
+        elapsed = time.perf_counter() - started
+
+        digest = fingerprint(query)
+        query_duration.observe(self._pool_name, digest, value=elapsed)
+        query_rows.inc(self._pool_name, digest, amount=_row_count(method, result))
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            print(f"Lassú lekérdezés ({elapsed * 1000:.1f} ms, {current_route()}, {digest}):",
+                  _WHITESPACE.sub(" ", query).strip()[:300])
+        return result
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed("fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed("fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed("fetchval", query, *args, **kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed("execute", query, *args, **kwargs)
+
+    async def executemany(self, query, *args, **kwargs):
+        return await self._timed("executemany", query, *args, **kwargs)
+
+    async def copy_records_to_table(self, table_name, **kwargs):
+        return await self._timed("copy_records_to_table", table_name, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class PoolBusy(Exception):
+    # A pool várakozási sora tele van, vagy az acquire időtúllépett; a main 503-at ad rá
+    def __init__(self, pool_name: str, reason: str):
+        super().__init__(f"Database pool '{pool_name}' is busy ({reason})")
+        self.pool_name = pool_name
+        self.reason = reason
+
+
+class _AcquireContext:
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+        self._route = None
+
+    async def __aenter__(self):
+        pool = self._pool
+        if pool.max_waiters is not None and pool.waiting >= pool.max_waiters:
+            pool_rejected.inc(pool.name, "queue_full")
+            raise PoolBusy(pool.name, "queue full")
+
+        started = time.perf_counter()
+        pool.waiting += 1
+        try:
+            self._conn = await pool._pool.acquire(timeout=self._timeout or pool.acquire_timeout)
+        except asyncio.TimeoutError:
+            pool_rejected.inc(pool.name, "timeout")
+            raise PoolBusy(pool.name, "acquire timeout")
+        finally:
+            pool.waiting -= 1
+        pool_acquire_wait.observe(pool.name, value=time.perf_counter() - started)
+        self._route = current_route()
+        pool_in_use.inc(self._pool.name, self._route)
+        return InstrumentedConnection(self._conn, self._pool.name)
+
+    async def __aexit__(self, *exc):
+        pool_in_use.dec(self._pool.name, self._route)
+        await self._pool._pool.release(self._conn)
+
+
+class InstrumentedPool:
+    # asyncpg pool csomagoló: acquire-várakozás, lekérdezésidő, sorszám és route szerinti foglaltság.
+    # max_waiters: ennyi egyidejű várakozó fölött azonnal PoolBusy; acquire_timeout: alapértelmezett
+    # várakozási idő másodpercben (None = korlátlan)
+    def __init__(self, pool, name: str = "main", max_waiters: int = None, acquire_timeout: float = None):
+        self._pool = pool
+        self.name = name
+        self.max_waiters = max_waiters
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        registry.collectors.append(self._collect)
+
+    def _collect(self):
+        pool_size.set(self.name, value=self._pool.get_size())
+        pool_idle.set(self.name, value=self._pool.get_idle_size())
+        pool_waiting.set(self.name, value=self.waiting)
+
+    def acquire(self, *, timeout=None):
+        return _AcquireContext(self, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+def metrics_response() -> Response:
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+from datetime import datetime
+
+import asyncpg
+
+import calculate_inverters_hourly_avg as string_rollup
+import inverter_latest
+from db_config import connection_kwargs
+
+# Egyszeri adatbázis migrációk, amelyek nem futhatnak az API indulásakor vagy egy ütemezett
+# feladatban (adat törlés, nagy táblát záró DDL). Minden lépés a katalógusból dönti el, kell-e
+# még tennie valamit, így ismételt futtatáskor csak olvas. Deploykor, az API előtt fut:
+#
+#   python migrate.py                  # minden lépés
+#   python migrate.py --step string_weekly_hourly_avg_uniq
+MIGRATIONS = {
+    "string_weekly_hourly_avg_uniq": string_rollup.migrate,
+    "inverter_latest": inverter_latest.ensure_schema,
+}
+
+
+async def run(conn, steps=None) -> dict:
+    applied = {}
+    for name in steps or list(MIGRATIONS):
+        applied[name] = await MIGRATIONS[name](conn)
+        print(f"[{datetime.now()}] {name}: {'alkalmazva' if applied[name] else 'már rendben'}")
+    return applied
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="One-off database migrations")
+    parser.add_argument("--step", action="append", choices=list(MIGRATIONS))
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(**connection_kwargs())
+    try:
+        await run(conn, args.step)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
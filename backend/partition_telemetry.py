@@ -0,0 +1,383 @@
+import argparse
+import asyncio
+import json
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+import asyncpg
+
+from calculate_inverters_hourly_avg import partials_query
+from db_config import connection_kwargs
+from downsampling import power_series_query
+from inverter_latest import ensure_schema as ensure_inverter_latest_schema
+from production_hub import DELTA_QUERY
+from snapshot_cache import SNAPSHOT_FUTURE_TOLERANCE, latest_rows_query
+
+# A nyers telemetria táblák havi RANGE partícionálása és karbantartása.
+#
+#   python partition_telemetry.py convert [--table inverter_data ...] [--drop-legacy]
+#   python partition_telemetry.py maintain [--months-ahead 3] [--retention-months 24]
+#   python partition_telemetry.py verify [--months-ahead 3]
+#
+# convert: a meglévő táblát <tábla>_legacy névre nevezi, létrehozza a partícionált változatot
+#   (<tábla>_pYYYYMM partíciók, (kulcs, timestamp) index, a régi tábla többi indexe ugyanazon
+#   a néven), hónaponként átmásolja az adatot és sorszámot egyeztet. Egy tranzakcióban fut, kizárólagos zárral – karbantartási ablakban futtasd.
+# maintain: előre létrehozza a következő hónapok partícióit; --retention-months esetén a régi
+#   partíciókat leválasztja és eldobja, de csak ha a cold_storage szerint minden sora archiválva van.
+# verify: EXPLAIN ANALYZE-zal (visszagörgetett tranzakcióban) ellenőrzi, hogy a végpontok valódi
+#   lekérdezései partíció-szűrést kapnak; a futás közbeni szűrés is csak így látszik.
+
+TELEMETRY_TABLES = {
+    "inverter_data": "inverter_id",
+    "logger_data": "plant_id",
+    "meter_data": "plant_id",
+    "alteo_data": "plant_id",
+}
+MONTHS_AHEAD = 3
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    kind = await conn.fetchval(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass($1)", table
+    )
+    return kind == "p"
+
+
+async def list_partitions(conn, table: str):
+    rows = await conn.fetch("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+        ORDER BY c.relname
+    """, table)
+    partitions = []
+    for row in rows:
+        match = _PARTITION_NAME.match(row["relname"])
+        if match and match.group("table") == table:
+            partitions.append((date(int(match.group("year")), int(match.group("month")), 1), row["relname"]))
+    return partitions
+
+
+async def create_partition(conn, table: str, month: date) -> bool:
+    name = partition_name(table, month)
+    if await conn.fetchval("SELECT to_regclass($1)", name):
+        return False
+    await conn.execute(f"""
+        CREATE TABLE {name} PARTITION OF {table}
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')
+    """)
+    return True
+
+
+async def _primary_key_columns(conn, table: str):
+    rows = await conn.fetch("""
+        SELECT a.attname
+        FROM pg_index ix
+        JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord) ON TRUE
+        JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+        WHERE ix.indrelid = to_regclass($1) AND ix.indisprimary
+        ORDER BY k.ord
+    """, table)
+    return [r["attname"] for r in rows]
+
+
+async def _sequences(conn, table: str):
+    rows = await conn.fetch("""
+        SELECT attname, pg_get_serial_sequence($1, attname) AS seq
+        FROM pg_attribute
+        WHERE attrelid = to_regclass($1) AND attnum > 0 AND NOT attisdropped
+    """, table)
+    return {r["attname"]: r["seq"] for r in rows if r["seq"]}
+
+
+async def _secondary_indexes(conn, table: str):
+    # A nem elsődleges kulcs indexek definíciója és oszlopai (kifejezés-oszlop: None)
+    rows = await conn.fetch("""
+        SELECT
+            c.relname AS name,
+            pg_get_indexdef(ix.indexrelid) AS definition,
+            ix.indisunique AS is_unique,
+            ARRAY(
+                SELECT a.attname
+                FROM unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord)
+                LEFT JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+                ORDER BY k.ord
+            ) AS columns
+        FROM pg_index ix
+        JOIN pg_class c ON c.oid = ix.indexrelid
+        WHERE ix.indrelid = to_regclass($1) AND NOT ix.indisprimary
+        ORDER BY c.relname
+    """, table)
+    return [dict(r) for r in rows]
+
+
+def _index_body(definition: str) -> str:
+    # "CREATE INDEX név ON tábla USING btree (...)" → "USING btree (...)"
+    return definition[definition.index(" USING "):].strip()
+
+
+async def _copy_indexes(conn, table: str, indexes) -> list:
+    # A régi indexek átnevezve a legacy táblán maradnak, az új tábla az eredeti nevet kapja.
+    # Az egyedi index a partícionált táblán csak a timestamp oszloppal együtt hozható létre
+    existing = {
+        _index_body(r["definition"]) for r in await _secondary_indexes(conn, table)
+    }
+    copied = []
+    for index in indexes:
+        body = _index_body(index["definition"])
+        if index["is_unique"] and "timestamp" not in index["columns"]:
+            print(f"{table}: {index['name']} egyedi index timestamp nélkül, partícionált táblán nem hozható létre – kihagyva.")
+            continue
+        await conn.execute(f"ALTER INDEX {index['name']} RENAME TO {index['name'][:56]}_legacy")
+        if body in existing:
+            continue
+        unique = "UNIQUE " if index["is_unique"] else ""
+        await conn.execute(f"CREATE {unique}INDEX {index['name']} ON {table} {body}")
+        existing.add(body)
+        copied.append(index["name"])
+    return copied
+
+
+async def convert_table(conn, table: str, key: str, months_ahead: int, drop_legacy: bool):
+    if await is_partitioned(conn, table):
+        print(f"{table}: már partícionált, kihagyva.")
+        return
+
+    legacy = f"{table}_legacy"
+    async with conn.transaction():
+        await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+        bounds = await conn.fetchrow(f"SELECT MIN(timestamp) AS first, MAX(timestamp) AS last, COUNT(*) AS n FROM {table}")
+        primary_key = await _primary_key_columns(conn, table)
+        sequences = await _sequences(conn, table)
+        indexes = await _secondary_indexes(conn, table)
+
+        await conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        await conn.execute(f"""
+            CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING IDENTITY)
+            PARTITION BY RANGE (timestamp)
+        """)
+
+        # A serial oszlopok szekvenciája a régi táblához tartozik; át kell tenni, különben a
+        # legacy tábla eldobása vinné magával
+        for column, sequence in sequences.items():
+            if await conn.fetchval("SELECT pg_get_serial_sequence($1, $2)", table, column) is None:
+                await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.{column}")
+
+        if primary_key:
+            columns = primary_key + ([] if "timestamp" in primary_key else ["timestamp"])
+            await conn.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(columns)})")
+        await conn.execute(f"CREATE INDEX {table}_{key}_timestamp_idx ON {table} ({key}, timestamp)")
+        copied_indexes = await _copy_indexes(conn, table, indexes)
+
+        today = _month_start(date.today())
+        first = _month_start(bounds["first"]) if bounds["first"] else today
+        last = max(_month_start(bounds["last"]) if bounds["last"] else today, today)
+        month = first
+        copied = 0
+        while month <= _add_months(last, months_ahead):
+            await create_partition(conn, table, month)
+            if bounds["first"] and month <= _month_start(bounds["last"]):
+                status = await conn.execute(f"""
+                    INSERT INTO {table}
+                    SELECT * FROM {legacy}
+                    WHERE timestamp >= $1 AND timestamp < $2
+                """, datetime.combine(month, datetime.min.time()),
+                    datetime.combine(_add_months(month, 1), datetime.min.time()))
+                copied += int(status.split()[-1])
+            month = _add_months(month, 1)
+
+        # Identity oszlopok új szekvenciát kapnak, ami 1-ről indulna
+        identity_columns = await conn.fetch("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = to_regclass($1) AND attidentity <> '' AND NOT attisdropped
+        """, table)
+        for row in identity_columns:
+            column = row["attname"]
+            await conn.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                f"COALESCE((SELECT MAX({column}) FROM {table}), 1))"
+            )
+
+        if copied != bounds["n"]:
+            raise RuntimeError(
+                f"{table}: {bounds['n']} sorból {copied} került át (NULL timestamp?); visszagörgetés."
+            )
+        if drop_legacy:
+            await conn.execute(f"DROP TABLE {legacy}")
+
+    # Az inverter_latest trigger a régi táblával együtt átnevződött; az új táblára kell
+    if table == "inverter_data":
+        await ensure_inverter_latest_schema(conn)
+
+    print(f"[{datetime.now()}] {table}: {copied} sor partícionálva, átvett indexek: {copied_indexes or '-'}"
+          f"{'' if drop_legacy else f', a régi tábla {legacy} néven megmaradt'}.")
+
+
+async def maintain_table(conn, table: str, months_ahead: int, retention_months: int = None, detach_only: bool = False):
+    if not await is_partitioned(conn, table):
+        print(f"{table}: nem partícionált, kihagyva.")
+        return {"created": [], "removed": []}
+
+    today = _month_start(date.today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(today, offset)
+        if await create_partition(conn, table, month):
+            created.append(partition_name(table, month))
+
+    removed = []
+    if retention_months:
+        # A cold_storage importálja ezt a modult, ezért itt helyben
+        from cold_storage import unarchived_plants
+
+        cutoff = _add_months(today, -retention_months)
+        for month, name in await list_partitions(conn, table):
+            if month < cutoff:
+                await conn.execute(f"LOCK TABLE {name} IN SHARE MODE")
+                unarchived = await unarchived_plants(conn, table, month)
+                if unarchived is None or unarchived:
+                    print(f"{table}: {name} nincs (teljesen) archiválva"
+                          f"{f' (plant {unarchived})' if unarchived else ''}; nem dobjuk el.")
+                    continue
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                if not detach_only:
+                    await conn.execute(f"DROP TABLE {name}")
+                removed.append(name)
+
+    print(f"[{datetime.now()}] {table}: új partíciók {created or '-'}, eltávolítva {removed or '-'}")
+    return {"created": created, "removed": removed}
+
+
+# A végpontok valódi lekérdezései, a futtató modulokból; mindegyiknek legfeljebb max_partitions
+# partíciót szabad érintenie. A felülről nyitott lekérdezés az előre létrehozott (üres) jövőbeli
+# partíciókat is érinti
+def _verify_cases(sample, months_ahead: int = MONTHS_AHEAD):
+    # A yield_rollup a cold_storage-on át ezt a modult importálja, ezért itt helyben
+    from yield_rollup import LIVE_DAYS_QUERY
+
+    plant_id = sample["plant_id"]
+    plant_ids = sample["plant_ids"]
+    inverter = sample["inverter"]
+    day_start = sample["day_start"]
+    day_end = day_start + timedelta(days=1)
+    # Minden plantnak van watermarkja, mint a bemelegedett snapshot cache-ben
+    watermarks = [day_start] * len(plant_ids)
+    cases = [
+        ("snapshot logger", "logger_data", latest_rows_query("logger_data", "plant_id", "plants"),
+         (plant_ids, watermarks, SNAPSHOT_FUTURE_TOLERANCE), 2),
+        ("snapshot meter", "meter_data", latest_rows_query("meter_data", "plant_id", "plants"),
+         (plant_ids, watermarks, SNAPSHOT_FUTURE_TOLERANCE), 2),
+        ("production-data meter", "meter_data", power_series_query("meter_data", False),
+         (plant_id, day_start, day_end), 2),
+        ("production-data logger bucketed", "logger_data", power_series_query("logger_data", True),
+         (plant_id, day_start, day_end, 300), 2),
+        ("daily yield live", "logger_data", LIVE_DAYS_QUERY, ([plant_id], [day_start], day_end), 2),
+        ("production websocket delta", "alteo_data", DELTA_QUERY, (plant_id, day_start), 2 + months_ahead),
+    ]
+    if inverter is not None:
+        cases.append((
+            "string hourly rollup", "inverter_data", partials_query(inverter["max_string_count"]),
+            (inverter["id"], inverter["plant_id"], day_start, day_end), 2,
+        ))
+    return cases
+
+
+def _scanned_relations(plan, table: str, found: set):
+    # EXPLAIN ANALYZE tervben a futás közben kiszűrt partíciók csomópontja "never executed" (0 loop)
+    if isinstance(plan, dict):
+        name = plan.get("Relation Name")
+        if name and (name == table or name.startswith(f"{table}_p")) and plan.get("Actual Loops", 1):
+            found.add(name)
+        for value in plan.values():
+            _scanned_relations(value, table, found)
+    elif isinstance(plan, list):
+        for item in plan:
+            _scanned_relations(item, table, found)
+    return found
+
+
+async def verify(conn, months_ahead: int = MONTHS_AHEAD) -> bool:
+    plant_ids = [r["id"] for r in await conn.fetch("SELECT id FROM plants ORDER BY id")]
+    inverter = await conn.fetchrow("SELECT id, plant_id, max_string_count FROM inverters ORDER BY id LIMIT 1")
+    sample = {
+        "plant_id": plant_ids[0] if plant_ids else 1,
+        "plant_ids": plant_ids,
+        "inverter": inverter,
+        "day_start": datetime.combine(date.today() - timedelta(days=1), datetime.min.time()),
+    }
+
+    ok = True
+    for label, table, query, args, max_partitions in _verify_cases(sample, months_ahead):
+        if not await is_partitioned(conn, table):
+            print(f"SKIP {label}: {table} nem partícionált")
+            continue
+        total = len(await list_partitions(conn, table))
+        # Az ANALYZE valóban lefuttatja a lekérdezést (a rollup INSERT-et is); a tranzakció visszagörgetve
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            plan = json.loads(await conn.fetchval(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", *args))
+        finally:
+            await transaction.rollback()
+        scanned = _scanned_relations(plan, table, set())
+        passed = len(scanned) <= max_partitions
+        ok = ok and passed
+        print(f"{'OK  ' if passed else 'FAIL'} {label}: {len(scanned)}/{total} partíció ({', '.join(sorted(scanned)) or '-'})")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Monthly range partitioning for raw telemetry tables")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = sub.add_parser("convert")
+    convert_parser.add_argument("--table", action="append", choices=list(TELEMETRY_TABLES))
+    convert_parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    convert_parser.add_argument("--drop-legacy", action="store_true")
+
+    maintain_parser = sub.add_parser("maintain")
+    maintain_parser.add_argument("--table", action="append", choices=list(TELEMETRY_TABLES))
+    maintain_parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    maintain_parser.add_argument("--retention-months", type=int)
+    maintain_parser.add_argument("--detach-only", action="store_true")
+
+    verify_parser = sub.add_parser("verify")
+    verify_parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(**connection_kwargs())
+    try:
+        if args.command == "verify":
+            if not await verify(conn, args.months_ahead):
+                sys.exit(1)
+            return
+
+        for table in args.table or list(TELEMETRY_TABLES):
+            if args.command == "convert":
+                await convert_table(conn, table, TELEMETRY_TABLES[table], args.months_ahead, args.drop_legacy)
+            else:
+                async with conn.transaction():
+                    await maintain_table(conn, table, args.months_ahead, args.retention_months, args.detach_only)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
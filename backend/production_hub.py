@@ -0,0 +1,184 @@
+import asyncio
+import time
+from fastapi import WebSocket, WebSocketDisconnect
+from metrics import ws_open, ws_messages, ws_send_lag
+
+# Plantonként egyetlen lekérdező fut, amíg van feliratkozó;
+# a socketek csak a közös eredményt kapják meg.
+POLL_INTERVAL = 1.0
+SNAPSHOT_SIZE = 30
+SUBSCRIBER_QUEUE_SIZE = 16
+
+DELTA_QUERY = """
+    SELECT timestamp, prod_power
+    FROM alteo_data
+    WHERE plant_id = $1 AND timestamp > $2
+    ORDER BY timestamp
+"""
+
+db_pool = None
+
+
+def set_db_pool(pool):
+    global db_pool
+    db_pool = pool
+
+
+def _serialize(rows):
+    return [
+        {"timestamp": row["timestamp"].isoformat(), "prod_power": row["prod_power"]}
+        for row in rows
+    ]
+
+
+class _Subscriber:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, message, snapshot):
+        # Lassú kliens: a sorban álló deltákat eldobjuk, és friss pillanatképpel kezd újra
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = {"type": "snapshot", "data": snapshot}
+        self.queue.put_nowait((time.perf_counter(), message))
+
+
+class _PlantChannel:
+    def __init__(self, plant_id: int):
+        self.plant_id = plant_id
+        self.subscribers = set()
+        self.snapshot = []
+        self.last_timestamp = None
+        self.ready = asyncio.Event()
+        self.task = None
+
+    async def _load_snapshot(self, conn):
+        rows = await conn.fetch("""
+            SELECT timestamp, prod_power
+            FROM alteo_data
+            WHERE plant_id = $1
+            ORDER BY timestamp DESC
+            LIMIT $2
+        """, self.plant_id, SNAPSHOT_SIZE)
+        rows = list(reversed(rows))
+        if rows:
+            self.last_timestamp = rows[-1]["timestamp"]
+        self.snapshot = _serialize(rows)
+
+    async def _load_delta(self, conn):
+        rows = await conn.fetch(DELTA_QUERY, self.plant_id, self.last_timestamp)
+        if not rows:
+            return []
+        self.last_timestamp = rows[-1]["timestamp"]
+        delta = _serialize(rows)
+        self.snapshot = (self.snapshot + delta)[-SNAPSHOT_SIZE:]
+        return delta
+
+    async def run(self):
+        while self.subscribers:
+            message = None
+            try:
+                async with db_pool.acquire() as conn:
+                    if self.last_timestamp is None:
+                        await self._load_snapshot(conn)
+                        # Aki már üres pillanatképet kapott, most megkapja az elsőt
+                        if self.ready.is_set() and self.snapshot:
+                            message = {"type": "snapshot", "data": self.snapshot}
+                    else:
+                        delta = await self._load_delta(conn)
+                        if delta:
+                            message = {"type": "delta", "data": delta}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Production poller hiba (plant {self.plant_id}):", e)
+
+            self.ready.set()
+            if message:
+                for subscriber in list(self.subscribers):
+                    subscriber.offer(message, self.snapshot)
+
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+class ProductionHub:
+    def __init__(self):
+        self.channels = {}
+
+    def subscriber_count(self, plant_id: int = None) -> int:
+        if plant_id is not None:
+            channel = self.channels.get(plant_id)
+            return len(channel.subscribers) if channel else 0
+        return sum(len(c.subscribers) for c in self.channels.values())
+
+    def _subscribe(self, plant_id: int, websocket: WebSocket) -> _Subscriber:
+        channel = self.channels.get(plant_id)
+        if channel is None:
+            channel = _PlantChannel(plant_id)
+            self.channels[plant_id] = channel
+        subscriber = _Subscriber(websocket)
+        channel.subscribers.add(subscriber)
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.create_task(channel.run())
+        return subscriber
+
+    def _unsubscribe(self, plant_id: int, subscriber: _Subscriber):
+        channel = self.channels.get(plant_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers:
+            # Utolsó feliratkozó is elment → a lekérdezés leáll
+            if channel.task:
+                channel.task.cancel()
+            del self.channels[plant_id]
+
+    async def _send_loop(self, websocket: WebSocket, channel: _PlantChannel, subscriber: _Subscriber):
+        await channel.ready.wait()
+        # A pillanatkép már tartalmazza a csatlakozás óta sorba került deltákat: ezeket eldobjuk,
+        # különben ugyanaz a pont kétszer érkezne (a kiolvasás és az ürítés között nincs await)
+        snapshot = channel.snapshot
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        await websocket.send_json({"type": "snapshot", "data": snapshot})
+        ws_messages.inc("production")
+        while True:
+            enqueued_at, message = await subscriber.queue.get()
+            await websocket.send_json(message)
+            ws_messages.inc("production")
+            ws_send_lag.observe("production", value=time.perf_counter() - enqueued_at)
+
+    async def _wait_disconnect(self, websocket: WebSocket):
+        # Csendes időszakban is észre kell venni, ha a kliens lecsatlakozott
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+    async def serve(self, websocket: WebSocket, plant_id: int):
+        subscriber = self._subscribe(plant_id, websocket)
+        channel = self.channels[plant_id]
+        ws_open.inc("production")
+        tasks = {
+            asyncio.create_task(self._send_loop(websocket, channel, subscriber)),
+            asyncio.create_task(self._wait_disconnect(websocket)),
+        }
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                if error and not isinstance(error, (WebSocketDisconnect, RuntimeError)):
+                    print(f"Production websocket hiba (plant {plant_id}):", error)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._unsubscribe(plant_id, subscriber)
+            ws_open.dec("production")
+
+    async def close(self):
+        for channel in list(self.channels.values()):
+            if channel.task:
+                channel.task.cancel()
+        self.channels.clear()
@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import os
+import time
+import traceback
+from datetime import date, datetime, timedelta, timezone
+
+import calculate_inverters_hourly_avg as string_rollup
+from cold_storage import COLD_STORAGE_DIR, run_archive
+from db_config import create_pool, pool_settings
+from partition_telemetry import MONTHS_AHEAD, TELEMETRY_TABLES, maintain_table
+from string_health import ensure_schema as ensure_string_health_schema, run_string_health
+from yield_rollup import LOCAL_TZ, ensure_schema as ensure_yield_schema, finalize_plant, finalize_range
+
+# Háttérfeladatok ütemezője egy közös, hosszú életű poolon.
+#
+#   python scheduler.py                          # ütemezett futás (előtérben)
+#   python scheduler.py run string_rollup        # egy feladat azonnal
+#   python scheduler.py backfill yield_finalize --start 2024-01-01 --end 2024-06-30 --concurrency 4
+#   python scheduler.py runs                     # utolsó futások
+#
+# Az API folyamatban is futhat: SCHEDULER_ENABLED=1 esetén a main.py indítja a background poolon.
+# Egy feladatból (backfillnél: egy darabból) egyszerre csak egy példány fut a teljes
+# rendszerben – Postgres advisory lock –, folyamaton belül pedig legfeljebb max_concurrency.
+# A backfill darabok a feladat zárját megosztott módban is fogják: egymással párhuzamosan
+# futhatnak, az ütemezett futással nem.
+# Minden futás a job_runs táblába kerül időtartammal és az érintett sorok számával.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+
+
+async def ensure_schema(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            id           SERIAL PRIMARY KEY,
+            job          TEXT NOT NULL,
+            scope        TEXT NOT NULL,
+            status       TEXT NOT NULL,
+            started_at   TIMESTAMP NOT NULL,
+            finished_at  TIMESTAMP,
+            duration_ms  DOUBLE PRECISION,
+            rows         BIGINT,
+            error        TEXT
+        );
+        CREATE INDEX IF NOT EXISTS job_runs_job_started ON job_runs (job, started_at DESC);
+    """)
+    # A feladatok saját táblái is itt, egyszer, nem minden futáskor
+    await ensure_string_health_schema(conn)
+
+
+def hourly(minute: int = 0):
+    def next_run(now: datetime) -> datetime:
+        candidate = now.replace(minute=minute, second=0, microsecond=0)
+        return candidate if candidate > now else candidate + timedelta(hours=1)
+    return next_run
+
+
+def daily(hour: int, minute: int = 0):
+    # Helyi (Europe/Budapest) idő szerint
+    def next_run(now: datetime) -> datetime:
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return candidate if candidate > now else candidate + timedelta(days=1)
+    return next_run
+
+
+class PartialFailure(Exception):
+    def __init__(self, message: str, rows: int):
+        super().__init__(message)
+        self.rows = rows
+
+
+class Job:
+    def __init__(self, name, run, schedule, backfill=None, max_concurrency: int = 1, monthly_chunks: bool = False):
+        self.name = name
+        self.run = run                  # async (pool) -> érintett sorok
+        self.schedule = schedule        # datetime -> következő futás
+        self.backfill = backfill        # async (pool, első nap, utolsó nap) -> érintett sorok
+        self.max_concurrency = max_concurrency
+        # Havi összesítést is író feladatnál egy hónap nem oszlik több párhuzamos darabra
+        self.monthly_chunks = monthly_chunks
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    def set_concurrency(self, value: int):
+        self.max_concurrency = value
+        self.semaphore = asyncio.Semaphore(value)
+
+
+# --- Feladatok -------------------------------------------------------------------------------
+
+async def _rollup_run(pool) -> int:
+    string_rollup.set_db_pool(pool)
+    result = await string_rollup.calculate_weekly_hourly_avg()
+    if result["failed"]:
+        raise PartialFailure(f"failed inverters: {result['failed']}", result["rows"])
+    return result["rows"]
+
+
+async def _rollup_backfill(pool, first_day: date, last_day: date) -> int:
+    # A részösszegek újraszámolása a tartományra (az első nap ablakához az előző 6 napra is), majd
+    # a heti átlag napról napra, calculation_date = az adott nap, a nap végéig (UTC) tartó ablakkal
+    # – mintha aznap az utolsó rendes futás a nap végén lett volna. A mai napnál csak a lezárt órákig.
+    now_hour = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    start = datetime.combine(first_day, datetime.min.time()) - (string_rollup.AVG_WINDOW - timedelta(days=1))
+    end = min(datetime.combine(last_day + timedelta(days=1), datetime.min.time()), now_hour)
+    async with pool.acquire() as conn:
+        await string_rollup.ensure_schema(conn)
+        await string_rollup.check_schema(conn)
+        inverters = await conn.fetch(
+            "SELECT id, plant_id, max_string_count FROM inverters WHERE max_string_count > 0"
+        )
+        rows = 0
+        for inverter in inverters:
+            async with conn.transaction():
+                rows += await string_rollup.aggregate_partials(conn, inverter, start, end)
+                day = first_day
+                while day <= last_day and datetime.combine(day, datetime.min.time()) < now_hour:
+                    until = min(datetime.combine(day + timedelta(days=1), datetime.min.time()), now_hour)
+                    rows += await string_rollup.refresh_weekly_avg(conn, inverter, until, day)
+                    day += timedelta(days=1)
+        # Az API string profil kockái újraépülnek
+        await conn.execute("SELECT pg_notify('string_profile', '')")
+    return rows
+
+
+async def _yield_run(pool) -> int:
+    async with pool.acquire() as conn:
+        await ensure_yield_schema(conn)
+        rows = 0
+        for plant in await conn.fetch("SELECT id FROM plants ORDER BY id"):
+            rows += await finalize_plant(conn, plant["id"])
+    return rows
+
+
+async def _yield_backfill(pool, first_day: date, last_day: date) -> int:
+    async with pool.acquire() as conn:
+        await ensure_yield_schema(conn)
+        rows = 0
+        for plant in await conn.fetch("SELECT id FROM plants ORDER BY id"):
+            async with conn.transaction():
+                rows += await finalize_range(conn, plant["id"], first_day, last_day)
+    return rows
+
+
+async def _string_health_run(pool) -> int:
+    async with pool.acquire() as conn:
+        return (await run_string_health(conn))["rows"]
+
+
+async def _partition_run(pool) -> int:
+    retention = os.getenv("PARTITION_RETENTION_MONTHS")
+    changed = 0
+    async with pool.acquire() as conn:
+        for table in TELEMETRY_TABLES:
+            async with conn.transaction():
+                result = await maintain_table(conn, table, MONTHS_AHEAD, int(retention) if retention else None)
+            changed += len(result["created"]) + len(result["removed"])
+    return changed
+
+
+async def _cold_archive_run(pool) -> int:
+    if not COLD_STORAGE_DIR:
+        print(f"[{datetime.now()}] Hideg tár nincs beállítva (COLD_STORAGE_DIR), kihagyva.")
+        return 0
+    async with pool.acquire() as conn:
+        result = await run_archive(conn)
+    return result["rows"] + result["purged"]
+
+
+JOBS = {
+    job.name: job for job in (
+        Job("string_rollup", _rollup_run, daily(2, 0), backfill=_rollup_backfill, max_concurrency=2),
+        Job("yield_finalize", _yield_run, daily(1, 0), backfill=_yield_backfill, max_concurrency=4, monthly_chunks=True),
+        Job("string_health", _string_health_run, hourly(10)),
+        Job("partition_maintain", _partition_run, daily(3, 0)),
+        Job("cold_archive", _cold_archive_run, daily(4, 0)),
+    )
+}
+
+
+# --- Futtatás --------------------------------------------------------------------------------
+
+def backfill_chunks(first_day: date, last_day: date, chunk_days: int, monthly: bool = False):
+    chunks = []
+    day = first_day
+    while day <= last_day:
+        if monthly:
+            next_month = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+            chunk_end = min(next_month - timedelta(days=1), last_day)
+        else:
+            chunk_end = min(day + timedelta(days=chunk_days - 1), last_day)
+        chunks.append((day, chunk_end))
+        day = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def job_locks(job: Job, first_day: date = None, last_day: date = None):
+    # (zárfüggvény, feloldó függvény, kulcs) párok, a kérés sorrendjében
+    if first_day is None:
+        return [("pg_try_advisory_lock", "pg_advisory_unlock", f"job:{job.name}")]
+    return [
+        ("pg_try_advisory_lock_shared", "pg_advisory_unlock_shared", f"job:{job.name}"),
+        ("pg_try_advisory_lock", "pg_advisory_unlock", f"job:{job.name}:{first_day}..{last_day}"),
+    ]
+
+
+async def _try_locks(conn, locks) -> list:
+    # Mind vagy egyik sem: részleges siker esetén a megszerzett zárakat elengedi
+    held = []
+    for lock, unlock, key in locks:
+        if not await conn.fetchval(f"SELECT {lock}(hashtext($1))", key):
+            await _unlock(conn, held)
+            return []
+        held.append((lock, unlock, key))
+    return held
+
+
+async def _unlock(conn, held):
+    for _, unlock, key in reversed(held):
+        await conn.execute(f"SELECT {unlock}(hashtext($1))", key)
+
+
+class Scheduler:
+    def __init__(self, pool, jobs=None):
+        self.pool = pool
+        self.jobs = jobs or JOBS
+        self.tasks = []
+        self.running = set()
+
+    async def _record_start(self, conn, job, scope, status="running"):
+        return await conn.fetchval("""
+            INSERT INTO job_runs (job, scope, status, started_at)
+            VALUES ($1, $2, $3, NOW()::TIMESTAMP)
+            RETURNING id
+        """, job.name, scope, status)
+
+    async def _record_end(self, run_id, status, started, rows=None, error=None):
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE job_runs
+                SET status = $2, finished_at = NOW()::TIMESTAMP, duration_ms = $3, rows = $4, error = $5
+                WHERE id = $1
+            """, run_id, status, round((time.perf_counter() - started) * 1000, 1), rows, error)
+
+    async def run_job(self, job: Job, scope: str = "scheduled", first_day: date = None, last_day: date = None,
+                      wait: bool = False) -> dict:
+        # wait=False: ha a folyamaton belüli limit betelt, a futás kimarad (ütemezett indításnál)
+        if not wait and job.semaphore.locked():
+            async with self.pool.acquire() as conn:
+                await self._record_start(conn, job, scope, status="skipped")
+            print(f"[{datetime.now()}] {job.name} ({scope}): még fut az előző, kihagyva.")
+            return {"job": job.name, "scope": scope, "status": "skipped"}
+
+        async with job.semaphore:
+            # A zár egy saját kapcsolaton él a futás végéig
+            async with self.pool.acquire() as lock_conn:
+                # Ütemezett és kézi futás a feladat zárját kizárólagosan kéri; a backfill darab
+                # megosztottan, mellé a darab saját zárját
+                held = await _try_locks(lock_conn, job_locks(job, first_day, last_day))
+                if not held:
+                    await self._record_start(lock_conn, job, scope, status="skipped")
+                    print(f"[{datetime.now()}] {job.name} ({scope}): másik példány futtatja, kihagyva.")
+                    return {"job": job.name, "scope": scope, "status": "skipped"}
+
+                try:
+                    run_id = await self._record_start(lock_conn, job, scope)
+                    started = time.perf_counter()
+                    try:
+                        if first_day is not None:
+                            rows = await job.backfill(self.pool, first_day, last_day)
+                        else:
+                            rows = await job.run(self.pool)
+                        status, error = "ok", None
+                    except PartialFailure as e:
+                        rows, status, error = e.rows, "partial", str(e)
+                    except Exception as e:
+                        rows, status, error = None, "failed", "".join(traceback.format_exception_only(type(e), e)).strip()
+                        print(f"[{datetime.now()}] {job.name} ({scope}) hiba:", error)
+                    await self._record_end(run_id, status, started, rows, error)
+                finally:
+                    await _unlock(lock_conn, held)
+
+        print(f"[{datetime.now()}] {job.name} ({scope}): {status}, {rows} sor, "
+              f"{(time.perf_counter() - started):.1f} s")
+        return {"job": job.name, "scope": scope, "status": status, "rows": rows, "error": error}
+
+    async def backfill(self, job: Job, first_day: date, last_day: date, chunk_days: int = 7):
+        if job.backfill is None:
+            raise ValueError(f"{job.name} does not support backfill")
+        chunks = backfill_chunks(first_day, last_day, chunk_days, job.monthly_chunks)
+        # A darabok párhuzamosan mennek, a job max_concurrency korlátjával
+        return await asyncio.gather(*(
+            self.run_job(job, f"backfill {a.isoformat()}..{b.isoformat()}", a, b, wait=True)
+            for a, b in chunks
+        ))
+
+    async def _loop(self, job: Job):
+        while True:
+            now = datetime.now(LOCAL_TZ)
+            next_run = job.schedule(now)
+            # UTC-ben vonunk ki, hogy az óraátállítás napján se csússzon egy órát
+            await asyncio.sleep((next_run.astimezone(timezone.utc) - now.astimezone(timezone.utc)).total_seconds())
+            task = asyncio.create_task(self.run_job(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def start(self):
+        async with self.pool.acquire() as conn:
+            await ensure_schema(conn)
+        self.tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+        print(f"[{datetime.now()}] Ütemező elindult: {', '.join(self.jobs)}")
+
+    async def stop(self):
+        for task in self.tasks + list(self.running):
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.running, return_exceptions=True)
+        self.tasks = []
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Background job scheduler")
+    sub = parser.add_subparsers(dest="command")
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("job", choices=list(JOBS))
+    backfill_parser = sub.add_parser("backfill")
+    backfill_parser.add_argument("job", choices=[name for name, job in JOBS.items() if job.backfill])
+    backfill_parser.add_argument("--start", type=date.fromisoformat, required=True)
+    backfill_parser.add_argument("--end", type=date.fromisoformat, required=True)
+    backfill_parser.add_argument("--chunk-days", type=int, default=7)
+    backfill_parser.add_argument("--concurrency", type=int)
+    runs_parser = sub.add_parser("runs")
+    runs_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    # Egy futó feladat a zárhoz is tart egy kapcsolatot; backfillnél darabonként legalább kettő kell
+    overrides = {}
+    if args.command == "backfill" and args.concurrency:
+        overrides["max_size"] = max(pool_settings("background")["max_size"], 2 * args.concurrency + 1)
+    pool = await create_pool("background", **overrides)
+    scheduler = Scheduler(pool)
+    try:
+        async with pool.acquire() as conn:
+            await ensure_schema(conn)
+
+        if args.command == "run":
+            await scheduler.run_job(JOBS[args.job], scope="manual", wait=True)
+        elif args.command == "backfill":
+            job = JOBS[args.job]
+            if args.concurrency:
+                job.set_concurrency(args.concurrency)
+            await scheduler.backfill(job, args.start, args.end, args.chunk_days)
+        elif args.command == "runs":
+            async with pool.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT * FROM job_runs ORDER BY started_at DESC LIMIT $1", args.limit
+                )
+            for r in rows:
+                print(f"{r['started_at']:%Y-%m-%d %H:%M:%S}  {r['job']:20s} {r['scope']:32s} "
+                      f"{r['status']:8s} {r['duration_ms'] or 0:10.1f} ms  {r['rows'] if r['rows'] is not None else '-'}")
+        else:
+            await scheduler.start()
+            await asyncio.Event().wait()
+    finally:
+        await scheduler.stop()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
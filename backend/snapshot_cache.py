@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import os
+import time as _time
+from datetime import timedelta
+from inverter_latest import string_columns
+
+# A "legfrissebb mérés" végpontok memóriából szolgálnak ki; az adatbázist
+# legfeljebb SNAPSHOT_MAX_AGE másodpercenként egyszer kérdezzük le, a nézők számától függetlenül.
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "30"))
+# Ennél távolabbi jövőbeli időbélyegű sorokat (hibás logger óra) nem veszünk figyelembe
+SNAPSHOT_FUTURE_TOLERANCE = timedelta(minutes=int(os.getenv("SNAPSHOT_FUTURE_TOLERANCE_MINUTES", "5")))
+
+
+def latest_rows_query(table: str, key: str, parent_table: str) -> str:
+    # Kulcsonként saját watermark és egy indexelt LIMIT 1: a lemaradó logger sem marad ki,
+    # és egy jövőbeli időbélyegű sor (a SNAPSHOT_FUTURE_TOLERANCE-en túl) senkit nem fagyaszt be.
+    # Paraméterek: kulcsok, watermarkok, tolerancia (a partition_telemetry verify is ezt futtatja)
+    return f"""
+        SELECT d.*
+        FROM {parent_table} p
+        LEFT JOIN unnest($1::int[], $2::timestamp[]) AS w(key, since) ON w.key = p.id
+        CROSS JOIN LATERAL (
+            SELECT * FROM {table}
+            WHERE {key} = p.id
+              AND timestamp > COALESCE(w.since, '-infinity')
+              AND timestamp <= (NOW() AT TIME ZONE 'UTC') + $3::INTERVAL
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ) d
+    """
+
+
+class _LatestTable:
+    def __init__(self, table: str, key: str, parent_table: str):
+        self.table = table
+        self.key = key
+        self.parent_table = parent_table
+        self.rows = {}
+
+    @property
+    def watermark(self):
+        return max((row["timestamp"] for row in self.rows.values()), default=None)
+
+    async def _load(self, conn):
+        keys = list(self.rows)
+        return await conn.fetch(
+            latest_rows_query(self.table, self.key, self.parent_table),
+            keys, [self.rows[k]["timestamp"] for k in keys], SNAPSHOT_FUTURE_TOLERANCE
+        )
+
+    def _to_dict(self, row) -> dict:
+        return dict(row)
+
+    async def refresh(self, conn) -> int:
+        changed = 0
+        for row in await self._load(conn):
+            self.rows[row[self.key]] = self._to_dict(row)
+            changed += 1
+        return changed
+
+
+class _InverterLatest(_LatestTable):
+    # Az inverter_latest tábla inverterenként egy sort tart (lásd inverter_latest.py); kicsi,
+    # így minden frissítés a teljes táblát olvassa, watermark nélkül
+    def __init__(self):
+        super().__init__("inverter_latest", "inverter_id", "inverters")
+
+    async def _load(self, conn):
+        rows = await conn.fetch("""
+            SELECT * FROM inverter_latest
+            WHERE timestamp <= (NOW() AT TIME ZONE 'UTC') + $1::INTERVAL
+        """, SNAPSHOT_FUTURE_TOLERANCE)
+        return [
+            row for row in rows
+            if row["inverter_id"] not in self.rows or row["timestamp"] != self.rows[row["inverter_id"]]["timestamp"]
+        ]
+
+    def _to_dict(self, row) -> dict:
+        return {
+            "inverter_id": row["inverter_id"],
+            "timestamp": row["timestamp"],
+            "active_power": row["active_power"],
+            **string_columns(row),
+        }
+
+
+class SnapshotStore:
+    def __init__(self, max_age: float = SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self.logger = _LatestTable("logger_data", "plant_id", "plants")
+        self.meter = _LatestTable("meter_data", "plant_id", "plants")
+        self.inverter = _InverterLatest()
+        self.inverters = {}
+        self.db_pool = None
+        self.refreshed_at = None
+        self.hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+        self.last_refresh_ms = None
+        self._lock = asyncio.Lock()
+
+    def set_db_pool(self, pool):
+        self.db_pool = pool
+
+    def age(self):
+        if self.refreshed_at is None:
+            return None
+        return _time.monotonic() - self.refreshed_at
+
+    def _is_fresh(self) -> bool:
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    async def _refresh(self):
+        started = _time.monotonic()
+        async with self.db_pool.acquire() as conn:
+            inverters = await conn.fetch("""
+                SELECT id, plant_id, name, max_string_count, max_power
+                FROM inverters
+                ORDER BY id
+            """)
+            await self.logger.refresh(conn)
+            await self.meter.refresh(conn)
+            await self.inverter.refresh(conn)
+        self.inverters = {row["id"]: dict(row) for row in inverters}
+        self.refreshed_at = _time.monotonic()
+        self.last_refresh_ms = round((self.refreshed_at - started) * 1000, 2)
+
+    async def ensure_fresh(self):
+        if self._is_fresh():
+            self.hits += 1
+            return
+        # Egyszerre csak egy frissítés fut, a többi kérés megvárja
+        async with self._lock:
+            if self._is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            try:
+                await self._refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                if self.refreshed_at is None:
+                    raise
+                print("Snapshot frissítési hiba, a korábbi állapotot szolgáljuk ki:", e)
+
+    async def latest_logger(self, plant_id: int):
+        await self.ensure_fresh()
+        row = self.logger.rows.get(plant_id)
+        return dict(row) if row else None
+
+    async def latest_meter(self, plant_id: int):
+        await self.ensure_fresh()
+        row = self.meter.rows.get(plant_id)
+        return dict(row) if row else None
+
+    # plant_id → utolsó logger_data időbélyeg; a plant lista ebből O(plantok) alatt épül
+    async def plant_last_seen(self):
+        await self.ensure_fresh()
+        return {plant_id: row["timestamp"] for plant_id, row in self.logger.rows.items()}
+
+    # A plant forrás-időbélyegei; ETag validátornak elég olcsó
+    async def plant_watermarks(self, plant_id: int):
+        await self.ensure_fresh()
+        logger = self.logger.rows.get(plant_id)
+        meter = self.meter.rows.get(plant_id)
+        # Inverterenként (id, metaadat, időbélyeg) – bármelyik inverter frissülése vagy
+        # átnevezése / névleges teljesítmény módosítása új validátort ad, nem csak a legújabbé
+        inverter_keys = sorted(
+            (inverter_id, meta["name"], meta["max_string_count"], meta["max_power"],
+             self.inverter.rows[inverter_id]["timestamp"] if inverter_id in self.inverter.rows else None)
+            for inverter_id, meta in self.inverters.items()
+            if meta["plant_id"] == plant_id
+        )
+        return {
+            "logger": logger["timestamp"] if logger else None,
+            "meter": meter["timestamp"] if meter else None,
+            "inverter": hashlib.sha1(repr(inverter_keys).encode()).hexdigest() if inverter_keys else None,
+        }
+
+    # (inverter metaadat, legutolsó inverter_data sor) párok, inverter id szerint rendezve
+    async def latest_inverters(self, plant_id: int):
+        await self.ensure_fresh()
+        result = []
+        for inverter_id, meta in self.inverters.items():
+            if meta["plant_id"] != plant_id:
+                continue
+            row = self.inverter.rows.get(inverter_id)
+            if row is not None:
+                result.append((meta, dict(row)))
+        return result
+
+    def stats(self):
+        total = self.hits + self.misses
+        age = self.age()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "refresh_errors": self.refresh_errors,
+            "age_seconds": round(age, 3) if age is not None else None,
+            "max_age_seconds": self.max_age,
+            "last_refresh_ms": self.last_refresh_ms,
+            "plants": {
+                "logger": len(self.logger.rows),
+                "meter": len(self.meter.rows),
+            },
+            "inverters": len(self.inverter.rows),
+            "watermarks": {
+                "logger_data": self.logger.watermark.isoformat() if self.logger.watermark else None,
+                "meter_data": self.meter.watermark.isoformat() if self.meter.watermark else None,
+                "inverter_latest": self.inverter.watermark.isoformat() if self.inverter.watermark else None,
+            },
+        }
+
+
+snapshot_store = SnapshotStore()
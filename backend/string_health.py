@@ -0,0 +1,236 @@
+import asyncio
+import os
+import warnings
+from datetime import datetime, timedelta
+
+import asyncpg
+import numpy as np
+
+from db_config import connection_kwargs
+
+# Flotta szintű string-egészség elemzés. Minden inverter legutolsó string mérései
+# (inverter_latest) és a string_weekly_hourly_avg ugyanarra az órára vonatkozó alapvonala
+# egy-egy (inverterek × stringek) mátrixba kerül, és minden string pontozása egyetlen
+# vektoros lépésben történik:
+#   - 6553.5 V / 655.35 A: a SmartLogger "nincs érték" jelzése → hibás mérés (fault)
+#   - eltérés a saját heti órás átlagától
+#   - eltérés ugyanazon inverter többi stringjének mediánjától
+# A rangsorolt találatok a string_health_findings táblába kerülnek; a felület ezt kéri le.
+VOLTAGE_SENTINEL = 6553.5
+CURRENT_SENTINEL = 655.35
+
+# Ennél régebbi inverter mérés nem kerül pontozásra
+MAX_READING_AGE = timedelta(minutes=int(os.getenv("STRING_HEALTH_MAX_AGE_MINUTES", "60")))
+# Ennél kisebb alapvonal / peer medián (kW) mellett nem számolunk relatív eltérést (éjszaka, hajnal)
+MIN_REFERENCE_KW = float(os.getenv("STRING_HEALTH_MIN_REFERENCE_KW", "0.2"))
+WARNING_DEVIATION = float(os.getenv("STRING_HEALTH_WARNING", "0.2"))
+CRITICAL_DEVIATION = float(os.getenv("STRING_HEALTH_CRITICAL", "0.5"))
+RUN_RETENTION = timedelta(days=int(os.getenv("STRING_HEALTH_RETENTION_DAYS", "7")))
+
+SEVERITY_RANK = {"fault": 3, "critical": 2, "warning": 1}
+
+
+async def ensure_schema(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS string_health_runs (
+            id         SERIAL PRIMARY KEY,
+            run_at     TIMESTAMP NOT NULL,
+            inverters  INTEGER NOT NULL,
+            strings    INTEGER NOT NULL,
+            findings   INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS string_health_findings (
+            run_id          INTEGER NOT NULL REFERENCES string_health_runs (id) ON DELETE CASCADE,
+            rank            INTEGER NOT NULL,
+            plant_id        INTEGER NOT NULL,
+            inverter_id     INTEGER NOT NULL,
+            string_index    INTEGER NOT NULL,
+            severity        TEXT NOT NULL,
+            kind            TEXT NOT NULL,
+            score           DOUBLE PRECISION NOT NULL,
+            v               DOUBLE PRECISION,
+            a               DOUBLE PRECISION,
+            power           DOUBLE PRECISION,
+            baseline        DOUBLE PRECISION,
+            peer_median     DOUBLE PRECISION,
+            baseline_dev    DOUBLE PRECISION,
+            peer_dev        DOUBLE PRECISION,
+            reading_at      TIMESTAMP NOT NULL,
+            PRIMARY KEY (run_id, rank)
+        );
+        CREATE INDEX IF NOT EXISTS string_health_findings_plant ON string_health_findings (run_id, plant_id);
+    """)
+
+
+async def _load_inputs(conn, now: datetime):
+    inverters = await conn.fetch("""
+        SELECT i.id, i.plant_id, i.max_string_count, l.timestamp, l.string_v, l.string_a
+        FROM inverter_latest l
+        JOIN inverters i ON i.id = l.inverter_id
+        WHERE i.max_string_count > 0 AND l.timestamp >= $1
+        ORDER BY i.id
+    """, now - MAX_READING_AGE)
+    if not inverters:
+        return inverters, []
+
+    # Inverterenként a mérés órájához tartozó, legutóbb számolt heti átlag
+    baselines = await conn.fetch("""
+        SELECT DISTINCT ON (a.inverter_id, a.string_number)
+            a.inverter_id, a.string_number, a.hourly_avg_power
+        FROM unnest($1::int[], $2::time[]) AS q(inverter_id, hour)
+        JOIN string_weekly_hourly_avg a
+          ON a.inverter_id = q.inverter_id AND a.calculation_hour = q.hour
+        ORDER BY a.inverter_id, a.string_number, a.calculation_date DESC
+    """,
+        [r["id"] for r in inverters],
+        [r["timestamp"].replace(minute=0, second=0, microsecond=0).time() for r in inverters])
+    return inverters, baselines
+
+
+def _matrices(inverters, baselines):
+    # Sorok: inverterek, oszlopok: stringek; a max_string_count utáni cellák NaN-ok
+    width = max(r["max_string_count"] for r in inverters)
+    voltage = np.full((len(inverters), width), np.nan)
+    current = np.full((len(inverters), width), np.nan)
+    baseline = np.full((len(inverters), width), np.nan)
+    row_of = {}
+    for row_index, r in enumerate(inverters):
+        row_of[r["id"]] = row_index
+        count = min(len(r["string_v"]), r["max_string_count"])
+        voltage[row_index, :count] = np.array(r["string_v"][:count], dtype=float)
+        current[row_index, :count] = np.array(r["string_a"][:count], dtype=float)
+    for b in baselines:
+        row_index = row_of.get(b["inverter_id"])
+        column = b["string_number"] - 1
+        if row_index is not None and 0 <= column < width and b["hourly_avg_power"] is not None:
+            baseline[row_index, column] = b["hourly_avg_power"]
+    return voltage, current, baseline
+
+
+def score(voltage: np.ndarray, current: np.ndarray, baseline: np.ndarray) -> dict:
+    # Minden bemenet (inverterek × stringek) alakú; NaN = nincs string / nincs adat
+    present = ~(np.isnan(voltage) & np.isnan(current))
+    sentinel = (voltage == VOLTAGE_SENTINEL) | (current == CURRENT_SENTINEL)
+    power = np.where(sentinel, np.nan, voltage * current / 1000)
+
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Csupa NaN sor (minden string hibás) mediánja NaN, figyelmeztetés nélkül
+        warnings.simplefilter("ignore", RuntimeWarning)
+        peer_median = np.broadcast_to(np.nanmedian(power, axis=1, keepdims=True), power.shape)
+
+        baseline_dev = np.where(baseline >= MIN_REFERENCE_KW, (power - baseline) / baseline, np.nan)
+        peer_dev = np.where(peer_median >= MIN_REFERENCE_KW, (power - peer_median) / peer_median, np.nan)
+
+    # Csak az alulteljesítés számít; a legrosszabb eltérés adja a pontszámot
+    shortfall = np.fmax(-np.nan_to_num(baseline_dev, nan=0.0), -np.nan_to_num(peer_dev, nan=0.0))
+    shortfall = np.clip(shortfall, 0.0, None)
+    score_values = np.where(sentinel, 1.0 + shortfall, shortfall)
+
+    severity = np.full(power.shape, "", dtype=object)
+    severity[shortfall >= WARNING_DEVIATION] = "warning"
+    severity[shortfall >= CRITICAL_DEVIATION] = "critical"
+    severity[sentinel] = "fault"
+    severity[~present] = ""
+
+    kind = np.where(
+        sentinel, "sentinel",
+        np.where(
+            np.nan_to_num(peer_dev, nan=0.0) <= np.nan_to_num(baseline_dev, nan=0.0),
+            "peer_deviation", "baseline_deviation",
+        ),
+    )
+    return {
+        "power": power,
+        "peer_median": peer_median,
+        "baseline_dev": baseline_dev,
+        "peer_dev": peer_dev,
+        "score": score_values,
+        "severity": severity,
+        "kind": kind,
+        "strings": int(present.sum()),
+    }
+
+
+def _value(x):
+    return None if x is None or np.isnan(x) else float(x)
+
+
+def rank_findings(inverters, voltage, current, baseline, scored):
+    rows, columns = np.nonzero(scored["severity"] != "")
+    severity_rank = np.array([SEVERITY_RANK[s] for s in scored["severity"][rows, columns]])
+    inverter_ids = np.array([inverters[i]["id"] for i in rows])
+    # Súlyosság, pontszám (csökkenő), majd inverter és string szerint
+    order = np.lexsort((columns, inverter_ids, -scored["score"][rows, columns], -severity_rank))
+    findings = []
+    for rank, k in enumerate(order, start=1):
+        i, j = rows[k], columns[k]
+        inverter = inverters[i]
+        findings.append((
+            rank,
+            inverter["plant_id"],
+            inverter["id"],
+            int(j) + 1,
+            scored["severity"][i, j],
+            str(scored["kind"][i, j]),
+            float(scored["score"][i, j]),
+            _value(voltage[i, j]),
+            _value(current[i, j]),
+            _value(scored["power"][i, j]),
+            _value(baseline[i, j]),
+            _value(scored["peer_median"][i, j]),
+            _value(scored["baseline_dev"][i, j]),
+            _value(scored["peer_dev"][i, j]),
+            inverter["timestamp"],
+        ))
+    return findings
+
+
+_FINDING_COLUMNS = [
+    "run_id", "rank", "plant_id", "inverter_id", "string_index", "severity", "kind", "score",
+    "v", "a", "power", "baseline", "peer_median", "baseline_dev", "peer_dev", "reading_at",
+]
+
+
+async def run_string_health(conn) -> dict:
+    # A táblákat az indulás hozza létre (main.py startup, scheduler.ensure_schema)
+    now = await conn.fetchval("SELECT NOW() AT TIME ZONE 'UTC'")
+    inverters, baselines = await _load_inputs(conn, now)
+
+    findings = []
+    strings = 0
+    if inverters:
+        voltage, current, baseline = _matrices(inverters, baselines)
+        scored = score(voltage, current, baseline)
+        strings = scored["strings"]
+        findings = rank_findings(inverters, voltage, current, baseline, scored)
+
+    async with conn.transaction():
+        run_id = await conn.fetchval("""
+            INSERT INTO string_health_runs (run_at, inverters, strings, findings)
+            VALUES ($1, $2, $3, $4)
+            RETURNING id
+        """, now, len(inverters), strings, len(findings))
+        if findings:
+            await conn.copy_records_to_table(
+                "string_health_findings",
+                records=[(run_id, *finding) for finding in findings],
+                columns=_FINDING_COLUMNS,
+            )
+        await conn.execute("DELETE FROM string_health_runs WHERE run_at < $1", now - RUN_RETENTION)
+
+    print(f"[{datetime.now()}] String health: {len(inverters)} inverter, {strings} string, {len(findings)} találat.")
+    return {"run_id": run_id, "inverters": len(inverters), "strings": strings, "rows": len(findings)}
+
+
+async def main():
+    conn = await asyncpg.connect(**connection_kwargs())
+    try:
+        await ensure_schema(conn)
+        await run_string_health(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+import time as _time
+
+import asyncpg
+import numpy as np
+
+from db_config import connection_kwargs
+
+# Plantonkénti string profil kocka memóriában: (inverterek × stringek × nap órái) tömb a
+# string_weekly_hourly_avg legfrissebb értékeiből. A JSON válasz (teljes és inverterenkénti
+# szelet) építéskor egyszer szerializálódik, kiszolgáláskor csak a kész bájtok mennek ki.
+# A string rollup futás végén NOTIFY string_profile jelez: ekkor minden kocka elavul, és a
+# következő kérés újraépíti. Ha a LISTEN nem elérhető, STRING_PROFILE_MAX_AGE után épül újra.
+NOTIFY_CHANNEL = "string_profile"
+STRING_PROFILE_MAX_AGE = float(os.getenv("STRING_PROFILE_MAX_AGE", "3900"))
+# Ennél régebbi számítási napot nem veszünk figyelembe (a rollup 7 napos ablakkal dolgozik)
+PROFILE_WINDOW_DAYS = 7
+HOURS = 24
+
+
+def _nested(values: np.ndarray):
+    # NaN → null, 3 tizedes
+    return [
+        [[None if np.isnan(v) else v for v in hours] for hours in strings]
+        for strings in np.round(values, 3).tolist()
+    ] if values.size else []
+
+
+class PlantProfile:
+    def __init__(self, plant_id: int, inverters, power: np.ndarray, calculation_date):
+        self.plant_id = plant_id
+        self.inverters = inverters
+        self.power = power
+        self.calculation_date = calculation_date
+        self.built_at = _time.monotonic()
+        self.index = {inverter["inverter_id"]: i for i, inverter in enumerate(inverters)}
+
+        rows = _nested(power)
+        self._payloads = {None: self._serialize(inverters, rows)}
+        for i, inverter in enumerate(inverters):
+            self._payloads[inverter["inverter_id"]] = self._serialize([inverter], rows[i:i + 1])
+        self.version = hashlib.sha1(self._payloads[None]).hexdigest()[:16]
+
+    def _serialize(self, inverters, rows) -> bytes:
+        return json.dumps({
+            "plant_id": self.plant_id,
+            "calculation_date": self.calculation_date.isoformat() if self.calculation_date else None,
+            "hours": HOURS,
+            "strings": self.power.shape[1],
+            "inverters": inverters,
+            # power[inverter][string][óra] kW, a nem létező stringek / hiányzó órák null
+            "power": rows,
+        }, separators=(",", ":")).encode()
+
+    def payload(self, inverter_id: int = None):
+        return self._payloads.get(inverter_id)
+
+    def rows(self, inverter_id: int = None):
+        # Hosszú formátum (inverter, string, óra, átlag) a táblázatos / oszlopos kimenethez
+        selected = [self.index[inverter_id]] if inverter_id is not None else range(len(self.inverters))
+        result = []
+        for i in selected:
+            inverter_id = self.inverters[i]["inverter_id"]
+            strings, hours = np.nonzero(~np.isnan(self.power[i]))
+            for string_index, hour in zip(strings.tolist(), hours.tolist()):
+                result.append({
+                    "inverter_id": inverter_id,
+                    "string_number": string_index + 1,
+                    "calculation_hour": hour,
+                    "hourly_avg_power": float(self.power[i, string_index, hour]),
+                })
+        return result
+
+
+async def build_profile(conn, plant_id: int) -> PlantProfile:
+    inverters = await conn.fetch("""
+        SELECT id, name, max_string_count
+        FROM inverters
+        WHERE plant_id = $1
+        ORDER BY id
+    """, plant_id)
+    # (inverter, string, óra) hármasonként a legutolsó számítási nap értéke
+    rows = await conn.fetch("""
+        SELECT DISTINCT ON (inverter_id, string_number, calculation_hour)
+            inverter_id, string_number, EXTRACT(HOUR FROM calculation_hour)::INT AS hour,
+            hourly_avg_power, calculation_date
+        FROM string_weekly_hourly_avg
+        WHERE plant_id = $1 AND calculation_date >= CURRENT_DATE - $2::INT
+        ORDER BY inverter_id, string_number, calculation_hour, calculation_date DESC
+    """, plant_id, PROFILE_WINDOW_DAYS)
+
+    width = max((r["max_string_count"] or 0 for r in inverters), default=0)
+    power = np.full((len(inverters), width, HOURS), np.nan)
+    index = {r["id"]: i for i, r in enumerate(inverters)}
+    calculation_date = None
+    for row in rows:
+        i = index.get(row["inverter_id"])
+        column = row["string_number"] - 1
+        if i is None or not 0 <= column < width or row["hourly_avg_power"] is None:
+            continue
+        power[i, column, row["hour"]] = row["hourly_avg_power"]
+        if calculation_date is None or row["calculation_date"] > calculation_date:
+            calculation_date = row["calculation_date"]
+
+    return PlantProfile(
+        plant_id,
+        [
+            {"inverter_id": r["id"], "inverter_name": r["name"], "string_count": r["max_string_count"] or 0}
+            for r in inverters
+        ],
+        power,
+        calculation_date,
+    )
+
+
+class StringProfileStore:
+    def __init__(self, max_age: float = STRING_PROFILE_MAX_AGE):
+        self.max_age = max_age
+        self.profiles = {}
+        self.db_pool = None
+        self.listener = None
+        self.generation = 0
+        self.builds = 0
+        self.last_build_ms = None
+        self._locks = {}
+
+    def set_db_pool(self, pool):
+        self.db_pool = pool
+
+    def _on_notify(self, *args):
+        self.generation += 1
+        self.profiles.clear()
+
+    async def start(self):
+        # Saját kapcsolat a LISTEN-hez; ha nem sikerül, csak a max_age szerinti újraépítés marad
+        try:
+            self.listener = await asyncpg.connect(**connection_kwargs())
+            await self.listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        except Exception as e:
+            print("String profil LISTEN nem elérhető, időalapú frissítés:", e)
+            self.listener = None
+
+    async def close(self):
+        if self.listener is not None:
+            try:
+                await self.listener.close()
+            except Exception:
+                pass
+            self.listener = None
+
+    def _is_fresh(self, profile) -> bool:
+        return profile is not None and _time.monotonic() - profile.built_at <= self.max_age
+
+    async def get(self, plant_id: int) -> PlantProfile:
+        profile = self.profiles.get(plant_id)
+        if self._is_fresh(profile):
+            return profile
+        # Plantonként egyszerre egy építés, a többi kérés megvárja
+        lock = self._locks.setdefault(plant_id, asyncio.Lock())
+        async with lock:
+            profile = self.profiles.get(plant_id)
+            if self._is_fresh(profile):
+                return profile
+            generation = self.generation
+            started = _time.monotonic()
+            async with self.db_pool.acquire() as conn:
+                profile = await build_profile(conn, plant_id)
+            self.builds += 1
+            self.last_build_ms = round((_time.monotonic() - started) * 1000, 2)
+            # Építés közben érkezett jelzés után ez már elavult: kiszolgáljuk, de nem tároljuk
+            if generation == self.generation:
+                self.profiles[plant_id] = profile
+            return profile
+
+    def stats(self):
+        return {
+            "plants": len(self.profiles),
+            "builds": self.builds,
+            "last_build_ms": self.last_build_ms,
+            "listening": self.listener is not None,
+            "max_age_seconds": self.max_age,
+        }
+
+
+profile_store = StringProfileStore()
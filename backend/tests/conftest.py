@@ -0,0 +1,5 @@
+import os
+import sys
+
+# A backend modulok laposan, a backend könyvtárból importálódnak
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from main import _alarm_history_item, _decode_alarm_cursor, _encode_alarm_cursor, _naive_utc
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 10, 15, 30, 250000)
+    assert _decode_alarm_cursor(_encode_alarm_cursor(timestamp, 42)) == (timestamp, 42)
+
+
+def test_invalid_cursor_is_400():
+    with pytest.raises(HTTPException) as error:
+        _decode_alarm_cursor("bm90LWEtY3Vyc29y")
+    assert error.value.status_code == 400
+
+
+def test_naive_utc():
+    budapest = timezone(timedelta(hours=2))
+    assert _naive_utc(datetime(2024, 5, 1, 12, 0, tzinfo=budapest)) == datetime(2024, 5, 1, 10, 0)
+    assert _naive_utc(datetime(2024, 5, 1, 12, 0)) == datetime(2024, 5, 1, 12, 0)
+
+
+def test_history_item_is_ndjson_ready():
+    row = {"id": 7, "register": 50001, "bit": 5, "event_type": "started", "timestamp": datetime(2024, 5, 1, 10, 0)}
+    item = json.loads(json.dumps(_alarm_history_item(row)))
+    assert item["timestamp"] == "2024-05-01T10:00:00"
+    assert item["severity"] == "Warning"
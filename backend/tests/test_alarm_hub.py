@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime
+
+from alarm_hub import AlarmHub
+
+T0 = datetime(2024, 5, 1, 10, 0)
+
+
+class _Conn:
+    def __init__(self):
+        self.log = []
+
+    def add(self, id, plant_id, register, bit, event_type, minute):
+        self.log.append({"id": id, "plant_id": plant_id, "register": register, "bit": bit,
+                         "event_type": event_type, "timestamp": T0.replace(minute=minute)})
+
+    async def fetch(self, query, low, seen):
+        return sorted((r for r in self.log if r["id"] > low and r["id"] not in seen), key=lambda r: r["id"])
+
+
+def _hub():
+    hub = AlarmHub()
+    hub.last_id = 0
+    return hub
+
+
+def _events(hub, conn):
+    events, _ = asyncio.run(hub._load_events(conn))
+    return [(e["type"], e["id"], e["plant_id"], e["register"], e["bit"]) for e in events]
+
+
+def test_raise_and_clear():
+    hub, conn = _hub(), _Conn()
+    conn.add(1, 7, 50000, 3, "started", 0)
+    conn.add(2, 7, 50000, 3, "started", 1)
+    assert _events(hub, conn) == [("raised", 1, 7, 50000, 3)]
+    assert hub.snapshot(7)["alarms"][0]["alarm_name"] == "Abnormal Active Schedule"
+
+    conn.add(3, 7, 50000, 3, "ended", 5)
+    assert _events(hub, conn) == [("cleared", 3, 7, 50000, 3)]
+    assert hub.active[7] == {}
+    assert _events(hub, conn) == []
+
+
+def test_late_committed_row_is_picked_up():
+    hub, conn = _hub(), _Conn()
+    conn.add(2, 7, 50000, 3, "started", 1)
+    assert _events(hub, conn) == [("raised", 2, 7, 50000, 3)]
+    # Az 1-es id később commitol, a watermark alatt
+    conn.add(1, 8, 50001, 5, "started", 0)
+    assert _events(hub, conn) == [("raised", 1, 8, 50001, 5)]
+    assert hub.last_id == 2
+
+
+def test_late_row_older_than_processed_event_is_skipped():
+    hub, conn = _hub(), _Conn()
+    hub.active = {7: {(50000, 3): T0}}
+    conn.add(3, 7, 50000, 3, "ended", 5)
+    assert _events(hub, conn) == [("cleared", 3, 7, 50000, 3)]
+    # A 2-es felfutás később commitol, de a kulcsot már egy újabb esemény lezárta
+    conn.add(2, 7, 50000, 3, "started", 1)
+    assert _events(hub, conn) == []
+    assert hub.active[7] == {}
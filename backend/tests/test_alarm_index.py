@@ -0,0 +1,31 @@
+from alarm_index import LOOKUP_BITS, LOOKUP_REGISTERS, LOOKUP_SEVERITIES, SEVERITIES, describe, keys_for
+from smartlogger_alarms import alarm_definitions
+
+
+def test_describe_known_alarm():
+    assert describe(50000, 3) == {"alarm_id": 1100, "alarm_name": "Abnormal Active Schedule", "severity": "Major"}
+
+
+def test_describe_normalizes_adaptable_to_warning():
+    assert alarm_definitions[(50001, 5)]["severity"] == "Adaptable"
+    assert describe(50001, 5)["severity"] == "Warning"
+
+
+def test_describe_unknown_bit():
+    assert describe(1, 99) == {"alarm_id": None, "alarm_name": "Ismeretlen", "severity": "Unknown"}
+
+
+def test_lookup_arrays_use_normalized_severities():
+    assert len(LOOKUP_REGISTERS) == len(LOOKUP_BITS) == len(LOOKUP_SEVERITIES) == len(alarm_definitions)
+    assert set(LOOKUP_SEVERITIES) <= set(SEVERITIES)
+
+
+def test_keys_for_filters():
+    registers, bits = keys_for(severities=["Warning"])
+    keys = set(zip(registers, bits))
+    assert (50001, 5) in keys
+    assert all(describe(r, b)["severity"] == "Warning" for r, b in keys)
+
+    registers, bits = keys_for(alarm_ids=[1100])
+    assert {alarm_definitions[k]["alarm_id"] for k in zip(registers, bits)} == {1100}
+    assert keys_for(severities=["Major"], alarm_ids=[1107]) == ([], [])
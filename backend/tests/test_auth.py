@@ -0,0 +1,69 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+
+
+class _Pool:
+    def __init__(self, user):
+        self.user = user
+        self.checked_out = 0
+
+    def acquire(self):
+        pool = self
+
+        class _Conn:
+            async def fetchrow(self, query, *args):
+                return pool.user
+
+        class _Acquire:
+            async def __aenter__(self):
+                pool.checked_out += 1
+                return _Conn()
+
+            async def __aexit__(self, *exc):
+                pool.checked_out -= 1
+                return False
+
+        return _Acquire()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = _Pool({"id": 3, "username": "anna", "password_hash": "x", "role": "user"})
+    monkeypatch.setattr(auth, "db_pool", pool)
+    return pool
+
+
+def test_login_releases_connection_before_password_check(pool, monkeypatch):
+    seen = []
+
+    async def verify(password, hashed):
+        seen.append(pool.checked_out)
+        return True
+
+    monkeypatch.setattr(auth, "verify_password_async", verify)
+    result = asyncio.run(auth.login(SimpleNamespace(username="anna", password="secret")))
+    assert seen == [0]
+    assert result["token_type"] == "bearer"
+
+
+def test_login_wrong_password(pool, monkeypatch):
+    async def verify(password, hashed):
+        return False
+
+    monkeypatch.setattr(auth, "verify_password_async", verify)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(auth.login(SimpleNamespace(username="anna", password="wrong")))
+    assert error.value.status_code == 401
+    assert pool.checked_out == 0
+
+
+def test_verification_queue_limit(monkeypatch):
+    monkeypatch.setattr(auth, "_pending_verifications", auth.PASSWORD_HASH_WORKERS + auth.PASSWORD_HASH_QUEUE)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(auth.verify_password_async("secret", "x"))
+    assert error.value.status_code == 503
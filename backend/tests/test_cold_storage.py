@@ -0,0 +1,19 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from cold_storage import arrow_schema, records_to_table, table_rows
+
+
+def test_records_to_table_numeric_column():
+    schema = arrow_schema(["plant_id", "timestamp", "total_yield"], ["int4", "timestamp", "numeric"])
+    rows = [
+        (1, datetime(2024, 1, 31, 23, 55), Decimal("1024.125")),
+        (1, datetime(2024, 1, 31, 23, 59), None),
+    ]
+    table = records_to_table(rows, schema)
+    assert str(table.schema.field("total_yield").type) == "double"
+    assert table_rows(table) == [(1, datetime(2024, 1, 31, 23, 55), 1024.125), (1, datetime(2024, 1, 31, 23, 59), None)]
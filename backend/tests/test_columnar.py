@@ -0,0 +1,48 @@
+import json
+import math
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from columnar import check_format, columnar_response, records_to_columns
+
+
+def test_records_to_columns_converts_types():
+    rows = [
+        {"timestamp": datetime(1970, 1, 1, 0, 0, 1), "day": date(1970, 1, 2), "hour": time(1, 0, 0, 5000),
+         "value": Decimal("1.5"), "name": "a"},
+        {"timestamp": datetime(1970, 1, 1, 2, tzinfo=timezone(timedelta(hours=1))), "day": None, "hour": None,
+         "value": None, "name": None},
+    ]
+    columns = records_to_columns(rows, ["timestamp", "day", "hour", "value", "name"])
+    assert columns == {
+        "timestamp": [1000, 3600000],
+        "day": [86400000, None],
+        "hour": [3600005, None],
+        "value": [1.5, None],
+        "name": ["a", None],
+    }
+
+
+def test_binary_response_layout():
+    response = columnar_response({"timestamp": [1, 2], "series": {"power": [0.5, None]}}, "binary")
+    assert response.headers["X-Columns"] == "timestamp:2,series.power:2"
+    values = array("d")
+    values.frombytes(response.body)
+    assert values[:3].tolist() == [1.0, 2.0, 0.5]
+    assert math.isnan(values[3])
+
+
+def test_columnar_json_response():
+    response = columnar_response({"timestamp": [1], "active_power": [2.5]}, "columnar")
+    assert json.loads(response.body) == {"timestamp": [1], "active_power": [2.5]}
+
+
+def test_check_format():
+    check_format("binary")
+    with pytest.raises(HTTPException) as error:
+        check_format("xml")
+    assert error.value.status_code == 400
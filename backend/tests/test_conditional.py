@@ -0,0 +1,41 @@
+from fastapi import Request, Response
+
+from conditional import CACHE_CONTROL, conditional, make_etag, tag
+
+
+def _request(if_none_match=None):
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_make_etag_is_weak_and_stable():
+    etag = make_etag("production-data", 1, "2024-05-01")
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert etag == make_etag("production-data", 1, "2024-05-01")
+    assert etag != make_etag("production-data", 2, "2024-05-01")
+
+
+def test_miss_sets_headers():
+    response = Response()
+    assert conditional(_request(), response, 'W/"abc"') is None
+    assert response.headers["ETag"] == 'W/"abc"'
+    assert response.headers["Cache-Control"] == CACHE_CONTROL
+
+
+def test_match_returns_304():
+    for header in ('W/"abc"', '"abc"', '"x", W/"abc"', "*"):
+        result = conditional(_request(header), Response(), 'W/"abc"')
+        assert result.status_code == 304
+        assert result.headers["ETag"] == 'W/"abc"'
+
+
+def test_stale_copy_is_not_304():
+    response = Response()
+    assert conditional(_request('W/"old"'), response, 'W/"abc"') is None
+
+
+def test_tag_sets_headers_on_direct_response():
+    result = tag(Response(content=b"{}"), 'W/"abc"')
+    assert result.headers["ETag"] == 'W/"abc"'
+    assert result.headers["Cache-Control"] == CACHE_CONTROL
+    assert tag({"a": 1}, 'W/"abc"') == {"a": 1}
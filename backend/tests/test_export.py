@@ -0,0 +1,93 @@
+import asyncio
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import export
+from export import _NdjsonEncoder, _ParquetEncoder
+
+COLUMNS = ["plant_id", "timestamp", "today_yield"]
+ROWS = [
+    (1, datetime(2024, 5, 1, 10, 0), Decimal("12.50")),
+    (1, datetime(2024, 5, 1, 10, 5), None),
+    (1, datetime(2024, 5, 1, 10, 10), Decimal("13.25")),
+]
+
+
+def test_ndjson_numeric_column():
+    encoder = _NdjsonEncoder(COLUMNS)
+    lines = (encoder.header() + encoder.encode(ROWS) + encoder.close()).decode().splitlines()
+    values = [json.loads(line)["today_yield"] for line in lines]
+    assert values == [12.5, None, 13.25]
+
+
+def test_parquet_numeric_column():
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    encoder = _ParquetEncoder(COLUMNS, ["int4", "timestamp", "numeric"])
+    data = encoder.header() + encoder.encode(ROWS) + encoder.encode(ROWS[:1]) + encoder.close()
+    table = pq.read_table(io.BytesIO(data))
+    assert str(table.schema.field("today_yield").type) == "double"
+    assert table.column("today_yield").to_pylist() == [12.5, None, 13.25, 12.5]
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, n):
+        rows, self.rows = self.rows[:n], self.rows[n:]
+        return rows
+
+
+class _Conn:
+    def transaction(self, **kwargs):
+        class _Transaction:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Transaction()
+
+    async def prepare(self, query):
+        class _Statement:
+            async def cursor(self, *args):
+                return _Cursor(ROWS)
+        return _Statement()
+
+
+class _Pool:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                pool.acquired += 1
+                return _Conn()
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Acquire()
+
+
+def test_stream_uses_export_pool(monkeypatch):
+    analytic, streams = _Pool(), _Pool()
+    monkeypatch.setattr(export, "db_pool", analytic)
+    monkeypatch.setattr(export, "stream_pool", streams)
+
+    async def collect():
+        segments = [(datetime(2024, 5, 1), datetime(2024, 5, 2), False)]
+        return [chunk async for chunk in export._stream_export("csv", "logger_data", "plant_id", [1], COLUMNS, segments, 1, "x")]
+
+    body = b"".join(asyncio.run(collect())).decode().splitlines()
+    assert body[0] == "plant_id,timestamp,today_yield"
+    assert len(body) == 1 + len(ROWS)
+    assert (analytic.acquired, streams.acquired) == (0, 1)
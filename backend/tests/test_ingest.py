@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import ingest
+from ingest import AlarmState, LoggerSample
+
+
+def _sample(minute, **registers):
+    return LoggerSample(plant_id=1, timestamp=datetime(2024, 5, 1, 10, minute),
+                        alarm_registers={int(r[1:]): v for r, v in registers.items()})
+
+
+def test_diff_reports_each_changed_bit():
+    words = {50000: 0b0101}
+    transitions = AlarmState.diff(words, [_sample(0, r50000=0b0110, r50001=0b1)])
+    assert sorted(transitions) == [
+        (50000, 0, False, datetime(2024, 5, 1, 10, 0)),
+        (50000, 1, True, datetime(2024, 5, 1, 10, 0)),
+        (50001, 0, True, datetime(2024, 5, 1, 10, 0)),
+    ]
+    assert words == {50000: 0b0110, 50001: 0b1}
+
+
+def test_diff_follows_samples_in_order():
+    words = {}
+    transitions = AlarmState.diff(words, [_sample(0, r50000=1 << 15), _sample(5, r50000=0), _sample(10, r50000=0)])
+    assert transitions == [
+        (50000, 15, True, datetime(2024, 5, 1, 10, 0)),
+        (50000, 15, False, datetime(2024, 5, 1, 10, 5)),
+    ]
+    assert words == {50000: 0}
+
+
+class _Conn:
+    def __init__(self):
+        self.log = []
+
+    async def fetch(self, query, *args):
+        return []
+
+    def transaction(self):
+        conn = self
+
+        class _Transaction:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                await asyncio.sleep(0.01)
+                conn.log.append("commit" if exc[0] is None else "rollback")
+                return False
+        return _Transaction()
+
+
+def test_plant_stays_locked_until_commit(monkeypatch):
+    state = AlarmState()
+    written = []
+
+    async def write(conn, transitions):
+        written.append([t[1:4] for t in transitions])
+        conn.log.append("write")
+
+    monkeypatch.setattr(ingest, "_write_transitions", write)
+
+    load = state._load
+
+    async def logged_load(conn, plant_ids):
+        conn.log.append("load")
+        await load(conn, plant_ids)
+
+    monkeypatch.setattr(state, "_load", logged_load)
+
+    async def batch(conn, sample):
+        async with state.hold([1]):
+            async with conn.transaction():
+                await state.apply(conn, {1: [sample]})
+
+    async def run():
+        conn = _Conn()
+        await asyncio.gather(batch(conn, _sample(0, r50000=1)), batch(conn, _sample(1, r50000=1)))
+        return conn.log
+
+    assert asyncio.run(run()) == ["load", "write", "commit", "load", "commit"]
+    assert written == [[(50000, 0, True)]]
+
+
+def test_rollback_forgets_plant(monkeypatch):
+    state = AlarmState()
+
+    async def write(conn, transitions):
+        pass
+
+    monkeypatch.setattr(ingest, "_write_transitions", write)
+
+    async def run():
+        conn = _Conn()
+        async with state.hold([1]):
+            async with conn.transaction():
+                await state.apply(conn, {1: [_sample(0, r50000=1)]})
+                raise RuntimeError("COPY failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert 1 not in state.words
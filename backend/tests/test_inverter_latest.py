@@ -0,0 +1,61 @@
+import asyncio
+
+from inverter_latest import ensure_schema, string_columns
+
+
+class _Conn:
+    def __init__(self, table=True, trigger=True, populated=True):
+        self.table = table
+        self.trigger = trigger
+        self.populated = populated
+        self.executed = []
+
+    async def fetchval(self, query, *args):
+        if "to_regclass('inverter_latest')" in query:
+            return "inverter_latest" if self.table else None
+        if "pg_trigger" in query:
+            return self.trigger
+        if "FROM inverter_latest" in query:
+            return self.populated
+        raise AssertionError(query)
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+        if "CREATE TABLE" in query:
+            self.table = True
+        if "CREATE TRIGGER" in query:
+            self.trigger = True
+
+    def transaction(self):
+        class _Transaction:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Transaction()
+
+
+def test_existing_trigger_is_left_alone():
+    conn = _Conn()
+    assert asyncio.run(ensure_schema(conn)) is False
+    assert conn.executed == []
+
+
+def test_missing_trigger_is_created_without_backfill_when_populated():
+    conn = _Conn(trigger=False)
+    assert asyncio.run(ensure_schema(conn)) is True
+    assert not any("DROP TRIGGER" in q for q in conn.executed)
+    assert any("CREATE TRIGGER" in q for q in conn.executed)
+    assert not any("CROSS JOIN LATERAL" in q for q in conn.executed)
+
+
+def test_first_run_backfills():
+    conn = _Conn(table=False, trigger=False, populated=False)
+    assert asyncio.run(ensure_schema(conn)) is True
+    assert "CROSS JOIN LATERAL" in conn.executed[-1]
+
+
+def test_string_columns():
+    row = {"string_v": [600.0, None], "string_a": [8.5, None]}
+    assert string_columns(row) == {"string_1_v": 600.0, "string_1_a": 8.5, "string_2_v": None, "string_2_a": None}
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from auth import create_access_token
+from metrics import InstrumentedConnection, registry
+
+
+class _Conn:
+    async def fetch(self, query, *args):
+        return [1, 2]
+
+
+def test_metrics_have_no_statement_text():
+    asyncio.run(InstrumentedConnection(_Conn(), "test").fetch("SELECT secret_column FROM users WHERE id = 5"))
+    rendered = registry.render()
+    assert "secret_column" not in rendered
+    assert "db_query_info" not in rendered
+
+
+def test_metrics_require_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape")
+    asyncio.run(main.require_metrics_access("Bearer scrape"))
+    asyncio.run(main.require_metrics_access(f"Bearer {create_access_token({'sub': '1', 'role': 'user'})}"))
+    for header in (None, "Bearer wrong", "Basic scrape"):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(main.require_metrics_access(header))
+        assert error.value.status_code == 401
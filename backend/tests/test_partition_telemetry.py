@@ -0,0 +1,74 @@
+import asyncio
+from datetime import date, datetime
+
+from downsampling import power_series_query
+from partition_telemetry import _add_months, _month_start, _scanned_relations, _verify_cases, maintain_table, partition_name
+from snapshot_cache import latest_rows_query
+
+
+def test_verify_cases_use_the_endpoint_statements():
+    sample = {
+        "plant_id": 1,
+        "plant_ids": [1, 2],
+        "inverter": {"id": 5, "plant_id": 1, "max_string_count": 2},
+        "day_start": datetime(2024, 5, 1),
+    }
+    cases = {label: (query, args) for label, _, query, args, _ in _verify_cases(sample)}
+    query, args = cases["snapshot logger"]
+    assert query == latest_rows_query("logger_data", "plant_id", "plants")
+    assert args[0] == [1, 2] and args[1] == [datetime(2024, 5, 1)] * 2
+    assert cases["production-data logger bucketed"][0] == power_series_query("logger_data", True)
+    assert "string_2_v" in cases["string hourly rollup"][0]
+
+
+def test_never_executed_partitions_are_not_counted():
+    plan = [{"Plan": {"Node Type": "Append", "Plans": [
+        {"Relation Name": "logger_data_p202405", "Actual Loops": 1},
+        {"Relation Name": "logger_data_p202404", "Actual Loops": 0},
+        {"Relation Name": "meter_data_p202405", "Actual Loops": 1},
+    ]}}]
+    assert _scanned_relations(plan, "logger_data", set()) == {"logger_data_p202405"}
+
+
+class _Conn:
+    def __init__(self, counts, manifest, table="logger_data"):
+        self.table = table
+        self.counts = counts
+        self.manifest = manifest
+        self.executed = []
+
+    async def fetchval(self, query, *args):
+        if "relkind" in query:
+            return "p"
+        return True
+
+    async def fetch(self, query, *args):
+        if "pg_inherits" in query:
+            return [{"relname": partition_name(self.table, month)} for month in self.counts]
+        if "cold_archive_manifest" in query:
+            return [{"plant_id": p, "rows": n} for p, n in self.manifest.get(args[1], {}).items()]
+        month = _month_start(args[0])
+        return [{"plant_id": p, "n": n} for p, n in self.counts[month].items()]
+
+    async def execute(self, query, *args):
+        self.executed.append(" ".join(query.split()))
+
+
+def test_retention_drops_only_archived_partitions():
+    old = _add_months(_month_start(date.today()), -30)
+    older = _add_months(old, -1)
+    conn = _Conn(
+        counts={older: {1: 10, 2: 5}, old: {1: 10, 2: 5}},
+        manifest={older: {1: 10, 2: 5}, old: {1: 10, 2: 4}},
+    )
+    result = asyncio.run(maintain_table(conn, "logger_data", 0, retention_months=24))
+    assert result["removed"] == [partition_name("logger_data", older)]
+    assert f"DROP TABLE {partition_name('logger_data', old)}" not in conn.executed
+
+
+def test_retention_never_drops_unarchivable_tables():
+    old = _add_months(_month_start(date.today()), -30)
+    conn = _Conn(counts={old: {1: 10}}, manifest={}, table="alteo_data")
+    result = asyncio.run(maintain_table(conn, "alteo_data", 0, retention_months=24))
+    assert result["removed"] == []
+
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+import main
+
+ROWS = [{"id": 1, "name": "Alfa"}, {"id": 2, "name": "Béta"}]
+
+
+class _Pool:
+    def __init__(self):
+        self.calls = []
+
+    def acquire(self):
+        pool = self
+
+        class _Conn:
+            async def fetch(self, query, *args):
+                pool.calls.append((" ".join(query.split()), args))
+                return ROWS
+
+        class _Acquire:
+            async def __aenter__(self):
+                return _Conn()
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Acquire()
+
+
+def _setup(monkeypatch):
+    pool = _Pool()
+    monkeypatch.setattr(main, "db_pool", pool)
+
+    async def last_seen():
+        return {1: datetime(2024, 5, 1, 10, 0)}
+
+    monkeypatch.setattr(main.snapshot_store, "plant_last_seen", last_seen)
+    return pool
+
+
+def test_plants_take_last_updated_from_snapshot_index(monkeypatch):
+    pool = _setup(monkeypatch)
+    result = asyncio.run(main.get_plants({"id": 1, "role": "admin"}))
+    assert result == [
+        {"id": 1, "name": "Alfa", "last_updated": "2024-05-01T10:00:00"},
+        {"id": 2, "name": "Béta", "last_updated": None},
+    ]
+    query, args = pool.calls[0]
+    assert "logger_data" not in query and args == ()
+
+
+def test_viewer_sees_only_granted_plants(monkeypatch):
+    pool = _setup(monkeypatch)
+    asyncio.run(main.get_plants({"id": 9, "role": "user"}))
+    query, args = pool.calls[0]
+    assert "user_plant_access" in query and args == (9,)
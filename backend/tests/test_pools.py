@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from db_config import POOL_DEFAULTS, pool_settings
+from metrics import InstrumentedPool, PoolBusy
+
+
+def test_pool_settings_env_overrides(monkeypatch):
+    monkeypatch.setenv("DB_POOL_LIVE_MAX_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_LIVE_ACQUIRE_TIMEOUT", "0.5")
+    monkeypatch.setenv("DB_POOL_LIVE_MAX_WAITERS", "none")
+    settings = pool_settings("live")
+    assert settings["max_size"] == 20
+    assert settings["acquire_timeout"] == 0.5
+    assert settings["max_waiters"] is None
+    assert settings["min_size"] == POOL_DEFAULTS["live"]["min_size"]
+    assert pool_settings("analytic") == POOL_DEFAULTS["analytic"]
+
+
+class _RawPool:
+    # Egyetlen kapcsolat; a többi acquire a felszabadulásig vagy a timeoutig vár
+    def __init__(self):
+        self.free = asyncio.Semaphore(1)
+
+    async def acquire(self, timeout=None):
+        await asyncio.wait_for(self.free.acquire(), timeout)
+        return object()
+
+    async def release(self, conn):
+        self.free.release()
+
+    def get_size(self):
+        return 1
+
+    def get_idle_size(self):
+        return 0
+
+
+def test_acquire_timeout_is_pool_busy():
+    async def run():
+        pool = InstrumentedPool(_RawPool(), "test-timeout", acquire_timeout=0.01)
+        async with pool.acquire():
+            with pytest.raises(PoolBusy) as error:
+                async with pool.acquire():
+                    pass
+        assert error.value.reason == "acquire timeout"
+        async with pool.acquire():
+            pass
+
+    asyncio.run(run())
+
+
+def test_full_wait_queue_is_rejected_immediately():
+    async def run():
+        pool = InstrumentedPool(_RawPool(), "test-queue", max_waiters=1, acquire_timeout=1.0)
+        release = asyncio.Event()
+
+        async def hold():
+            async with pool.acquire():
+                await release.wait()
+
+        async def wait():
+            async with pool.acquire():
+                pass
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(wait())
+        await asyncio.sleep(0.01)
+        assert pool.waiting == 1
+        with pytest.raises(PoolBusy) as error:
+            async with pool.acquire():
+                pass
+        assert error.value.reason == "queue full"
+        release.set()
+        await asyncio.gather(holder, waiter)
+
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+import production_hub
+from production_hub import ProductionHub, _Subscriber, SUBSCRIBER_QUEUE_SIZE
+
+
+def test_slow_subscriber_gets_fresh_snapshot():
+    subscriber = _Subscriber(None)
+    for i in range(SUBSCRIBER_QUEUE_SIZE + 1):
+        subscriber.offer({"type": "delta", "data": [i]}, ["snapshot"])
+    assert subscriber.queue.qsize() == 1
+    assert subscriber.queue.get_nowait()[1] == {"type": "snapshot", "data": ["snapshot"]}
+
+
+class _Pool:
+    def __init__(self):
+        self.rows = [{"timestamp": datetime(2024, 5, 1, 10, 0), "prod_power": 1.0}]
+
+    def acquire(self):
+        pool = self
+
+        class _Conn:
+            async def fetch(self, query, plant_id, arg):
+                if "LIMIT" in query:
+                    return list(reversed(pool.rows))
+                return [r for r in pool.rows if r["timestamp"] > arg]
+
+        class _Acquire:
+            async def __aenter__(self):
+                return _Conn()
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Acquire()
+
+
+class _WebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = asyncio.Event()
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def receive(self):
+        await self.closed.wait()
+        return {"type": "websocket.disconnect"}
+
+
+def test_sockets_share_one_poller(monkeypatch):
+    pool = _Pool()
+    monkeypatch.setattr(production_hub, "db_pool", pool)
+    monkeypatch.setattr(production_hub, "POLL_INTERVAL", 0.01)
+
+    async def run():
+        hub = ProductionHub()
+        sockets = [_WebSocket() for _ in range(3)]
+        serving = [asyncio.create_task(hub.serve(ws, 7)) for ws in sockets]
+        await asyncio.sleep(0.03)
+        assert hub.subscriber_count(7) == 3
+        task = hub.channels[7].task
+        pool.rows.append({"timestamp": datetime(2024, 5, 1, 10, 1), "prod_power": 2.0})
+        await asyncio.sleep(0.03)
+        assert hub.channels[7].task is task
+        for ws in sockets:
+            ws.closed.set()
+        await asyncio.gather(*serving)
+        return hub, sockets
+
+    hub, sockets = asyncio.run(run())
+    assert hub.channels == {}
+    for ws in sockets:
+        assert ws.sent[0] == {"type": "snapshot", "data": [{"timestamp": "2024-05-01T10:00:00", "prod_power": 1.0}]}
+        assert ws.sent[1] == {"type": "delta", "data": [{"timestamp": "2024-05-01T10:01:00", "prod_power": 2.0}]}
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+import main
+from downsampling import bucket_seconds_for, lttb
+
+BOUNDARY = datetime(2024, 2, 1)
+
+
+class _Pool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+
+class _HotConn:
+    # A meleg szakasz vödrözött sorai: NUMERIC oszlop → Decimal
+    async def fetch(self, query, *args):
+        return [
+            {"timestamp": BOUNDARY - timedelta(hours=1), "active_power": Decimal("30.0"),
+             "min": Decimal("20.0"), "max": Decimal("40.0"), "samples": 2},
+            {"timestamp": BOUNDARY, "active_power": Decimal("50.0"),
+             "min": Decimal("50.0"), "max": Decimal("50.0"), "samples": 1},
+        ]
+
+
+def test_bucketed_series_across_cold_hot_boundary(monkeypatch):
+    # Az óra vödör a hónaphatár előtt kezdődik: a fele a hideg tárból (float), fele a táblából (Decimal)
+    start, end = BOUNDARY - timedelta(hours=1), BOUNDARY + timedelta(hours=1)
+    bucket = BOUNDARY - timedelta(hours=1)
+
+    async def segments(conn, table, plant_id, start, end):
+        return [(start, BOUNDARY - timedelta(minutes=30), True), (BOUNDARY - timedelta(minutes=30), end, False)]
+
+    async def read_cold(conn, table, plant_id, start, end, columns):
+        return pa.table({
+            "timestamp": pa.array([bucket, bucket + timedelta(minutes=15)], type=pa.timestamp("us")),
+            "active_power": pa.array([10.0, 20.0]),
+        })
+
+    monkeypatch.setattr(main, "analytic_pool", _Pool(_HotConn()))
+    monkeypatch.setattr(main, "cold_segments", segments)
+    monkeypatch.setattr(main, "read_cold", read_cold)
+
+    rows = asyncio.run(main._fetch_power_series("logger_data", 1, start, end, 3600))
+
+    # A hideg (10, 20) és a meleg (2 × átlag 30) minta súlyozott átlaga egy vödörben
+    assert [r["timestamp"] for r in rows] == [bucket, BOUNDARY]
+    assert rows[0]["active_power"] == pytest.approx(22.5)
+    assert (rows[0]["min"], rows[0]["max"], rows[0]["samples"]) == (10.0, 40.0, 4)
+    assert rows[1]["active_power"] == 50.0
+    assert all(isinstance(r["active_power"], float) for r in rows)
+
+
+def _points(values):
+    t0 = datetime(2024, 5, 1)
+    return [{"timestamp": t0 + timedelta(minutes=i), "active_power": v} for i, v in enumerate(values)]
+
+
+def test_lttb_keeps_endpoints_and_threshold():
+    points = _points([float(i % 7) for i in range(100)])
+    sampled = lttb(points, 10)
+    assert len(sampled) == 10
+    assert sampled[0] is points[0] and sampled[-1] is points[-1]
+    timestamps = [p["timestamp"] for p in sampled]
+    assert timestamps == sorted(timestamps)
+
+
+def test_lttb_keeps_spike():
+    values = [1.0] * 200
+    values[123] = 100.0
+    assert any(p["active_power"] == 100.0 for p in lttb(_points(values), 20))
+
+
+def test_lttb_short_input_and_nulls():
+    points = _points([1.0, None, 3.0])
+    assert lttb(points, 10) is points
+    assert len(lttb(_points([None, 2.0, None, 4.0, 5.0, None]), 4)) == 4
+
+
+def test_bucket_seconds_for():
+    assert bucket_seconds_for(86400, 288) == 300
+    assert bucket_seconds_for(86400, 1000) == 87
+    assert bucket_seconds_for(10, 1000) == 1
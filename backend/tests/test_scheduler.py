@@ -0,0 +1,100 @@
+import asyncio
+from datetime import date, datetime
+
+from scheduler import JOBS, Job, Scheduler, backfill_chunks, daily, hourly
+from yield_rollup import LOCAL_TZ
+
+
+def test_hourly_and_daily_next_run():
+    now = datetime(2024, 5, 1, 10, 7, tzinfo=LOCAL_TZ)
+    assert hourly(5)(now) == datetime(2024, 5, 1, 11, 5, tzinfo=LOCAL_TZ)
+    assert hourly(10)(now) == datetime(2024, 5, 1, 10, 10, tzinfo=LOCAL_TZ)
+    assert daily(2)(now) == datetime(2024, 5, 2, 2, 0, tzinfo=LOCAL_TZ)
+
+
+def test_string_rollup_runs_daily_at_two():
+    now = datetime(2024, 5, 1, 10, 0, tzinfo=LOCAL_TZ)
+    assert JOBS["string_rollup"].schedule(now) == datetime(2024, 5, 2, 2, 0, tzinfo=LOCAL_TZ)
+
+
+def test_backfill_chunks():
+    assert backfill_chunks(date(2024, 1, 1), date(2024, 1, 10), 4) == [
+        (date(2024, 1, 1), date(2024, 1, 4)),
+        (date(2024, 1, 5), date(2024, 1, 8)),
+        (date(2024, 1, 9), date(2024, 1, 10)),
+    ]
+    assert backfill_chunks(date(2024, 1, 20), date(2024, 2, 10), 7, monthly=True) == [
+        (date(2024, 1, 20), date(2024, 1, 31)),
+        (date(2024, 2, 1), date(2024, 2, 10)),
+    ]
+
+
+class _Locks:
+    # Advisory zárak: kulcs → (kizárólagos?, tartók száma)
+    def __init__(self):
+        self.held = {}
+
+
+class _Conn:
+    def __init__(self, locks):
+        self.locks = locks
+
+    async def fetchval(self, query, *args):
+        if "pg_try_advisory_lock" in query:
+            shared = "_shared" in query
+            mode, count = self.locks.held.get(args[0], (None, 0))
+            if count and (not shared or mode == "exclusive"):
+                return False
+            self.locks.held[args[0]] = ("shared" if shared else "exclusive", count + 1)
+            return True
+        return 1
+
+    async def execute(self, query, *args):
+        if "pg_advisory_unlock" in query:
+            mode, count = self.locks.held.pop(args[0])
+            if count > 1:
+                self.locks.held[args[0]] = (mode, count - 1)
+
+
+class _Pool:
+    def __init__(self):
+        self.locks = _Locks()
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return _Conn(pool.locks)
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Acquire()
+
+
+def test_scheduled_run_waits_for_backfill_and_chunks_run_together():
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def backfill(pool, first_day, last_day):
+        started.set()
+        await release.wait()
+        return 1
+
+    async def run(pool):
+        return 1
+
+    job = Job("test", run, hourly(0), backfill=backfill, max_concurrency=2)
+    scheduler = Scheduler(_Pool(), {"test": job})
+
+    async def scenario():
+        chunks = asyncio.create_task(scheduler.backfill(job, date(2024, 1, 1), date(2024, 1, 2), chunk_days=1))
+        await started.wait()
+        scheduled = await Scheduler(scheduler.pool, {"test": job}).run_job(Job("test", run, hourly(0)))
+        release.set()
+        return scheduled, await chunks
+
+    scheduled, chunks = asyncio.run(scenario())
+    assert scheduled["status"] == "skipped"
+    assert [c["status"] for c in chunks] == ["ok", "ok"]
+    assert scheduler.pool.locks.held == {}
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from snapshot_cache import SnapshotStore
+
+T0 = datetime(2024, 5, 1, 10, 0)
+
+
+class _Conn:
+    def __init__(self, inverters):
+        self.inverters = inverters
+
+    async def fetch(self, query, *args):
+        return self.inverters
+
+
+class _Pool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        pool = self
+
+        class _Acquire:
+            async def __aenter__(self):
+                return pool.conn
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Acquire()
+
+
+def _store(batches, inverters=()):
+    # batches: táblánként a egymást követő _load() hívások eredménye
+    store = SnapshotStore(max_age=0)
+    store.set_db_pool(_Pool(_Conn(list(inverters))))
+    for table in (store.logger, store.meter, store.inverter):
+        results = iter(batches.get(table.table, []))
+
+        async def load(conn, results=results):
+            return next(results, [])
+
+        table._load = load
+    return store
+
+
+def test_refresh_keeps_rows_of_lagging_plants():
+    store = _store({"logger_data": [
+        [{"plant_id": 1, "timestamp": T0}, {"plant_id": 2, "timestamp": T0}],
+        [{"plant_id": 1, "timestamp": T0 + timedelta(minutes=5)}],
+    ]})
+
+    async def run():
+        await store.ensure_fresh()
+        await store.ensure_fresh()
+        return await store.plant_last_seen()
+
+    assert asyncio.run(run()) == {1: T0 + timedelta(minutes=5), 2: T0}
+
+
+def test_failed_refresh_serves_previous_state():
+    store = _store({"logger_data": [[{"plant_id": 1, "timestamp": T0}]]})
+
+    async def run():
+        await store.ensure_fresh()
+
+        async def broken(conn):
+            raise RuntimeError("db down")
+
+        store.logger._load = broken
+        await store.ensure_fresh()
+        return await store.latest_logger(1)
+
+    assert asyncio.run(run()) == {"plant_id": 1, "timestamp": T0}
+    assert store.refresh_errors >= 1
+
+
+def test_first_refresh_failure_is_raised():
+    store = _store({})
+
+    async def broken(conn):
+        raise RuntimeError("db down")
+
+    store.logger._load = broken
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.ensure_fresh())
+
+
+def test_inverter_watermark_changes_for_any_inverter():
+    inverters = [
+        {"id": 1, "plant_id": 7, "name": "INV-01", "max_string_count": 2, "max_power": 1000},
+        {"id": 2, "plant_id": 7, "name": "INV-02", "max_string_count": 2, "max_power": 1000},
+    ]
+    row = lambda inverter_id, ts: {"inverter_id": inverter_id, "timestamp": ts, "active_power": 1.0}
+    store = _store({"inverter_latest": [
+        [row(1, T0), row(2, T0 + timedelta(minutes=5))],
+        [row(1, T0 + timedelta(minutes=1))],
+    ]}, inverters)
+    store.inverter._to_dict = dict
+
+    async def watermark():
+        return (await store.plant_watermarks(7))["inverter"]
+
+    first = asyncio.run(watermark())
+    # Csak a régebbi inverter frissül, a legújabb időbélyeg nem változik
+    second = asyncio.run(watermark())
+    assert first != second
+    assert asyncio.run(watermark()) == second
+    assert asyncio.run(store.plant_watermarks(8))["inverter"] is None
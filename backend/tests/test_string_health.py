@@ -0,0 +1,43 @@
+import numpy as np
+
+from string_health import CURRENT_SENTINEL, VOLTAGE_SENTINEL, score
+
+NAN = np.nan
+
+
+def test_sentinel_is_fault():
+    voltage = np.array([[VOLTAGE_SENTINEL, 700.0, 700.0]])
+    current = np.array([[8.0, 8.0, CURRENT_SENTINEL]])
+    scored = score(voltage, current, np.full((1, 3), NAN))
+    assert list(scored["severity"][0]) == ["fault", "", "fault"]
+    assert list(scored["kind"][0, [0, 2]]) == ["sentinel", "sentinel"]
+    assert scored["score"][0, 0] >= 1.0
+    assert np.isnan(scored["power"][0, 0])
+
+
+def test_baseline_shortfall():
+    # Egyetlen string: nincs peer összevetés, csak a saját alapvonala (5.6 kW → 2.8 kW)
+    voltage = np.array([[700.0]])
+    current = np.array([[4.0]])
+    scored = score(voltage, current, np.array([[5.6]]))
+    assert scored["baseline_dev"][0, 0] == -0.5
+    assert scored["severity"][0, 0] == "critical"
+    assert scored["kind"][0, 0] == "baseline_deviation"
+
+
+def test_peer_shortfall():
+    voltage = np.array([[700.0, 700.0, 700.0, 700.0]])
+    current = np.array([[8.0, 8.0, 8.0, 6.0]])
+    scored = score(voltage, current, np.full((1, 4), NAN))
+    assert list(scored["severity"][0]) == ["", "", "", "warning"]
+    assert scored["kind"][0, 3] == "peer_deviation"
+    assert round(scored["peer_dev"][0, 3], 2) == -0.25
+
+
+def test_missing_strings_and_low_reference_are_ignored():
+    voltage = np.array([[10.0, 12.0, NAN]])
+    current = np.array([[0.1, 0.01, NAN]])
+    scored = score(voltage, current, np.array([[0.05, 0.05, NAN]]))
+    assert scored["strings"] == 2
+    assert list(scored["severity"][0]) == ["", "", ""]
+    assert np.isnan(scored["baseline_dev"]).all()
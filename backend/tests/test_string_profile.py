@@ -0,0 +1,70 @@
+import asyncio
+import json
+from datetime import date
+
+import numpy as np
+
+import string_profile
+from string_profile import HOURS, PlantProfile, StringProfileStore
+
+INVERTERS = [
+    {"inverter_id": 10, "inverter_name": "INV-01", "string_count": 2},
+    {"inverter_id": 11, "inverter_name": "INV-02", "string_count": 1},
+]
+
+
+def _profile():
+    power = np.full((2, 2, HOURS), np.nan)
+    power[0, 0, 12] = 1.23456
+    power[0, 1, 13] = 2.0
+    power[1, 0, 12] = 3.0
+    return PlantProfile(7, INVERTERS, power, date(2024, 5, 1))
+
+
+def test_payload_full_and_per_inverter():
+    profile = _profile()
+    full = json.loads(profile.payload())
+    assert full["calculation_date"] == "2024-05-01"
+    assert full["strings"] == 2 and len(full["power"]) == 2
+    assert full["power"][0][0][12] == 1.235
+    assert full["power"][0][0][11] is None
+
+    single = json.loads(profile.payload(11))
+    assert single["inverters"] == INVERTERS[1:]
+    assert single["power"] == full["power"][1:]
+    assert profile.payload(99) is None
+
+
+def test_rows_long_format():
+    profile = _profile()
+    assert profile.rows(11) == [
+        {"inverter_id": 11, "string_number": 1, "calculation_hour": 12, "hourly_avg_power": 3.0},
+    ]
+    assert len(profile.rows()) == 3
+
+
+def test_notify_invalidates_and_build_in_flight_is_not_stored(monkeypatch):
+    builds = []
+
+    async def build(conn, plant_id):
+        builds.append(plant_id)
+        store._on_notify()
+        return _profile()
+
+    class _Pool:
+        def acquire(self):
+            class _Acquire:
+                async def __aenter__(self):
+                    return None
+
+                async def __aexit__(self, *exc):
+                    return False
+            return _Acquire()
+
+    monkeypatch.setattr(string_profile, "build_profile", build)
+    store = StringProfileStore()
+    store.set_db_pool(_Pool())
+    asyncio.run(store.get(7))
+    assert store.profiles == {}
+    asyncio.run(store.get(7))
+    assert builds == [7, 7]
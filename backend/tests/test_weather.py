@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+import weather
+from weather import StaticWeatherProvider, get_location_weather
+
+
+class _SlowProvider(StaticWeatherProvider):
+    async def fetch(self, client, location):
+        await asyncio.sleep(0.01)
+        return await super().fetch(client, location)
+
+
+@pytest.fixture
+def provider():
+    provider = _SlowProvider()
+    weather.set_provider(provider)
+    yield provider
+    asyncio.run(weather.close_client())
+
+
+def test_concurrent_requests_share_one_upstream_call(provider):
+    async def run():
+        return await asyncio.gather(*(get_location_weather("Szeged") for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert provider.calls == 1
+    assert all(r == results[0] for r in results)
+
+
+def test_fresh_cache_is_served_without_upstream_call(provider):
+    asyncio.run(get_location_weather("Pécs"))
+    asyncio.run(get_location_weather("Pécs"))
+    assert provider.calls == 1
+
+
+def test_stale_entry_served_while_refreshing(provider, monkeypatch):
+    async def run():
+        first = await get_location_weather("Győr")
+        monkeypatch.setattr(weather, "WEATHER_CACHE_TTL", 0)
+        provider.data = {"temperature": 5.0, "condition": "Borult", "icon": ""}
+        stale = await get_location_weather("Győr")
+        await asyncio.sleep(0.05)
+        return first, stale
+
+    first, stale = asyncio.run(run())
+    assert stale == first
+    assert provider.calls == 2
+    assert weather._weather_cache["Győr"][1]["temperature"] == 5.0
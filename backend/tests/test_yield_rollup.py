@@ -0,0 +1,92 @@
+import asyncio
+from datetime import timedelta
+
+from yield_rollup import local_day_start_utc, local_today, yield_series
+
+
+class _Conn:
+    # plant_daily_yield / plant_yield_watermarks / logger_data memóriában; a logger_data
+    # lekérdezés a plantonkénti since és a felső határ szerint szűr, mint az SQL
+    def __init__(self, daily=None, watermarks=None, logger=None):
+        self.daily = daily or {}
+        self.watermarks = watermarks or {}
+        self.logger = logger or []
+        self.logger_queries = 0
+
+    async def fetch(self, query, *args):
+        if "FROM plant_daily_yield" in query:
+            plant_ids, start, end = args
+            return [
+                {"plant_id": pid, "period": day, "yield": value}
+                for (pid, day), value in sorted(self.daily.items())
+                if pid in plant_ids and start <= day <= end
+            ]
+        if "FROM plant_yield_watermarks" in query:
+            return [{"plant_id": pid, "finalized_through": day}
+                    for pid, day in self.watermarks.items() if pid in args[0]]
+        if "FROM unnest" in query:
+            self.logger_queries += 1
+            since = dict(zip(*args[:2]))
+            days = {}
+            for pid, day, value in self.logger:
+                if pid in since and since[pid] <= local_day_start_utc(day) < args[2]:
+                    days[(pid, day)] = max(days.get((pid, day), value), value)
+            return [{"plant_id": pid, "day": day, "max_yield": value} for (pid, day), value in days.items()]
+        raise AssertionError(query)
+
+
+def test_history_beyond_two_days_without_finalized_rows():
+    # Nem futott az ütemező: nincs watermark, nincs tárolt nap – a teljes tartomány visszajön
+    today = local_today()
+    days = [today - timedelta(days=i) for i in range(10)]
+    conn = _Conn(logger=[(1, day, 100.0 + i) for i, day in enumerate(days)])
+
+    series = asyncio.run(yield_series(conn, [1], days[-1], today))
+
+    assert [day for day, _ in series[1]] == sorted(days)
+    assert dict(series[1])[days[9]] == 109.0
+
+
+def test_finalized_days_read_from_rollup_and_rest_computed():
+    today = local_today()
+    watermark = today - timedelta(days=5)
+    daily = {(1, today - timedelta(days=i)): 50.0 for i in range(5, 20)}
+    logger = [(1, today - timedelta(days=i), 70.0) for i in range(0, 20)]
+    conn = _Conn(daily=daily, watermarks={1: watermark}, logger=logger)
+
+    series = dict(asyncio.run(yield_series(conn, [1], today - timedelta(days=19), today))[1])
+
+    assert len(series) == 20
+    # A watermarkig a tárolt érték, utána a logger_data-ból számolt
+    assert series[watermark] == 50.0
+    assert series[watermark + timedelta(days=1)] == 70.0
+    assert series[today] == 70.0
+
+
+def test_fully_finalized_range_skips_logger_data():
+    today = local_today()
+    start, end = today - timedelta(days=30), today - timedelta(days=10)
+    conn = _Conn(daily={(1, start): 5.0}, watermarks={1: today - timedelta(days=1)})
+
+    assert asyncio.run(yield_series(conn, [1], start, end)) == {1: [(start, 5.0)]}
+    assert conn.logger_queries == 0
+
+
+def test_month_granularity_adds_unfinalized_days():
+    today = local_today()
+    month = today.replace(day=1)
+    conn = _Conn(logger=[(1, month, 10.0), (1, today, 20.0)] if today != month else [(1, today, 20.0)])
+
+    async def run():
+        original = conn.fetch
+
+        async def fetch(query, *args):
+            if "FROM plant_monthly_yield" in query:
+                return []
+            return await original(query, *args)
+
+        conn.fetch = fetch
+        return await yield_series(conn, [1], month, today, granularity="month")
+
+    expected = 20.0 if today == month else 30.0
+    assert asyncio.run(run()) == {1: [(month, expected)]}
@@ -1,4 +1,6 @@
 import os
+import time
+import asyncio
 import httpx
 from fastapi import APIRouter, HTTPException
 from dotenv import load_dotenv
@@ -8,6 +10,12 @@ load_dotenv()
 WEATHER_API_KEY = "355e4ef8780d4449ad2115514252504"
 WEATHER_URL = "http://api.weatherapi.com/v1/current.json"
 
+# Friss adat ennyi ideig szolgálható ki; utána még WEATHER_STALE_TTL-ig a régit adjuk,
+# miközben a háttérben frissítünk
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_STALE_TTL = int(os.getenv("WEATHER_STALE_TTL", "3600"))
+PLANT_LOCATION_TTL = int(os.getenv("PLANT_LOCATION_TTL", "3600"))
+
 weather_router = APIRouter()
 db_pool = None
 
@@ -15,31 +23,127 @@ def set_db_pool(pool):
     global db_pool
     db_pool = pool
 
-@weather_router.get("/api/weather/{plant_id}")
-async def get_weather(plant_id: int):
+
+class WeatherProvider:
+    async def fetch(self, client: httpx.AsyncClient, location: str) -> dict:
+        raise NotImplementedError
+
+
+class WeatherApiProvider(WeatherProvider):
+    def __init__(self, api_key: str = WEATHER_API_KEY, url: str = WEATHER_URL):
+        self.api_key = api_key
+        self.url = url
+
+    async def fetch(self, client: httpx.AsyncClient, location: str) -> dict:
+        params = {
+            "key": self.api_key,
+            "q": location,
+            "lang": "hu"
+        }
+        response = await client.get(self.url, params=params)
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Weather API error")
+
+        data = response.json()
+        return {
+            "temperature": data["current"]["temp_c"],
+            "condition": data["current"]["condition"]["text"],
+            "icon": data["current"]["condition"]["icon"]
+        }
+
+
+# Helyi csonk tesztekhez és fejlesztéshez – nem hív külső szolgáltatást
+class StaticWeatherProvider(WeatherProvider):
+    def __init__(self, data: dict = None):
+        self.data = data or {"temperature": 20.0, "condition": "Napos", "icon": ""}
+        self.calls = 0
+
+    async def fetch(self, client: httpx.AsyncClient, location: str) -> dict:
+        self.calls += 1
+        return dict(self.data)
+
+
+provider = WeatherApiProvider()
+http_client = None
+
+_weather_cache = {}
+_inflight = {}
+_plant_locations = {}
+
+def set_provider(new_provider: WeatherProvider):
+    global provider
+    provider = new_provider
+    _weather_cache.clear()
+
+async def start_client():
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+
+async def close_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+async def _plant_location(plant_id: int) -> str:
+    cached = _plant_locations.get(plant_id)
+    if cached and time.monotonic() - cached[0] < PLANT_LOCATION_TTL:
+        return cached[1]
+
     async with db_pool.acquire() as conn:
         plant = await conn.fetchrow("SELECT location FROM plants WHERE id = $1", plant_id)
-        if not plant or not plant["location"]:
-            raise HTTPException(status_code=404, detail="Plant or location not found")
+    if not plant or not plant["location"]:
+        raise HTTPException(status_code=404, detail="Plant or location not found")
 
-        city = plant["location"]
+    _plant_locations[plant_id] = (time.monotonic(), plant["location"])
+    return plant["location"]
 
-    params = {
-        "key": WEATHER_API_KEY,
-        "q": city,
-        "lang": "hu"
-    }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(WEATHER_URL, params=params)
+async def _fetch_and_store(location: str) -> dict:
+    await start_client()
+    data = await provider.fetch(http_client, location)
+    _weather_cache[location] = (time.monotonic(), data)
+    return data
 
-    if response.status_code != 200:
+def _start_refresh(location: str) -> asyncio.Task:
+    # Egy helyszínre egyszerre csak egy upstream hívás fut, a többi kérés ugyanarra vár
+    task = _inflight.get(location)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_store(location))
+        _inflight[location] = task
+
+        def _done(t):
+            _inflight.pop(location, None)
+            if not t.cancelled() and t.exception():
+                print(f"Időjárás frissítési hiba ({location}):", t.exception())
+
+        task.add_done_callback(_done)
+    return task
+
+async def get_location_weather(location: str) -> dict:
+    cached = _weather_cache.get(location)
+    if cached:
+        age = time.monotonic() - cached[0]
+        if age < WEATHER_CACHE_TTL:
+            return cached[1]
+        if age < WEATHER_STALE_TTL:
+            _start_refresh(location)
+            return cached[1]
+
+    try:
+        return await asyncio.shield(_start_refresh(location))
+    except HTTPException:
+        raise
+    except Exception:
         raise HTTPException(status_code=500, detail="Weather API error")
 
-    data = response.json()
 
-    return {
-        "temperature": data["current"]["temp_c"],
-        "condition": data["current"]["condition"]["text"],
-        "icon": data["current"]["condition"]["icon"]
-    }
+@weather_router.get("/api/weather/{plant_id}")
+async def get_weather(plant_id: int):
+    city = await _plant_location(plant_id)
+    return await get_location_weather(city)
@@ -0,0 +1,203 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from cold_storage import cold_segments, daily_max, read_cold
+
+# Napi (és havi) hozam összesítés Europe/Budapest helyi napokra.
+# A lezárt napokat a scheduler yield_finalize feladata számolja (az utolsó YIELD_REFINALIZE_DAYS
+# napot minden futáskor újra, a késve érkező sorok miatt); a kérés a tárolt napokat olvassa, a
+# plant watermarkja utáni (még le nem zárt) napokat pedig igény szerint a logger_data-ból számolja,
+# írás nélkül. Ha az ütemező nem fut, a válasz akkor is teljes, csak lassabb.
+# A hideg tárba archivált hónapok (újraszámoláskor) a Parquet fájlokból olvasódnak.
+LOCAL_TZ = ZoneInfo("Europe/Budapest")
+FINALIZE_CHUNK_DAYS = 31
+YIELD_REFINALIZE_DAYS = int(os.getenv("YIELD_REFINALIZE_DAYS", "3"))
+
+# A nyitott napok napi maximuma: $1 plantok, $2 plantonkénti kezdőidő (UTC), $3 felső korlát
+LIVE_DAYS_QUERY = """
+    SELECT
+        d.plant_id,
+        (d.timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Budapest')::date AS day,
+        MAX(d.today_yield) AS max_yield
+    FROM unnest($1::int[], $2::timestamp[]) AS w(plant_id, since)
+    JOIN logger_data d ON d.plant_id = w.plant_id AND d.timestamp >= w.since AND d.timestamp < $3
+    GROUP BY d.plant_id, day
+"""
+
+
+async def ensure_schema(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS plant_daily_yield (
+            plant_id INTEGER NOT NULL,
+            day      DATE NOT NULL,
+            yield    DOUBLE PRECISION,
+            PRIMARY KEY (plant_id, day)
+        );
+
+        CREATE TABLE IF NOT EXISTS plant_monthly_yield (
+            plant_id INTEGER NOT NULL,
+            month    DATE NOT NULL,
+            yield    DOUBLE PRECISION,
+            days     INTEGER NOT NULL,
+            PRIMARY KEY (plant_id, month)
+        );
+
+        CREATE TABLE IF NOT EXISTS plant_yield_watermarks (
+            plant_id          INTEGER PRIMARY KEY,
+            finalized_through DATE NOT NULL
+        );
+    """)
+
+
+def local_today() -> date:
+    return datetime.now(LOCAL_TZ).date()
+
+
+def local_day_start_utc(day: date) -> datetime:
+    # Budapest nap eleje → UTC → naiv (Postgres TIMESTAMP WITHOUT TIME ZONE-hoz)
+    return datetime.combine(day, time.min).replace(tzinfo=LOCAL_TZ).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def _finalize_cold(conn, plant_id: int, start: datetime, end: datetime) -> int:
+    # Archivált logger_data hónapok: a napi maximum a Parquet fájlokból. Egy helyi nap átnyúlhat
+    # a hónaphatáron, ezért a meleg résszel GREATEST-tel egyesül
+    segments = await cold_segments(conn, "logger_data", plant_id, start, end)
+    days = {}
+    for segment_start, segment_end, cold in segments:
+        if not cold:
+            continue
+        data = await read_cold(conn, "logger_data", plant_id, segment_start, segment_end, ["timestamp", "today_yield"])
+        if data is not None:
+            for day, value in daily_max(data, "today_yield", "Europe/Budapest").items():
+                days[day] = max(days.get(day, value), value)
+    if not days:
+        return 0
+    status = await conn.execute("""
+        INSERT INTO plant_daily_yield (plant_id, day, yield)
+        SELECT $1, day, value FROM unnest($2::date[], $3::float8[]) AS c(day, value)
+        ON CONFLICT (plant_id, day) DO UPDATE
+        SET yield = GREATEST(plant_daily_yield.yield, EXCLUDED.yield)
+    """, plant_id, list(days), list(days.values()))
+    return int(status.split()[-1])
+
+
+async def finalize_range(conn, plant_id: int, first_day: date, last_day: date) -> int:
+    # [first_day, last_day] helyi napok (újra)számolása; a napi és havi sor is frissül
+    rows = 0
+    day = first_day
+    while day <= last_day:
+        chunk_end = min(day + timedelta(days=FINALIZE_CHUNK_DAYS - 1), last_day)
+        status = await conn.execute("""
+            INSERT INTO plant_daily_yield (plant_id, day, yield)
+            SELECT
+                plant_id,
+                (timestamp AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Budapest')::date AS day,
+                MAX(today_yield)
+            FROM logger_data
+            WHERE plant_id = $1 AND timestamp >= $2 AND timestamp < $3
+            GROUP BY plant_id, day
+            ON CONFLICT (plant_id, day) DO UPDATE SET yield = EXCLUDED.yield
+        """, plant_id, local_day_start_utc(day), local_day_start_utc(chunk_end + timedelta(days=1)))
+        rows += int(status.split()[-1])
+        rows += await _finalize_cold(conn, plant_id, local_day_start_utc(day), local_day_start_utc(chunk_end + timedelta(days=1)))
+        day = chunk_end + timedelta(days=1)
+
+    await conn.execute("""
+        INSERT INTO plant_monthly_yield (plant_id, month, yield, days)
+        SELECT plant_id, date_trunc('month', day)::date, SUM(yield), COUNT(*)
+        FROM plant_daily_yield
+        WHERE plant_id = $1 AND day >= date_trunc('month', $2::date)::date AND day <= $3
+        GROUP BY plant_id, date_trunc('month', day)
+        ON CONFLICT (plant_id, month) DO UPDATE SET yield = EXCLUDED.yield, days = EXCLUDED.days
+    """, plant_id, first_day, last_day)
+    return rows
+
+
+async def finalize_plant(conn, plant_id: int, through: date = None) -> int:
+    through = through or (local_today() - timedelta(days=1))
+    watermark = await conn.fetchval(
+        "SELECT finalized_through FROM plant_yield_watermarks WHERE plant_id = $1", plant_id
+    )
+    if watermark is None:
+        first_ts = await conn.fetchval(
+            "SELECT MIN(timestamp) FROM logger_data WHERE plant_id = $1", plant_id
+        )
+        if first_ts is None:
+            return 0
+        first_day = first_ts.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ).date()
+    else:
+        first_day = watermark - timedelta(days=YIELD_REFINALIZE_DAYS - 1)
+        through = max(through, watermark)
+
+    rows = 0
+    if first_day <= through:
+        async with conn.transaction():
+            rows = await finalize_range(conn, plant_id, first_day, through)
+            await conn.execute("""
+                INSERT INTO plant_yield_watermarks (plant_id, finalized_through)
+                VALUES ($1, $2)
+                ON CONFLICT (plant_id) DO UPDATE SET finalized_through = EXCLUDED.finalized_through
+            """, plant_id, through)
+    return rows
+
+
+async def live_days(conn, plant_ids, start: date, end: date):
+    # {plant_id: {nap: hozam}} a még le nem zárt napokra (a plant watermarkja utániak, vagy ha még
+    # nincs watermark, a teljes tartomány) közvetlenül a logger_data-ból. Az archivált hónapok
+    # mindig lezártak (a cold_archive csak lezárt hónapot visz ki), így ide nem kell a hideg tár
+    last_day = min(end, local_today())
+    if start > last_day:
+        return {}
+    watermarks = {
+        r["plant_id"]: r["finalized_through"]
+        for r in await conn.fetch("""
+            SELECT plant_id, finalized_through FROM plant_yield_watermarks WHERE plant_id = ANY($1::int[])
+        """, list(plant_ids))
+    }
+    since = {}
+    for plant_id in plant_ids:
+        watermark = watermarks.get(plant_id)
+        first_day = max(start, watermark + timedelta(days=1)) if watermark else start
+        if first_day <= last_day:
+            since[plant_id] = local_day_start_utc(first_day)
+    if not since:
+        return {}
+    rows = await conn.fetch(LIVE_DAYS_QUERY, list(since), list(since.values()), local_day_start_utc(last_day + timedelta(days=1)))
+    result = {}
+    for r in rows:
+        if r["max_yield"] is not None:
+            result.setdefault(r["plant_id"], {})[r["day"]] = float(r["max_yield"])
+    return result
+
+
+async def yield_series(conn, plant_ids, start: date, end: date, granularity: str = "day"):
+    # {plant_id: [(nap vagy hónap, hozam), ...]} – lezárt adat a rollupból, a nyitott napok élőben
+    if granularity == "month":
+        rows = await conn.fetch("""
+            SELECT plant_id, month AS period, yield
+            FROM plant_monthly_yield
+            WHERE plant_id = ANY($1::int[])
+              AND month BETWEEN date_trunc('month', $2::date)::date AND $3
+            ORDER BY plant_id, month
+        """, list(plant_ids), start, end)
+    else:
+        rows = await conn.fetch("""
+            SELECT plant_id, day AS period, yield
+            FROM plant_daily_yield
+            WHERE plant_id = ANY($1::int[]) AND day BETWEEN $2 AND $3
+            ORDER BY plant_id, day
+        """, list(plant_ids), start, end)
+
+    series = {pid: {} for pid in plant_ids}
+    for r in rows:
+        series[r["plant_id"]][r["period"]] = float(r["yield"]) if r["yield"] is not None else 0
+
+    for plant_id, days in (await live_days(conn, plant_ids, start, end)).items():
+        for day, value in days.items():
+            if granularity == "month":
+                period = day.replace(day=1)
+                series[plant_id][period] = series[plant_id].get(period, 0) + value
+            else:
+                series[plant_id][day] = value
+
+    return {pid: sorted(values.items()) for pid, values in series.items()}